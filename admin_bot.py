@@ -1,5 +1,6 @@
 import os
 import json
+import asyncio
 import logging
 from typing import Dict, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -13,6 +14,11 @@ from telegram.ext import (
 )
 from telegram.constants import ParseMode
 
+from config import DUPLICATE_THRESHOLD
+from content_manager import SECTIONS
+from delivery import MESSAGE_LIMIT, split_text
+from duplicates import DuplicateIndex
+
 # تنظیمات لاگینگ
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -34,6 +40,8 @@ class AdminBot:
         self.current_section = {}
         self.current_action = {}
         self.temp_content = {}
+        # ایندکس محتوای تکراری هر بخش؛ در اولین استفاده ساخته و با هر تغییر به‌روز می‌شود
+        self.duplicate_indexes: Dict[str, DuplicateIndex] = {}
         self._setup_handlers()
 
     def _setup_handlers(self):
@@ -42,6 +50,7 @@ class AdminBot:
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("help", self.help_command))
         self.application.add_handler(CommandHandler("done", self.done_command))
+        self.application.add_handler(CommandHandler("duplicates", self.duplicates_command))
         
         # هندلرهای بخش‌های مختلف
         self.application.add_handler(CallbackQueryHandler(self.handle_section_selection, pattern="^section_"))
@@ -143,6 +152,9 @@ class AdminBot:
 4️⃣ مشاهده محتوا:
 - بخش مورد نظر را انتخاب کنید
 - گزینه "مشاهده محتوا" را بزنید
+
+5️⃣ بررسی محتوای تکراری:
+- دستور /duplicates گروه‌های محتوای تکراری همه بخش‌ها را نشان می‌دهد
 """
         await update.message.reply_text(help_text)
 
@@ -214,6 +226,7 @@ class AdminBot:
         if action == "add":
             self.temp_content[user_id] = {"text": text}
             await update.message.reply_text(
+                await self.duplicate_warning(section, text) +
                 "متن ذخیره شد. اگر می‌خواهید فایل رسانه‌ای اضافه کنید، آن را ارسال کنید.\n"
                 "در غیر این صورت /done را بزنید."
             )
@@ -232,6 +245,8 @@ class AdminBot:
                     content_id = self.temp_content[user_id]["id"]
                     new_content = {"text": text}
                     if await self.edit_content(section, content_id, new_content):
+                        if section in self.duplicate_indexes:
+                            self.duplicate_indexes[section].add(str(content_id), text)
                         await update.message.reply_text(
                             "محتوا با موفقیت ویرایش شد. اگر می‌خواهید فایل رسانه‌ای را هم تغییر دهید، آن را ارسال کنید.\n"
                             "در غیر این صورت /done را بزنید."
@@ -247,6 +262,8 @@ class AdminBot:
             try:
                 content_id = int(text)
                 if await self.delete_content(section, content_id):
+                    if section in self.duplicate_indexes:
+                        self.duplicate_indexes[section].remove(str(content_id))
                     await update.message.reply_text(
                         "محتوا با موفقیت حذف شد.",
                         reply_markup=self.get_main_menu_keyboard()
@@ -393,12 +410,66 @@ class AdminBot:
             with open(filepath, "w", encoding="utf-8") as f:
                 json.dump(current_content, f, ensure_ascii=False, indent=4)
                 
+            if section in self.duplicate_indexes:
+                self.duplicate_indexes[section].add(content["id"], content["text"])
             return True
             
         except Exception as e:
             logger.error(f"Error saving content: {e}")
             return False
 
+    @staticmethod
+    def _build_duplicate_index(section: str) -> DuplicateIndex:
+        """Hash every item of a section; reads and hashes the whole section, so run it in a thread"""
+        index = DuplicateIndex(DUPLICATE_THRESHOLD)
+        # The bot shows the default items merged with the ones added through its admin panel
+        for filepath in (f"content/{section}.json", f"content/{section}_admin.json"):
+            if os.path.exists(filepath):
+                with open(filepath, "r", encoding="utf-8") as f:
+                    for item in json.load(f):
+                        index.add(str(item["id"]), item["text"])
+        return index
+
+    async def get_duplicate_index(self, section: str) -> DuplicateIndex:
+        """Near-duplicate index of the items of a section, built off the event loop on first use"""
+        index = self.duplicate_indexes.get(section)
+        if index is None:
+            index = await asyncio.to_thread(self._build_duplicate_index, section)
+            # Registered only once complete, so the edits kept in step below never race the build
+            index = self.duplicate_indexes.setdefault(section, index)
+        return index
+
+    async def duplicate_warning(self, section: str, text: str) -> str:
+        """Warning naming the closest existing items, or an empty string when the text is new"""
+        try:
+            matches = (await self.get_duplicate_index(section)).query(text)
+        except Exception as e:
+            logger.error(f"Error checking duplicates: {e}")
+            return ""
+        if not matches:
+            return ""
+        closest = "، ".join(f"{content_id} ({similarity:.0%})" for content_id, similarity in matches)
+        return f"⚠️ محتوای مشابه در این بخش وجود دارد. شناسه‌ها: {closest}\n\n"
+
+    async def duplicates_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /duplicates command: report clusters of near-duplicate items in every section"""
+        user_id = update.effective_user.id
+        if not await self.is_admin(user_id):
+            return
+
+        lines = []
+        for section in SECTIONS:
+            clusters = (await self.get_duplicate_index(section)).clusters()
+            if clusters:
+                lines.append(f"\n{section}: {len(clusters)} گروه")
+                lines.extend(f"- {', '.join(cluster)}" for cluster in clusters)
+        if not lines:
+            await update.message.reply_text("✅ محتوای تکراری پیدا نشد.")
+            return
+        lines.insert(0, "📋 گروه‌های محتوای تکراری (شناسه‌ها):")
+        for part in split_text("\n".join(lines), MESSAGE_LIMIT, MESSAGE_LIMIT):
+            await update.message.reply_text(part)
+
     async def done_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /done command"""
         user_id = update.effective_user.id
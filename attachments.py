@@ -0,0 +1,94 @@
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, List, MutableMapping, Optional, Tuple
+
+from telegram import Message
+
+from delivery import media_kind
+from menu_config import ATTACHMENTS
+from transitions import media_attachment
+
+logger = logging.getLogger(__name__)
+
+# Telegram albums hold 2-10 items; photos and videos can share one, documents only go with documents
+ALBUM_LIMIT = 10
+ALBUM_GROUPS = {"photo": "visual", "video": "visual", "document": "document"}
+
+
+@dataclass(frozen=True)
+class Attachment:
+    """A file sent with an item, declared by a key of its additional_info"""
+    kind: str
+    path: str
+    caption: str
+
+
+Album = Tuple[Attachment, ...]
+
+
+def plan_albums(additional_info: Optional[Dict], attachments: Dict[str, Tuple[str, str]] = ATTACHMENTS) -> Tuple[Album, ...]:
+    """Group the attachments an item declares into the fewest albums Telegram accepts"""
+    if not additional_info:
+        return ()
+    groups: Dict[str, List[Attachment]] = {}
+    for key, (kind, caption) in attachments.items():
+        path = additional_info.get(key)
+        if not isinstance(path, str) or not path:
+            continue
+        # Missing local files are left out here rather than failing the whole album later
+        if media_kind(path, kind) != kind or kind not in ALBUM_GROUPS:
+            continue
+        groups.setdefault(ALBUM_GROUPS[kind], []).append(Attachment(kind, path, caption))
+    return tuple(
+        tuple(group[start:start + ALBUM_LIMIT])
+        for group in groups.values()
+        for start in range(0, len(group), ALBUM_LIMIT)
+    )
+
+
+class FileIdCache:
+    """file_id of every file the bot has uploaded, so each local file is uploaded once.
+
+    Telegram keeps uploaded files, and sending a file_id costs no upload. The IDs live in
+    a state store namespace, so every worker reuses the uploads of the others.
+    """
+
+    def __init__(self, file_ids: MutableMapping):
+        self.file_ids = file_ids
+        # file_ids never change, so lookups are served locally after the first one
+        self._local: Dict[str, str] = {}
+        # Values that already are file_ids and need no lookup
+        self._file_ids_as_is = set()
+
+    def _cacheable(self, path: str) -> bool:
+        """True for local files and URLs; anything else is already a file_id"""
+        if path in self._file_ids_as_is:
+            return False
+        if path.startswith(("http://", "https://")) or os.path.isfile(path):
+            return True
+        self._file_ids_as_is.add(path)
+        return False
+
+    def resolve(self, path: str) -> str:
+        """What to send for `path`: its file_id once it was uploaded, else the path itself"""
+        file_id = self._local.get(path)
+        if file_id is None:
+            if not self._cacheable(path):
+                return path
+            file_id = self.file_ids.get(path)
+            if file_id is None:
+                return path
+            self._local[path] = file_id
+        return file_id
+
+    def learn(self, path: Optional[str], message) -> None:
+        """Remember the file_id Telegram gave the file sent from `path` in `message`"""
+        if not path or path in self._local or not self._cacheable(path):
+            return
+        attachment = media_attachment(message) if isinstance(message, Message) else None
+        if attachment is None:
+            return
+        self._local[path] = attachment.file_id
+        self.file_ids[path] = attachment.file_id
+        logger.debug("Cached file_id for %s", path)
@@ -0,0 +1,276 @@
+"""In-process stand-in for the Telegram Bot API used by the benchmarks.
+
+Only the methods the bot needs are implemented. Every call is counted, in total
+and per chat, so a benchmark can tell when the bot has finished reacting to its
+updates and what each reaction cost, and the last message sent to each chat is kept so a load generator can click the
+buttons the bot actually showed. The WordPress license endpoint is served too,
+so activation can be benchmarked with WORDPRESS_BASE_URL pointing here.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+BOT_USER = {"id": 100000, "is_bot": True, "first_name": "Millionisho", "username": "millionisho_bench_bot"}
+
+# License keys starting with this prefix are reported valid by the fake WordPress endpoint
+VALID_LICENSE_PREFIX = "VALID"
+
+# Methods answered without simulated latency: they are not part of handling an update
+BACKGROUND_METHODS = {"getUpdates", "getMe", "setWebhook", "deleteWebhook"}
+
+
+def make_user(user_id: int) -> Dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def make_message(message_id: int, chat_id: int, text: str = "...") -> Dict:
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": BOT_USER,
+        "text": text,
+    }
+
+
+def make_callback_update(update_id: int, user_id: int, data: str, message_id: int = 1, message: Optional[Dict] = None) -> Dict:
+    """Build a callback query update as Telegram would deliver it"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": make_user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": message or make_message(message_id, user_id),
+        },
+    }
+
+
+def make_text_update(update_id: int, user_id: int, text: str, reply_to: Optional[Dict] = None) -> Dict:
+    """Build a text message update; commands get their bot_command entity"""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": make_user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if reply_to is not None:
+        message["reply_to_message"] = reply_to
+    return {"update_id": update_id, "message": message}
+
+
+def _file(kind: str, file_id: str) -> Dict:
+    file = {"file_id": str(file_id), "file_unique_id": f"u{abs(hash(str(file_id)))}"}
+    if kind in ("photo", "video"):
+        file.update(width=1280, height=720)
+    if kind == "video":
+        file["duration"] = 10
+    return file
+
+
+class FakeBotAPI:
+    """Minimal Bot API HTTP server bound to a local port"""
+
+    def __init__(self, token: str = "123456:BENCHMARK", host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.token = token
+        self.host = host
+        self.port = port
+        # Simulated round trip to Telegram, applied to every method except getUpdates
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.chat_calls: Dict[int, Counter] = defaultdict(Counter)
+        self._callback_chats: Dict[str, int] = {}
+        self.last_messages: Dict[int, Dict] = {}
+        self._pending: List[Dict] = []
+        self._new_updates = asyncio.Event()
+        self._message_ids = itertools.count(1000)
+        self._file_ids = itertools.count(1)
+        self._answer_waiters: Dict[str, asyncio.Future] = {}
+        self._reply_waiters: Dict[int, asyncio.Future] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        """Value for TELEGRAM_API_URL and WORDPRESS_BASE_URL"""
+        return f"http://{self.host}:{self.port}"
+
+    def push_updates(self, updates: List[Dict]) -> None:
+        """Queue updates to be returned by getUpdates"""
+        self._pending.extend(updates)
+        self._new_updates.set()
+
+    async def wait_for(self, method: str, count: int, timeout: float = 60.0) -> None:
+        """Wait until `method` has been called at least `count` times"""
+        deadline = time.perf_counter() + timeout
+        while self.calls[method] < count:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"{method} called {self.calls[method]}/{count} times")
+            await asyncio.sleep(0.005)
+
+    def expect_answer(self, callback_query_id: str, chat_id: Optional[int] = None) -> asyncio.Future:
+        """Future resolved when the callback query is answered; the answer counts towards `chat_id`"""
+        future = asyncio.get_running_loop().create_future()
+        self._answer_waiters[str(callback_query_id)] = future
+        if chat_id is not None:
+            self._callback_chats[str(callback_query_id)] = int(chat_id)
+        return future
+
+    def chat_call_count(self, chat_id: int) -> int:
+        """Bot API calls made so far on behalf of a chat"""
+        return sum(self.chat_calls[int(chat_id)].values())
+
+    def expect_reply(self, chat_id: int) -> asyncio.Future:
+        """Future resolved by the next message sent or edited in the chat"""
+        future = asyncio.get_running_loop().create_future()
+        self._reply_waiters[int(chat_id)] = future
+        return future
+
+    def _resolve(self, waiters: Dict, key, value) -> None:
+        future = waiters.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(value)
+
+    async def _params(self, request: web.Request) -> Dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            if isinstance(value, str):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            params[key] = value
+        return params
+
+    async def _get_updates(self, params: Dict):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        self._pending = [u for u in self._pending if u["update_id"] >= offset]
+        if not self._pending and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._pending[:limit]
+
+    def _media(self, kind: str, value) -> Dict:
+        """Attachment field for a sent file: string file_ids are echoed, uploads get a new id"""
+        file_id = value if isinstance(value, str) and not value.startswith("attach://") else f"F{next(self._file_ids)}"
+        if kind == "photo":
+            return {"photo": [_file("photo", file_id)]}
+        return {kind: _file(kind, file_id)}
+
+    def _message(self, method: str, params: Dict) -> Dict:
+        chat_id = int(params.get("chat_id", 0))
+        if method.startswith("edit"):
+            message = dict(self.last_messages.get(chat_id) or make_message(int(params.get("message_id", 1)), chat_id))
+            message["message_id"] = int(params.get("message_id", message["message_id"]))
+        else:
+            message = make_message(next(self._message_ids), chat_id)
+
+        if method in ("sendMessage", "editMessageText"):
+            for field in ("photo", "video", "document", "caption"):
+                message.pop(field, None)
+            message["text"] = params.get("text", "")
+        elif method == "editMessageMedia":
+            media = params.get("media") or {}
+            message.pop("text", None)
+            message.update(self._media(media.get("type", "photo"), media.get("media")))
+            message["caption"] = media.get("caption", "")
+        elif method in ("sendPhoto", "sendVideo", "sendDocument"):
+            kind = method[4:].lower()
+            message.pop("text", None)
+            message.update(self._media(kind, params.get(kind)))
+            message["caption"] = params.get("caption", "")
+        elif method == "editMessageCaption":
+            message["caption"] = params.get("caption", "")
+
+        # Telegram only echoes inline keyboards; a ForceReply is not part of the message
+        markup = params.get("reply_markup")
+        if isinstance(markup, dict) and "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+        else:
+            message.pop("reply_markup", None)
+        self.last_messages[chat_id] = message
+        return message
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._params(request)
+        if self.latency and method not in BACKGROUND_METHODS:
+            await asyncio.sleep(self.latency)
+        self.calls[method] += 1
+        if method == "answerCallbackQuery":
+            chat_id = self._callback_chats.pop(str(params.get("callback_query_id")), None)
+        else:
+            chat_id = params.get("chat_id")
+        if chat_id is not None:
+            self.chat_calls[int(chat_id)][method] += 1
+
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "getUpdates":
+            result = await self._get_updates(params)
+        elif method in ("setWebhook", "deleteWebhook"):
+            result = True
+        elif method == "answerCallbackQuery":
+            result = True
+            self._resolve(self._answer_waiters, str(params.get("callback_query_id")), params)
+        elif method in (
+            "sendMessage", "editMessageText", "editMessageMedia", "editMessageCaption",
+            "sendPhoto", "sendVideo", "sendDocument",
+        ):
+            result = self._message(method, params)
+            self._resolve(self._reply_waiters, result["chat"]["id"], result)
+        elif method == "sendMediaGroup":
+            # Albums carry no keyboard, so they never become the chat's last message
+            result = []
+            for media in params.get("media") or []:
+                message = make_message(next(self._message_ids), int(chat_id))
+                message.pop("text")
+                message.update(self._media(media.get("type", "photo"), media.get("media")))
+                message["caption"] = media.get("caption", "")
+                result.append(message)
+        elif method == "deleteMessage":
+            result = True
+            last = self.last_messages.get(int(chat_id))
+            if last is not None and last["message_id"] == int(params.get("message_id", 0)):
+                del self.last_messages[int(chat_id)]
+        else:
+            return web.json_response({"ok": False, "error_code": 404, "description": "Not Found"}, status=404)
+
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_license(self, request: web.Request) -> web.Response:
+        """Stand-in for the WordPress licensing endpoint"""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls["licenseVerify"] += 1
+        valid = request.query.get("key", "").startswith(VALID_LICENSE_PREFIX)
+        return web.json_response({"status": "valid" if valid else "invalid"})
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_route("*", f"/bot{self.token}/{{method}}", self.handle)
+        app.router.add_get("/wp-json/licensing/v1/verify", self.handle_license)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
@@ -0,0 +1,317 @@
+"""End-to-end load test of MillionishoBot against the fake Bot API.
+
+Usage: python benchmarks/load_test.py [--users 50] [--sessions 4] [--latency 0.02]
+       [--mode webhook|polling] [--items 60] [--baseline benchmarks/baseline.json]
+       [--save-baseline] [--fail-on-regression]
+
+Virtual users run sessions drawn from a fixed mix and click the buttons the bot
+actually sent them:
+  browse      main menu -> a content section -> "next" x N
+  favorites   main menu -> favorites
+  activation  /activate -> reply with a license key, checked by the fake WordPress endpoint
+An update counts as handled when the bot has shown its reply: for button clicks
+the callback query must also be answered (or answered with an alert). The run
+reports throughput, p50/p99 update latency, Bot API calls per update and per
+navigation (a click that shows a content item, counting every call it caused),
+and compares them with a stored baseline.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from aiohttp import ClientSession  # noqa: E402
+
+from benchmarks.fake_bot_api import (  # noqa: E402
+    BACKGROUND_METHODS,
+    VALID_LICENSE_PREFIX,
+    FakeBotAPI,
+    make_callback_update,
+    make_message,
+    make_text_update,
+)
+from benchmarks.synthetic import write_content_dir  # noqa: E402
+from menu_config import NAVIGATION_BUTTONS  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+SCENARIO_WEIGHTS = {"browse": 70, "favorites": 15, "activation": 15}
+BROWSE_SECTIONS = ["text_template", "image_template", "reels_idea", "call_to_action", "caption", "bio"]
+
+# Compared with the baseline: (key, True when higher is better)
+COMPARED = [
+    ("throughput", True),
+    ("p50_ms", False),
+    ("p99_ms", False),
+    ("api_calls_per_update", False),
+    ("api_calls_per_navigation", False),
+]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class VirtualUser:
+    """One simulated user clicking through the bot"""
+
+    def __init__(self, api: FakeBotAPI, send: Callable, user_id: int, update_ids, rng: random.Random, timeout: float):
+        self.api = api
+        self.send = send
+        self.user_id = user_id
+        self.update_ids = update_ids
+        self.rng = rng
+        self.timeout = timeout
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.navigation_calls: List[int] = []
+        self._navigation_started: Optional[int] = None
+
+    def settle_navigation(self) -> None:
+        """Count the calls of the last navigation; a deleted message may follow its reply"""
+        if self._navigation_started is not None:
+            self.navigation_calls.append(self.api.chat_call_count(self.user_id) - self._navigation_started)
+            self._navigation_started = None
+
+    async def _deliver(self, update: Dict, done) -> None:
+        started = time.perf_counter()
+        await self.send(update)
+        try:
+            await asyncio.wait_for(done, self.timeout)
+            self.latencies.append(time.perf_counter() - started)
+        except asyncio.TimeoutError:
+            self.errors += 1
+
+    async def _answered_and_shown(self, answered: asyncio.Future, shown: asyncio.Future) -> None:
+        answer = await answered
+        if not answer.get("show_alert"):
+            await shown
+
+    async def click(self, data: str, navigation: bool = False) -> None:
+        self.settle_navigation()
+        if navigation:
+            self._navigation_started = self.api.chat_call_count(self.user_id)
+        update_id = next(self.update_ids)
+        message = self.api.last_messages.get(self.user_id) or make_message(1, self.user_id)
+        answered = self.api.expect_answer(str(update_id), self.user_id)
+        shown = self.api.expect_reply(self.user_id)
+        update = make_callback_update(update_id, self.user_id, data, message=message)
+        await self._deliver(update, self._answered_and_shown(answered, shown))
+
+    async def say(self, text: str, reply_to: Optional[Dict] = None) -> None:
+        self.settle_navigation()
+        done = self.api.expect_reply(self.user_id)
+        await self._deliver(make_text_update(next(self.update_ids), self.user_id, text, reply_to), done)
+
+    def button(self, label: str) -> Optional[str]:
+        """callback_data of the button labelled `label` in the last message, if shown"""
+        markup = (self.api.last_messages.get(self.user_id) or {}).get("reply_markup") or {}
+        for row in markup.get("inline_keyboard", []):
+            for button in row:
+                if button.get("text") == label and "callback_data" in button:
+                    return button["callback_data"]
+        return None
+
+    async def browse(self, max_next: int) -> None:
+        await self.click("main_menu")
+        await self.click(self.rng.choice(BROWSE_SECTIONS), navigation=True)
+        for _ in range(self.rng.randint(1, max_next)):
+            data = self.button(NAVIGATION_BUTTONS["next"])
+            if not data:
+                break
+            await self.click(data, navigation=True)
+
+    async def favorites(self) -> None:
+        await self.click("main_menu")
+        await self.click("favorites")
+
+    async def activation(self) -> None:
+        await self.say("/activate")
+        prompt = self.api.last_messages.get(self.user_id)
+        key = VALID_LICENSE_PREFIX if self.rng.random() < 0.5 else "WRONG"
+        await self.say(f"{key}-{self.rng.randrange(10 ** 8)}", reply_to=prompt)
+
+    async def run(self, sessions: int, max_next: int, scenarios: Counter) -> None:
+        names = list(SCENARIO_WEIGHTS)
+        weights = list(SCENARIO_WEIGHTS.values())
+        for _ in range(sessions):
+            scenario = self.rng.choices(names, weights)[0]
+            scenarios[scenario] += 1
+            if scenario == "browse":
+                await self.browse(max_next)
+            elif scenario == "favorites":
+                await self.favorites()
+            else:
+                await self.activation()
+
+
+async def run_load(bot, api: FakeBotAPI, args) -> Dict:
+    from webhook_server import SECRET_HEADER, WebhookServer
+
+    app = bot.application
+    server = WebhookServer(app, listen="127.0.0.1", port=0)
+    update_ids = itertools.count(1)
+    scenarios: Counter = Counter()
+
+    async with app, ClientSession() as session:
+        await app.start()
+        if args.mode == "webhook":
+            await server.start()
+            url = f"http://127.0.0.1:{server.port}{server.path}"
+            headers = {SECRET_HEADER: server.secret_token}
+
+            async def send(update: Dict) -> None:
+                async with session.post(url, json=update, headers=headers) as response:
+                    response.raise_for_status()
+        else:
+            await app.updater.start_polling(poll_interval=0, timeout=1)
+
+            async def send(update: Dict) -> None:
+                api.push_updates([update])
+
+        users = [
+            VirtualUser(api, send, 10_000 + i, update_ids, random.Random(args.seed * 1_000_003 + i), args.timeout)
+            for i in range(args.users)
+        ]
+        calls_before = sum(count for method, count in api.calls.items() if method not in BACKGROUND_METHODS)
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(user.run(args.sessions, args.max_next, scenarios) for user in users))
+        finally:
+            elapsed = time.perf_counter() - started
+            # Let calls that follow a user's last reply (deleting the old message) land
+            await asyncio.sleep(args.latency * 3)
+            for user in users:
+                user.settle_navigation()
+            if args.mode == "webhook":
+                await server.stop()
+            else:
+                await app.updater.stop()
+            await app.stop()
+        calls = sum(count for method, count in api.calls.items() if method not in BACKGROUND_METHODS) - calls_before
+
+    latencies = [latency for user in users for latency in user.latencies]
+    updates = len(latencies)
+    navigation_calls = [calls for user in users for calls in user.navigation_calls]
+    return {
+        "config": {
+            "mode": args.mode,
+            "users": args.users,
+            "sessions": args.sessions,
+            "max_next": args.max_next,
+            "latency": args.latency,
+            "items": args.items,
+            "seed": args.seed,
+        },
+        "updates": updates,
+        "timeouts": sum(user.errors for user in users),
+        "scenarios": dict(scenarios),
+        "elapsed": round(elapsed, 3),
+        "throughput": round(updates / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 2),
+        "api_calls_per_update": round(calls / updates, 3) if updates else 0.0,
+        "navigations": len(navigation_calls),
+        "api_calls_per_navigation": round(sum(navigation_calls) / len(navigation_calls), 3) if navigation_calls else 0.0,
+        "api_methods": {method: count for method, count in sorted(api.calls.items()) if method not in BACKGROUND_METHODS},
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Print both runs side by side; return the metrics that regressed beyond `tolerance`"""
+    if baseline.get("config") != results["config"]:
+        print("warning: baseline was recorded with a different configuration")
+    regressions = []
+    print(f"{'metric':24s} {'baseline':>10s} {'current':>10s} {'change':>8s}")
+    for key, higher_is_better in COMPARED:
+        old, new = baseline.get(key), results[key]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        print(f"{key:24s} {old:10.2f} {new:10.2f} {change:+8.1%}{flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+
+def prepare_environment(api: FakeBotAPI, content_dir: str) -> None:
+    """Point the bot at the fake API and `content_dir`; call before importing bot"""
+    log_dir = tempfile.mkdtemp(prefix="millionisho-logs-")
+    os.environ.update({
+        "TELEGRAM_TOKEN": api.token,
+        "TELEGRAM_API_URL": api.base_url,
+        "WORDPRESS_BASE_URL": api.base_url,
+        "CONTENT_DIR": content_dir,
+        "LOG_CONSOLE": "false",
+        "LOG_FILE": os.path.join(log_dir, "bot.log"),
+        "BROADCAST_STATE_FILE": os.path.join(log_dir, "broadcast_state.json"),
+        "TRAFFIC_RECORD_FILE": "",
+    })
+    # Measure the bot itself, not the flood control pacing
+    os.environ.setdefault("RATE_LIMIT_GLOBAL", "1000000")
+    os.environ.setdefault("RATE_LIMIT_PER_CHAT", "1000000")
+    os.environ.setdefault("RATE_LIMIT_CHAT_BURST", "1000000")
+
+
+async def main(args) -> int:
+    api = FakeBotAPI(latency=args.latency)
+    await api.start()
+    content_dir = write_content_dir(tempfile.mkdtemp(prefix="millionisho-load-"), args.items, media_every=5)
+    prepare_environment(api, content_dir)
+
+    from bot import MillionishoBot
+    logging.disable(logging.WARNING)
+
+    results = await run_load(MillionishoBot(), api, args)
+    await api.stop()
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--sessions", type=int, default=4, help="sessions per user")
+    parser.add_argument("--max-next", type=int, default=8, help="most 'next' clicks per browse session")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per Bot API call")
+    parser.add_argument("--mode", choices=["webhook", "polling"], default="webhook")
+    parser.add_argument("--items", type=int, default=60, help="synthetic items per section")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for one update")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,301 @@
+"""Microbenchmarks for the ContentManager and UserManager hot paths.
+
+Usage: python benchmarks/microbench.py [--users 1000000] [--filter get_content]
+       [--output results.json] [--budgets benchmarks/budgets.json]
+       [--save-budgets] [--headroom 3.0]
+
+Every case reports the best per-operation time over several timeit repeats, which
+is the least noisy figure on a shared machine. Content is generated with
+benchmarks/synthetic.py into temporary directories, so runs are reproducible.
+
+Each case has a budget in benchmarks/budgets.json (nanoseconds per operation);
+the run exits with status 1 when any case is over budget. --save-budgets records
+the current timings times --headroom as the new budgets.
+"""
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+from typing import Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+# bot.py needs a token to build its Application; nothing here talks to Telegram
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:MICROBENCH")
+os.environ.setdefault("LOG_CONSOLE", "false")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "millionisho-microbench.log"))
+
+from benchmarks.synthetic import make_items, write_content_dir  # noqa: E402
+
+DEFAULT_BUDGETS = os.path.join(ROOT, "benchmarks", "budgets.json")
+
+SECTION = "text_template"
+SECTION_SIZES = (100, 10_000, 100_000)
+COLD_START_SIZES = (1_000, 10_000, 100_000)
+# Items per idea section; the combination space is the fourth power
+IDEA_SECTION_SIZES = (3, 60)
+# Builds need NumPy and SciPy (requirements.txt) to stay within budget: the pure Python fallback compares
+# every pair of items sharing a word, and synthetic items share most words. Duplicate checks use the same
+# sizes because indexing hashes every item
+SIMILARITY_SIZES = (100, 1_000, 10_000)
+REPEAT = 5
+USER_CASES = ("init_user_new", "init_user_existing", "get_user", "accessor_chain", "set_current_index", "is_admin")
+
+
+def measure(func: Callable[[], object], repeat: int = REPEAT, number: Optional[int] = None) -> Dict:
+    """Best and median nanoseconds per call of `func`"""
+    timer = timeit.Timer(func)
+    if number is None:
+        number, _ = timer.autorange()
+    times = sorted(t / number * 1e9 for t in timer.repeat(repeat, number))
+    return {"ns_per_op": round(times[0], 1), "median_ns": round(times[len(times) // 2], 1), "ops": number}
+
+
+class Suite:
+    """Builds fixtures once and runs the selected cases"""
+
+    def __init__(self, users: int, name_filter: Optional[str] = None):
+        self.users = users
+        self.name_filter = name_filter
+        self.tmp = tempfile.mkdtemp(prefix="millionisho-microbench-")
+        self.results: Dict[str, Dict] = {}
+
+    def selected(self, name: str) -> bool:
+        return not self.name_filter or self.name_filter in name
+
+    def record(self, name: str, func: Callable[[], object], **kwargs) -> None:
+        if not self.selected(name):
+            return
+        self.results[name] = result = measure(func, **kwargs)
+        print(f"{name:40s} {result['ns_per_op']:14,.1f} ns/op", flush=True)
+
+    def content_dir(self, items: int, sections: Tuple[str, ...] = (SECTION,)) -> str:
+        return write_content_dir(os.path.join(self.tmp, f"content-{items}-{len(sections)}"), items, sections, media_every=5)
+
+    def bench_content(self) -> None:
+        from content_manager import ContentManager
+
+        for size in SECTION_SIZES:
+            manager = ContentManager(self.content_dir(size))
+            middle = size // 2
+            content_id = manager.get_content(SECTION, middle).id
+            self.record(f"get_content[{size}]", lambda: manager.get_content(SECTION, middle))
+            self.record(f"get_content_by_id[{size}]", lambda: manager.get_content_by_id(SECTION, content_id))
+            self.record(f"get_index_by_id[{size}]", lambda: manager.get_index_by_id(SECTION, content_id))
+
+        # Every add rewrites the admin file, so the cost grows with the admin items already there
+        for admin_items in (10, 1_000):
+            name = f"add_content[{admin_items} admin]"
+            if not self.selected(name):
+                continue
+            directory = self.content_dir(1_000)
+            manager = ContentManager(directory)
+            for _ in range(admin_items):
+                manager.add_content(SECTION, {"text": "admin item"})
+            item = make_items(SECTION, 1)[0]
+            self.record(name, lambda: manager.add_content(SECTION, item), number=20)
+            self.record(f"save_admin_content[{admin_items} admin]", lambda: manager.save_admin_content(SECTION), number=20)
+
+        for size in COLD_START_SIZES:
+            name = f"load_content[{size}]"
+            if not self.selected(name):
+                continue
+            # Spread over every section, as in production
+            from content_manager import SECTIONS
+            directory = self.content_dir(size // len(SECTIONS), tuple(SECTIONS))
+            self.record(name, lambda: ContentManager(directory), repeat=3, number=1)
+
+        from ideas import IDEA_SECTIONS, IdeaGenerator
+
+        for size in IDEA_SECTION_SIZES:
+            name = f"next_idea[{size ** len(IDEA_SECTIONS)}]"
+            if not self.selected(name):
+                continue
+            generator = IdeaGenerator(ContentManager(self.content_dir(size, IDEA_SECTIONS)))
+            walk = generator.next_idea(None)[1]
+            # Same step every time: the cost must not depend on the position or the space
+            self.record(name, lambda: generator.next_idea(walk))
+
+        from popularity import PopularityTracker
+
+        for size in SECTION_SIZES:
+            if not (self.selected(f"record_view[{size}]") or self.selected(f"trending[{size}]")):
+                continue
+            tracker = PopularityTracker(ContentManager(self.content_dir(size)), half_life=3600)
+            # Views spread over the section, so most recorded items are outside the top-K
+            views = itertools.cycle(range(0, size, 7))
+            for _ in range(size):
+                tracker.record_view(SECTION, next(views))
+            # Must not grow with the section: one counter update and at most one heap step
+            self.record(f"record_view[{size}]", lambda: tracker.record_view(SECTION, next(views)))
+            self.record(f"trending[{size}]", lambda: tracker.trending(SECTION))
+
+        for size in SIMILARITY_SIZES:
+            if not (self.selected(f"build_similarity[{size}]") or self.selected(f"get_similar[{size}]")):
+                continue
+            manager = ContentManager(self.content_dir(size))
+            self.record(f"build_similarity[{size}]", lambda: manager.build_similarity(SECTION), repeat=3, number=1)
+            manager.build_similarity(SECTION)
+            middle = size // 2
+            self.record(f"get_similar[{size}]", lambda: manager.get_similar(SECTION, middle))
+
+        from duplicates import ContentDuplicates
+
+        for size in SIMILARITY_SIZES:
+            name = f"check_duplicate[{size}]"
+            if not self.selected(name):
+                continue
+            manager = ContentManager(self.content_dir(size))
+            duplicates = ContentDuplicates(manager, threshold=0.7)
+            text = manager.get_content(SECTION, size // 2).text + " تازه"
+            duplicates.check(SECTION, text)
+            # Compares only the items sharing an LSH band with the text, whatever the section size
+            self.record(name, lambda: duplicates.check(SECTION, text))
+
+    def bench_users(self) -> None:
+        from state_store import MemoryStateStore
+        from user_manager import UserManager
+
+        names = [f"{case}[{self.users}]" for case in USER_CASES]
+        if not any(self.selected(name) for name in names):
+            return
+        manager = UserManager(MemoryStateStore())
+        # Filling the store is the init_user_new case
+        ids = [str(i) for i in range(self.users)]
+        started = timeit.default_timer()
+        for user_id in ids:
+            manager.init_user(user_id)
+        ns = (timeit.default_timer() - started) / self.users * 1e9
+        del ids
+        name = f"init_user_new[{self.users}]"
+        if self.selected(name):
+            self.results[name] = {"ns_per_op": round(ns, 1), "median_ns": round(ns, 1), "ops": self.users}
+            print(f"{name:40s} {ns:14,.1f} ns/op", flush=True)
+
+        user_id = str(self.users // 2)
+        manager.set_vip(user_id, False)
+        manager.add_to_favorites(user_id, "42")
+
+        def accessor_chain():
+            # What send_content reads for one navigation click
+            manager.is_vip(user_id)
+            manager.get_current_section(user_id)
+            manager.get_current_index(user_id, SECTION)
+            return user_id in manager.get_favorites(user_id)
+
+        self.record(f"init_user_existing[{self.users}]", lambda: manager.init_user(user_id))
+        self.record(f"get_user[{self.users}]", lambda: manager.get_user(user_id))
+        self.record(f"accessor_chain[{self.users}]", accessor_chain)
+        self.record(f"set_current_index[{self.users}]", lambda: manager.set_current_index(user_id, SECTION, 7))
+        self.record(f"is_admin[{self.users}]", lambda: manager.is_admin(user_id))
+
+    def bench_check_access(self) -> None:
+        if not self.selected("check_access"):
+            return
+        from telegram import Update
+
+        from benchmarks.fake_bot_api import make_callback_update
+        from bot import MillionishoBot
+        from menu_config import FREE_LIMITS
+        from user_manager import user_manager
+
+        bot = MillionishoBot()
+        free_section = next(iter(FREE_LIMITS), SECTION)
+        vip = Update.de_json(make_callback_update(1, 501, "main_menu"), bot.application.bot)
+        free = Update.de_json(make_callback_update(2, 502, "main_menu"), bot.application.bot)
+        user_manager.set_vip("501", True)
+        user_manager.init_user("502")
+
+        loop = asyncio.new_event_loop()
+        batch = 1_000
+
+        def run(update: Update, section: str) -> Callable[[], object]:
+            async def many():
+                for _ in range(batch):
+                    await bot.check_access(update, section)
+            # One loop round trip per `batch` calls, so the loop overhead is amortised
+            return lambda: loop.run_until_complete(many())
+
+        for name, update, section in (("check_access[vip]", vip, free_section), ("check_access[free]", free, free_section)):
+            if not self.selected(name):
+                continue
+            result = measure(run(update, section))
+            for key in ("ns_per_op", "median_ns"):
+                result[key] = round(result[key] / batch, 1)
+            result["ops"] *= batch
+            self.results[name] = result
+            print(f"{name:40s} {result['ns_per_op']:14,.1f} ns/op", flush=True)
+        loop.close()
+
+    def run(self) -> Dict[str, Dict]:
+        try:
+            self.bench_content()
+            gc.collect()
+            self.bench_users()
+            gc.collect()
+            self.bench_check_access()
+        finally:
+            shutil.rmtree(self.tmp, ignore_errors=True)
+        return self.results
+
+
+def check_budgets(results: Dict[str, Dict], budgets: Dict[str, float]) -> List[str]:
+    """Names of the cases slower than their budget"""
+    over = []
+    for name, result in results.items():
+        budget = budgets.get(name)
+        if budget is None:
+            print(f"no budget for {name}")
+        elif result["ns_per_op"] > budget:
+            print(f"OVER BUDGET {name}: {result['ns_per_op']:,.1f} ns/op > {budget:,.1f}")
+            over.append(name)
+    return over
+
+
+def main(args) -> int:
+    logging.disable(logging.CRITICAL)
+    results = Suite(args.users, args.filter).run()
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "users": args.users,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    budgets = {}
+    if os.path.exists(args.budgets):
+        with open(args.budgets, "r", encoding="utf-8") as f:
+            budgets = json.load(f)
+    if args.save_budgets:
+        budgets.update({name: round(result["ns_per_op"] * args.headroom) for name, result in results.items()})
+        with open(args.budgets, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(budgets.items())), f, indent=2)
+            f.write("\n")
+        print(f"budgets saved to {args.budgets}")
+        return 0
+    return 1 if check_budgets(results, budgets) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000, help="users in the store for the UserManager cases")
+    parser.add_argument("--filter", help="only run cases whose name contains this")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--budgets", default=DEFAULT_BUDGETS)
+    parser.add_argument("--save-budgets", action="store_true")
+    parser.add_argument("--headroom", type=float, default=3.0, help="budget = measured time x headroom")
+    sys.exit(main(parser.parse_args()))
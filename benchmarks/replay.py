@@ -0,0 +1,237 @@
+"""Replay captured traffic against MillionishoBot and a fake Bot API.
+
+Usage: python benchmarks/replay.py CAPTURE.jsonl [CAPTURE2.jsonl ...]
+       [--speed 1] [--content content] [--output results.json]
+       [--compare other_results.json] [--tolerance 0.25] [--fail-on-regression]
+
+Captures come from the bot running with TRAFFIC_RECORD_FILE set (one file per
+worker when sharded; several files are merged by time). Each pseudonymous user
+replays their updates in order:
+  --speed 1    original timing
+  --speed 10   ten times faster
+  --speed 0    as fast as possible, each user sending as soon as the previous
+               update was handled
+Captures hold no message text: plain text is replaced by filler of the same length
+and replies (license keys) by a key the fake WordPress endpoint accepts. Admin
+flows replay as a regular user, and media uploads are skipped.
+
+To compare two builds, replay the same capture on each and pass the first run's
+--output to the second run's --compare.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from benchmarks.fake_bot_api import (  # noqa: E402
+    BACKGROUND_METHODS,
+    VALID_LICENSE_PREFIX,
+    FakeBotAPI,
+    make_callback_update,
+    make_message,
+    make_text_update,
+)
+from benchmarks.load_test import compare, percentile, prepare_environment  # noqa: E402
+
+FILLER = "متن "
+
+
+def load_capture(paths: List[str]) -> List[Dict]:
+    """All records of the capture files, oldest first"""
+    records = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    records.sort(key=lambda record: record["t"])
+    return records
+
+
+def latency_summary(latencies: List[float]) -> Dict:
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 2),
+    }
+
+
+class Replayer:
+    """Feeds capture records to the bot's webhook and times each update"""
+
+    def __init__(self, api: FakeBotAPI, send, speed: float, timeout: float):
+        self.api = api
+        self.send = send
+        self.speed = speed
+        self.timeout = timeout
+        self.update_ids = itertools.count(1)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.unanswered = 0
+        self.skipped = 0
+
+    def build(self, record: Dict):
+        """Update dict and completion future for a record, or None when it cannot be replayed"""
+        user_id, kind = record["u"], record["k"]
+        update_id = next(self.update_ids)
+        reply_to = None
+        if record.get("r"):
+            reply_to = self.api.last_messages.get(user_id) or make_message(1, user_id)
+        if kind == "callback":
+            message = self.api.last_messages.get(user_id) or make_message(1, user_id)
+            done = self.api.expect_answer(str(update_id))
+            return make_callback_update(update_id, user_id, record.get("d") or "", message=message), done
+        if kind == "command":
+            text = record["d"]
+        elif kind == "text":
+            if "d" in record:
+                text = record["d"]
+            elif reply_to is not None:
+                text = f"{VALID_LICENSE_PREFIX}-{update_id:08d}"
+            else:
+                text = (FILLER * (record.get("n", 1) // len(FILLER) + 1))[: max(record.get("n", 1), 1)]
+        else:
+            return None
+        done = self.api.expect_reply(user_id)
+        return make_text_update(update_id, user_id, text, reply_to), done
+
+    async def replay_user(self, records: List[Dict], first_time: float, started: float) -> None:
+        for record in records:
+            if self.speed:
+                delay = started + (record["t"] - first_time) / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            built = self.build(record)
+            if built is None:
+                self.skipped += 1
+                continue
+            update, done = built
+            sent = time.perf_counter()
+            await self.send(update)
+            try:
+                await asyncio.wait_for(done, self.timeout)
+                self.latencies[record["k"]].append(time.perf_counter() - sent)
+            except asyncio.TimeoutError:
+                # Updates the bot deliberately ignores also end up here
+                self.unanswered += 1
+
+    async def run(self, records: List[Dict]) -> float:
+        by_user: Dict[int, List[Dict]] = defaultdict(list)
+        for record in records:
+            by_user[record["u"]].append(record)
+        first_time = records[0]["t"] if records else 0.0
+        started = time.perf_counter()
+        await asyncio.gather(*(self.replay_user(user_records, first_time, started) for user_records in by_user.values()))
+        return time.perf_counter() - started
+
+
+async def replay(bot, api: FakeBotAPI, records: List[Dict], args) -> Dict:
+    from aiohttp import ClientSession
+
+    from webhook_server import SECRET_HEADER, WebhookServer
+
+    app = bot.application
+    server = WebhookServer(app, listen="127.0.0.1", port=0)
+    async with app, ClientSession() as session:
+        await app.start()
+        await server.start()
+        url = f"http://127.0.0.1:{server.port}{server.path}"
+        headers = {SECRET_HEADER: server.secret_token}
+
+        async def send(update: Dict) -> None:
+            async with session.post(url, json=update, headers=headers) as response:
+                response.raise_for_status()
+
+        replayer = Replayer(api, send, args.speed, args.timeout)
+        calls_before = sum(count for method, count in api.calls.items() if method not in BACKGROUND_METHODS)
+        try:
+            elapsed = await replayer.run(records)
+        finally:
+            await server.stop()
+            await app.stop()
+        calls = sum(count for method, count in api.calls.items() if method not in BACKGROUND_METHODS) - calls_before
+
+    latencies = [latency for kind_latencies in replayer.latencies.values() for latency in kind_latencies]
+    updates = len(latencies)
+    results = {
+        "config": {"captures": [os.path.basename(path) for path in args.captures], "speed": args.speed, "latency": args.latency},
+        "records": len(records),
+        "updates": updates,
+        "unanswered": replayer.unanswered,
+        "skipped": replayer.skipped,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(updates / elapsed, 1) if elapsed else 0.0,
+        "api_calls_per_update": round(calls / updates, 3) if updates else 0.0,
+    }
+    summary = latency_summary(latencies)
+    del summary["count"]
+    results.update(summary)
+    results["kinds"] = {kind: latency_summary(values) for kind, values in sorted(replayer.latencies.items())}
+    return results
+
+
+def compare_kinds(results: Dict, baseline: Dict) -> None:
+    """Per update kind p50/p99 change against the baseline run"""
+    print(f"{'kind':12s} {'p50 base':>10s} {'p50 now':>10s} {'p99 base':>10s} {'p99 now':>10s}")
+    for kind, summary in results["kinds"].items():
+        old = baseline.get("kinds", {}).get(kind)
+        if old:
+            print(f"{kind:12s} {old['p50_ms']:10.2f} {summary['p50_ms']:10.2f} {old['p99_ms']:10.2f} {summary['p99_ms']:10.2f}")
+
+
+async def main(args) -> int:
+    records = load_capture(args.captures)
+    if not records:
+        print("capture is empty")
+        return 1
+
+    api = FakeBotAPI(latency=args.latency)
+    await api.start()
+    prepare_environment(api, os.path.abspath(args.content))
+
+    from bot import MillionishoBot
+    logging.disable(logging.WARNING)
+
+    results = await replay(MillionishoBot(), api, records, args)
+    await api.stop()
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        compare_kinds(results, baseline)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("captures", nargs="+", help="capture files written with TRAFFIC_RECORD_FILE")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = original timing, 0 = as fast as possible")
+    parser.add_argument("--content", default="content", help="content directory the bot serves")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per Bot API call")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds to wait for one update")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    sys.exit(asyncio.run(main(parser.parse_args())))
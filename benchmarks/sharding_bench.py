@@ -0,0 +1,98 @@
+"""Compare update throughput of the sharded webhook front with 1, 2, 4 and 8 workers.
+
+Usage: python benchmarks/sharding_bench.py [--updates 2000] [--users 200] [--workers 1 2 4 8]
+
+Every run starts a local state store, N bot worker processes and the ShardRouter,
+then posts synthetic "main_menu" clicks to the front. The fake Bot API adds a
+fixed latency per call so workers spend time waiting on Telegram as in production.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from aiohttp import ClientSession  # noqa: E402
+
+from benchmarks.fake_bot_api import FakeBotAPI, make_callback_update  # noqa: E402
+
+
+# Workers log to their own files only, and only problems
+WORKER_ENV = {"STATE_STORE_AUTHKEY": "benchmark", "LOG_CONSOLE": "false", "LOG_LEVEL": "WARNING"}
+
+
+def synthetic_updates(count: int, users: int, first_id: int):
+    return [
+        make_callback_update(first_id + i, 1000 + i % users, "main_menu")
+        for i in range(count)
+    ]
+
+
+async def bench_workers(api: FakeBotAPI, workers: int, base_port: int, args) -> float:
+    from sharding import ShardRouter, start_store, start_workers, wait_for_workers
+    from state_store import parse_address
+    from webhook_server import SECRET_HEADER
+
+    store_url = f"127.0.0.1:{base_port - 1}"
+    processes = [start_store(parse_address(store_url), b"benchmark")]
+    worker_urls = [f"http://127.0.0.1:{base_port + i}/telegram" for i in range(workers)]
+    processes.extend(start_workers(workers, base_port, "worker-secret", store_url, WORKER_ENV))
+    router = ShardRouter(worker_urls, "worker-secret", listen="127.0.0.1", port=0)
+    try:
+        await wait_for_workers(worker_urls, timeout=60)
+        await router.start()
+        url = f"http://127.0.0.1:{router.port}{router.path}"
+        headers = {SECRET_HEADER: router.secret_token}
+        updates = synthetic_updates(args.updates, args.users, first_id=base_port * 100_000)
+        answered = api.calls["answerCallbackQuery"]
+
+        async with ClientSession() as session:
+            async def post_worker(chunk):
+                for update in chunk:
+                    async with session.post(url, json=update, headers=headers) as response:
+                        response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(post_worker(updates[i::args.concurrency]) for i in range(args.concurrency)))
+            await api.wait_for("answerCallbackQuery", answered + args.updates, timeout=300)
+            return time.perf_counter() - started
+    finally:
+        await router.stop()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(5)
+
+
+async def main(args) -> None:
+    api = FakeBotAPI(latency=args.latency)
+    await api.start()
+    os.environ["TELEGRAM_TOKEN"] = api.token
+    os.environ["TELEGRAM_API_URL"] = api.base_url
+    # Measure the bot itself, not the flood control pacing
+    os.environ.setdefault("RATE_LIMIT_GLOBAL", "1000000")
+    os.environ.setdefault("RATE_LIMIT_PER_CHAT", "1000000")
+    os.environ.setdefault("RATE_LIMIT_CHAT_BURST", "1000000")
+    logging.disable(logging.WARNING)
+
+    print(f"CPUs: {os.cpu_count()}, Bot API latency: {args.latency * 1000:.0f}ms")
+    for run, workers in enumerate(args.workers):
+        elapsed = await bench_workers(api, workers, args.base_port + run * 20, args)
+        print(f"{workers} worker(s): {args.updates} updates in {elapsed:.3f}s -> {args.updates / elapsed:,.0f} updates/s")
+    await api.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--concurrency", type=int, default=32, help="parallel webhook connections")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per Bot API call")
+    parser.add_argument("--base-port", type=int, default=19000)
+    asyncio.run(main(parser.parse_args()))
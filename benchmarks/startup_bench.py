@@ -0,0 +1,138 @@
+"""Time from launching bot.py to the first handled update.
+
+Usage: python benchmarks/startup_bench.py [--items 2000] [--runs 3]
+       [--budgets benchmarks/budgets.json] [--save-budget] [--headroom 3.0]
+
+A fresh `python bot.py` process is started in polling mode against the fake Bot
+API, with one "main_menu" click already waiting in getUpdates. The clock runs from
+launching the process until that click is answered, so it includes interpreter
+startup, imports, content loading and the first getUpdates round trip. Both content
+loading modes are measured (CONTENT_LAZY_LOAD true and false), and the bot's own
+startup breakdown is read from its log.
+
+The "time_to_first_update" budget (nanoseconds, lazy mode) lives next to the
+microbenchmark budgets; the run exits with status 1 when the best run is over it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from benchmarks.fake_bot_api import FakeBotAPI, make_callback_update  # noqa: E402
+from benchmarks.synthetic import write_content_dir  # noqa: E402
+
+DEFAULT_BUDGETS = os.path.join(ROOT, "benchmarks", "budgets.json")
+BUDGET_NAME = "time_to_first_update"
+BREAKDOWN = re.compile(r"First update handled ([\d.]+)s after start \((.*)\)")
+
+
+def parse_breakdown(log_file: str) -> Dict[str, float]:
+    """Startup phases the bot logged with its first update"""
+    if not os.path.exists(log_file):
+        return {}
+    with open(log_file, "r", encoding="utf-8") as f:
+        for line in f:
+            match = BREAKDOWN.search(line)
+            if match:
+                phases = {"total": float(match.group(1))}
+                for part in match.group(2).split(", "):
+                    phase, seconds = part.rsplit(" ", 1)
+                    phases[phase] = float(seconds.rstrip("s"))
+                return phases
+    return {}
+
+
+async def first_update(api: FakeBotAPI, content_dir: str, lazy: bool, run: int, timeout: float) -> Dict:
+    log_file = os.path.join(tempfile.mkdtemp(prefix="millionisho-startup-"), "bot.log")
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN=api.token,
+        TELEGRAM_API_URL=api.base_url,
+        CONTENT_DIR=content_dir,
+        CONTENT_LAZY_LOAD="true" if lazy else "false",
+        LOG_CONSOLE="false",
+        LOG_FILE=log_file,
+        LOG_LEVEL="INFO",
+        WEBHOOK_URL="",
+        METRICS_PORT="0",
+        TRAFFIC_RECORD_FILE="",
+        BROADCAST_STATE_FILE=os.path.join(os.path.dirname(log_file), "broadcast_state.json"),
+    )
+    answered = api.calls["answerCallbackQuery"]
+    api.push_updates([make_callback_update(run + 1, 5000 + run, "main_menu")])
+    started = time.perf_counter()
+    # Asynchronous, because the exiting bot still talks to the fake API on this loop
+    process = await asyncio.create_subprocess_exec(sys.executable, "bot.py", cwd=ROOT, env=env)
+    try:
+        await api.wait_for("answerCallbackQuery", answered + 1, timeout)
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), 10)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+    return {"seconds": round(elapsed, 4), "phases": parse_breakdown(log_file)}
+
+
+async def main(args) -> int:
+    api = FakeBotAPI()
+    await api.start()
+    content_dir = write_content_dir(tempfile.mkdtemp(prefix="millionisho-startup-content-"), args.items, media_every=5)
+    report: Dict[str, Dict] = {}
+    run = 0
+    for mode, lazy in (("lazy", True), ("eager", False)):
+        runs: List[Dict] = []
+        for _ in range(args.runs):
+            runs.append(await first_update(api, content_dir, lazy, run, args.timeout))
+            run += 1
+        best = min(runs, key=lambda result: result["seconds"])
+        report[mode] = {"best_seconds": best["seconds"], "runs": [result["seconds"] for result in runs], "phases": best["phases"]}
+        print(f"{mode:6s} first update after {best['seconds']:.3f}s  phases: {best['phases']}", flush=True)
+    await api.stop()
+
+    report = {"items_per_section": args.items, "modes": report}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    budgets = {}
+    if os.path.exists(args.budgets):
+        with open(args.budgets, "r", encoding="utf-8") as f:
+            budgets = json.load(f)
+    measured = report["modes"]["lazy"]["best_seconds"] * 1e9
+    if args.save_budget:
+        budgets[BUDGET_NAME] = round(measured * args.headroom)
+        with open(args.budgets, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(budgets.items())), f, indent=2)
+            f.write("\n")
+        print(f"budget saved to {args.budgets}")
+        return 0
+    budget = budgets.get(BUDGET_NAME)
+    if budget is not None and measured > budget:
+        print(f"OVER BUDGET {BUDGET_NAME}: {measured / 1e9:.3f}s > {budget / 1e9:.3f}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=2000, help="synthetic items per section")
+    parser.add_argument("--runs", type=int, default=3, help="launches per mode; the best one counts")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--budgets", default=DEFAULT_BUDGETS)
+    parser.add_argument("--save-budget", action="store_true")
+    parser.add_argument("--headroom", type=float, default=3.0, help="budget = measured time x headroom")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,43 @@
+"""Synthetic content for benchmarks, shaped like the files in content/."""
+import json
+import os
+import random
+from typing import Dict, Iterable, List, Optional
+
+# Not content_manager.SECTIONS: importing content_manager loads CONTENT_DIR, which
+# callers usually point at the directory they are about to generate
+from menu_config import SECTION_CODES
+
+# Persian filler so text lengths and encoding match real items
+WORDS = "قالب محتوا اینستاگرام ریلز کپشن مخاطب فروش برند پیج استوری ایده نکته آموزش".split()
+
+
+def make_items(section: str, count: int, media_every: int = 0, seed: int = 0, start: int = 1) -> List[Dict]:
+    """`count` items for a section; every `media_every`-th item carries a photo file_id"""
+    rng = random.Random(f"{seed}:{section}")
+    items = []
+    for number in range(start, start + count):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120)))
+        item = {"id": str(number), "text": f"{section} شماره {number}:\n\n{text}"}
+        if media_every and number % media_every == 0:
+            item["media_path"] = f"AgACAgQAAxkBAAI{section}{number}"
+            item["media_type"] = "photo"
+        items.append(item)
+    return items
+
+
+def write_content_dir(
+    path: str,
+    items_per_section: int,
+    sections: Optional[Iterable[str]] = None,
+    media_every: int = 0,
+    seed: int = 0,
+) -> str:
+    """Write one <section>.json per section into `path` (usable as CONTENT_DIR)"""
+    os.makedirs(os.path.join(path, "tutorials"), exist_ok=True)
+    for section in sections or SECTION_CODES:
+        with open(os.path.join(path, f"{section}.json"), "w", encoding="utf-8") as f:
+            json.dump(make_items(section, items_per_section, media_every, seed), f, ensure_ascii=False)
+        with open(os.path.join(path, "tutorials", f"{section}.json"), "w", encoding="utf-8") as f:
+            json.dump({"text": f"آموزش {section}"}, f, ensure_ascii=False)
+    return path
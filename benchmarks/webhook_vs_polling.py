@@ -0,0 +1,103 @@
+"""Compare update throughput of webhook mode and long polling.
+
+Usage: python benchmarks/webhook_vs_polling.py [--updates 2000] [--users 50]
+
+Both modes run MillionishoBot against a local fake Bot API. Each synthetic
+update is a "main_menu" click, which costs one editMessageText and one
+answerCallbackQuery, so the run is done once every query was answered.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from aiohttp import ClientSession  # noqa: E402
+
+from benchmarks.fake_bot_api import FakeBotAPI, make_callback_update  # noqa: E402
+
+
+def synthetic_updates(count: int, users: int, first_id: int = 1):
+    return [
+        make_callback_update(first_id + i, 1000 + i % users, "main_menu")
+        for i in range(count)
+    ]
+
+
+async def bench_polling(bot, api: FakeBotAPI, count: int, users: int) -> float:
+    app = bot.application
+    async with app:
+        await app.start()
+        await app.updater.start_polling(poll_interval=0, timeout=1)
+        answered = api.calls["answerCallbackQuery"]
+        started = time.perf_counter()
+        api.push_updates(synthetic_updates(count, users))
+        await api.wait_for("answerCallbackQuery", answered + count)
+        elapsed = time.perf_counter() - started
+        await app.updater.stop()
+        await app.stop()
+    return elapsed
+
+
+async def bench_webhook(bot, api: FakeBotAPI, count: int, users: int, concurrency: int) -> float:
+    from webhook_server import WebhookServer
+
+    app = bot.application
+    server = WebhookServer(app, listen="127.0.0.1", port=0)
+    async with app:
+        await app.start()
+        await server.start()
+        url = f"http://127.0.0.1:{server.port}{server.path}"
+        headers = {"X-Telegram-Bot-Api-Secret-Token": server.secret_token}
+        updates = synthetic_updates(count, users, first_id=10_000_000)
+        answered = api.calls["answerCallbackQuery"]
+
+        async with ClientSession() as session:
+            async def post_worker(chunk):
+                for update in chunk:
+                    async with session.post(url, json=update, headers=headers) as response:
+                        response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(post_worker(updates[i::concurrency]) for i in range(concurrency)))
+            await api.wait_for("answerCallbackQuery", answered + count)
+            elapsed = time.perf_counter() - started
+
+        await server.stop()
+        await app.stop()
+    return elapsed
+
+
+async def main(args) -> None:
+    api = FakeBotAPI()
+    await api.start()
+    os.environ["TELEGRAM_TOKEN"] = api.token
+    os.environ["TELEGRAM_API_URL"] = api.base_url
+    # Measure the bot itself, not the flood control pacing
+    os.environ.setdefault("RATE_LIMIT_GLOBAL", "1000000")
+    os.environ.setdefault("RATE_LIMIT_PER_CHAT", "1000000")
+    os.environ.setdefault("RATE_LIMIT_CHAT_BURST", "1000000")
+
+    from bot import MillionishoBot
+    logging.disable(logging.WARNING)
+
+    results = {}
+    results["polling"] = await bench_polling(MillionishoBot(), api, args.updates, args.users)
+    results["webhook"] = await bench_webhook(MillionishoBot(), api, args.updates, args.users, args.concurrency)
+    await api.stop()
+
+    for mode, elapsed in results.items():
+        print(f"{mode:8s} {args.updates} updates in {elapsed:.3f}s -> {args.updates / elapsed:,.0f} updates/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16, help="parallel webhook connections")
+    asyncio.run(main(parser.parse_args()))
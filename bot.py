@@ -1,24 +1,81 @@
+# First, so the startup clock also covers the imports below
+from startup import STARTUP
+
 import os
 import json
+import html
+import asyncio
 import logging
-from typing import Dict, Optional
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, InputMediaVideo, ForceReply
+import time
+from contextlib import suppress
+from typing import Dict, List, Optional, Tuple
+from telegram import (
+    Update,
+    Message,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InputMediaPhoto,
+    InputMediaVideo,
+    InputMediaDocument,
+    ForceReply,
+)
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     ContextTypes,
+    TypeHandler,
     filters,
 )
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, TelegramError
 import aiohttp
 
 from config import (
     TELEGRAM_TOKEN,
+    TELEGRAM_API_URL,
+    CACHE_MAX_SIZE,
     WORDPRESS_BASE_URL,
     ADMIN_IDS,
-    DEBUG
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_CERT,
+    WEBHOOK_KEY,
+    MAX_CONCURRENT_UPDATES,
+    MAX_QUEUED_UPDATES_PER_USER,
+    RATE_LIMIT_GLOBAL,
+    RATE_LIMIT_PER_CHAT,
+    RATE_LIMIT_CHAT_BURST,
+    RATE_LIMIT_GROUP_PER_MINUTE,
+    RATE_LIMIT_MAX_RETRIES,
+    BROADCAST_STATE_FILE,
+    BROADCAST_BATCH_SIZE,
+    BROADCAST_CONCURRENCY,
+    BROADCAST_CHECKPOINT_INTERVAL,
+    BROADCAST_LEASE_SECONDS,
+    CONTENT_SYNC_INTERVAL,
+    WORKER_INDEX,
+    METRICS_LISTEN,
+    METRICS_PORT,
+    PROFILE_DEFAULT_SECONDS,
+    PROFILE_MAX_SECONDS,
+    PROFILE_INTERVAL,
+    WATCHDOG_INTERVAL,
+    WATCHDOG_THRESHOLD,
+    WATCHDOG_UNHEALTHY_LAG,
+    TRAFFIC_RECORD_FILE,
+    TRAFFIC_RECORD_SALT,
+    CONTENT_LAZY_LOAD,
+    CONTENT_SHUFFLE,
+    POPULARITY_HALF_LIFE_HOURS,
+    POPULARITY_FAVORITE_WEIGHT,
+    POPULARITY_CHECKPOINT_INTERVAL,
+    TRENDING_SIZE,
+    DUPLICATE_THRESHOLD
 )
 from menu_config import (
     MAIN_MENU_BUTTONS,
@@ -30,42 +87,359 @@ from menu_config import (
     CONTENT_COUNTS
 )
 from user_manager import user_manager
-from content_manager import content_manager
-
-# Configure logging with more detail
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG if DEBUG else logging.INFO,
-    filename='bot.log'
+from content_manager import SECTIONS, content_manager
+from logging_setup import setup_logging
+from metrics import REGISTRY, MetricsServer
+from profiler import ProfileSession
+from health import HealthCheck, LoopWatchdog
+from traffic import TrafficRecorder
+from webhook_server import WebhookServer, register_webhook
+from update_processor import PerUserUpdateProcessor
+from state_store import MemoryStateStore, RemoteStateStore, StoreNamespace
+from rate_limiter import FloodControlRateLimiter
+from broadcast import Broadcaster
+from render_cache import RenderCache
+from attachments import Album, FileIdCache
+from delivery import MESSAGE_LIMIT, plan_delivery, split_text
+from ideas import IdeaGenerator
+from popularity import PopularityTracker
+from duplicates import ContentDuplicates
+from shuffle import domain_bits, step as shuffle_step, user_key
+from transitions import (
+    TEXT,
+    EDIT_TEXT,
+    EDIT_CAPTION,
+    EDIT_MEDIA,
+    SEND,
+    REPLACE,
+    Transition,
+    TransitionPlanner
 )
+from callback_data import (
+    NAVIGATION,
+    TUTORIAL,
+    GO_TO,
+    SHUFFLED,
+    FAVORITE,
+    TRENDING,
+    SIMILAR,
+    split as split_callback_data,
+    encode_navigation,
+    decode_navigation,
+    content_tag,
+    encode_tutorial,
+    decode_tutorial,
+    encode_go_to,
+    decode_go_to,
+    encode_shuffled,
+    decode_shuffled,
+    encode_favorite,
+    decode_favorite,
+    encode_trending,
+    decode_trending,
+    encode_similar,
+    decode_similar,
+    decode_deep_link
+)
+
+setup_logging()
 logger = logging.getLogger(__name__)
 
-# Add a console handler for immediate feedback
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG if DEBUG else logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+CALLBACK_LATENCY = REGISTRY.histogram(
+    "millionisho_callback_seconds", "Callback query handling time", ("handler",)
+)
+CALLBACK_ERRORS = REGISTRY.counter(
+    "millionisho_callback_errors_total", "Callback queries whose handler raised", ("handler",)
+)
+SEND_CONTENT_LATENCY = REGISTRY.histogram(
+    "millionisho_send_content_seconds", "Time to show a content item", ("media_type",)
+)
+LICENSE_VERIFY_LATENCY = REGISTRY.histogram(
+    "millionisho_license_verify_seconds", "WordPress license verification time", ("result",)
+)
+CONTENT_TRANSITIONS = REGISTRY.counter(
+    "millionisho_content_transitions_total", "Messages shown, by the Bot API operation used", ("operation",)
+)
+STARTUP_SECONDS = REGISTRY.gauge(
+    "millionisho_startup_seconds", "Time spent in each startup phase until the first update was handled", ("phase",)
+)
+
+# Store namespace with a revision counter per content section, bumped on every change
+CONTENT_REVISIONS = "content_revisions"
+# Store namespace with each worker's last PopularityTracker.snapshot()
+POPULARITY = "popularity"
+
+# InputMedia class per media kind editMessageMedia accepts
+INPUT_MEDIA = {"photo": InputMediaPhoto, "video": InputMediaVideo, "document": InputMediaDocument}
+
+# Persian and Arabic-Indic digits typed by users
+PERSIAN_DIGITS = str.maketrans("۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩", "01234567890123456789")
+
+# Prompt sent by /activate; only replies to it are license keys
+LICENSE_PROMPT = "لطفاً کد لایسنس خود را وارد کنید:"
+
+
+class LicenseReplyFilter(filters.MessageFilter):
+    """Messages replying to the bot's /activate prompt"""
+
+    def filter(self, message) -> bool:
+        reply = message.reply_to_message
+        return bool(reply and reply.from_user and reply.from_user.is_bot and reply.text == LICENSE_PROMPT)
+
 
 class MillionishoBot:
     def __init__(self):
         """Initialize bot with required handlers"""
+        STARTUP.mark("imports")
         logger.info("Initializing MillionishoBot")
-        self.application = Application.builder().token(TELEGRAM_TOKEN).build()
-        self.current_section = {}
-        self.current_action = {}
-        self.temp_content = {}
-        self.admin_state = {}
-        self._setup_handlers()
-        
+        self.rate_limiter = FloodControlRateLimiter(
+            global_rate=RATE_LIMIT_GLOBAL,
+            chat_rate=RATE_LIMIT_PER_CHAT,
+            chat_burst=RATE_LIMIT_CHAT_BURST,
+            group_rate_per_minute=RATE_LIMIT_GROUP_PER_MINUTE,
+            max_retries=RATE_LIMIT_MAX_RETRIES,
+        )
+        builder = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .concurrent_updates(PerUserUpdateProcessor(
+                MAX_CONCURRENT_UPDATES,
+                self._first_update_handled,
+                around_update=user_manager.batch,
+                max_queued_per_user=MAX_QUEUED_UPDATES_PER_USER,
+            ))
+            .rate_limiter(self.rate_limiter)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+        )
+        if TELEGRAM_API_URL:
+            builder = builder.base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot")
+        with STARTUP.phase("application"):
+            self.application = builder.build()
+        # Conversation state lives in the (possibly shared) store so any worker can continue it
+        store = user_manager.store
+        self.current_section = StoreNamespace(store, "admin_section")
+        self.current_action = StoreNamespace(store, "admin_action")
+        self.temp_content = StoreNamespace(store, "admin_temp_content")
+        self.admin_state = StoreNamespace(store, "admin_state")
+        self.content_revisions = {}
+        self.worker_name = f"worker-{WORKER_INDEX}"
+        self.broadcaster = Broadcaster(
+            user_manager,
+            BROADCAST_STATE_FILE,
+            batch_size=BROADCAST_BATCH_SIZE,
+            concurrency=BROADCAST_CONCURRENCY,
+            checkpoint_interval=BROADCAST_CHECKPOINT_INTERVAL,
+            owner=self.worker_name,
+            lease_ttl=BROADCAST_LEASE_SECONDS,
+        )
+        self.render_cache = RenderCache(content_manager, self.get_navigation_keyboard, max_size=CACHE_MAX_SIZE)
+        self.transitions = TransitionPlanner()
+        self.file_ids = FileIdCache(StoreNamespace(store, "file_ids"))
+        self.idea_generator = IdeaGenerator(content_manager)
+        self.popularity = PopularityTracker(
+            content_manager,
+            half_life=POPULARITY_HALF_LIFE_HOURS * 3600,
+            top_k=TRENDING_SIZE,
+            favorite_weight=POPULARITY_FAVORITE_WEIGHT,
+        )
+        self.duplicates = ContentDuplicates(content_manager, DUPLICATE_THRESHOLD)
+        # Callback queries answered before their handler finished
+        self.answered_callbacks = set()
+        if not CONTENT_LAZY_LOAD:
+            with STARTUP.phase("content"):
+                content_manager.load_content()
+        self.direct_handlers = {
+            "template": self.handle_template,
+            "text_template": self.handle_text_template,
+            "image_template": self.handle_image_template,
+            "tutorial": self.handle_tutorial,
+            "next": self.handle_next,
+            "back": self.handle_back,
+            "main_menu": self.handle_main_menu,
+            "reels_idea": self.handle_reels_idea,
+            "call_to_action": self.handle_call_to_action,
+            "caption": self.handle_caption,
+            "complete_idea": self.handle_complete_idea,
+            "interactive_story": self.handle_interactive_story,
+            "bio": self.handle_bio,
+            "roadmap": self.handle_roadmap,
+            "all_files": self.handle_all_files,
+            "vip": self.handle_vip,
+            "favorites": self.handle_favorites,
+        }
+        # Encoded callbacks ("<prefix>:<payload>") routed by prefix
+        self.callback_routes = {
+            NAVIGATION: self.handle_navigation,
+            TUTORIAL: self.handle_section_tutorial,
+            GO_TO: self.handle_go_to,
+            SHUFFLED: self.handle_shuffled,
+            FAVORITE: self.handle_add_favorite,
+            TRENDING: self.handle_trending,
+            SIMILAR: self.handle_similar,
+        }
+        self.profile_session: Optional[ProfileSession] = None
+        self._preload_task: Optional[asyncio.Task] = None
+        self._popularity_task: Optional[asyncio.Task] = None
+        self._similarity_builds: Dict[str, asyncio.Task] = {}
+        self.watchdog = LoopWatchdog(WATCHDOG_INTERVAL, WATCHDOG_THRESHOLD)
+        self.health = HealthCheck(
+            self.application,
+            self.watchdog,
+            content_manager,
+            user_manager.store,
+            unhealthy_lag=WATCHDOG_UNHEALTHY_LAG,
+        )
+        self.traffic_recorder = None
+        if TRAFFIC_RECORD_FILE:
+            self.traffic_recorder = TrafficRecorder(TRAFFIC_RECORD_FILE, TRAFFIC_RECORD_SALT)
+        self.metrics_server = None
+        if METRICS_PORT:
+            self.metrics_server = MetricsServer(REGISTRY, METRICS_LISTEN, METRICS_PORT, health=self.health)
+        self._register_metrics()
+        with STARTUP.phase("handlers"):
+            self._setup_handlers()
+
+    def _register_metrics(self) -> None:
+        """Metrics read from existing counters when scraped"""
+        processor = self.application.update_processor
+        REGISTRY.gauge("millionisho_users", "Registered users").set_function(user_manager.count_users)
+        REGISTRY.gauge("millionisho_vip_users", "VIP users").set_function(user_manager.count_vip_users)
+        REGISTRY.gauge("millionisho_updates_queued", "Updates waiting behind another update of the same user").set_function(
+            lambda: processor.queued_updates
+        )
+        REGISTRY.gauge("millionisho_updates_active", "Updates being handled").set_function(
+            lambda: processor.active_updates
+        )
+        REGISTRY.counter("millionisho_updates_processed_total", "Updates handled").set_function(
+            lambda: processor.processed_updates
+        )
+        REGISTRY.counter("millionisho_updates_dropped_total", "Updates dropped because their user had too many queued").set_function(
+            lambda: processor.dropped_updates
+        )
+        REGISTRY.counter("millionisho_render_cache_hits_total", "Rendered content served from cache").set_function(
+            lambda: self.render_cache.hits
+        )
+        REGISTRY.counter("millionisho_render_cache_misses_total", "Items rendered on demand").set_function(
+            lambda: self.render_cache.misses
+        )
+        REGISTRY.gauge("millionisho_bot_api_queued", "Bot API calls waiting for flood control").set_function(
+            lambda: self.rate_limiter.queued_requests
+        )
+        REGISTRY.counter("millionisho_bot_api_retry_after_total", "Flood control errors from Telegram").set_function(
+            lambda: self.rate_limiter.retry_after_count
+        )
+        REGISTRY.counter("millionisho_bot_api_merged_edits_total", "Edits dropped in favour of a newer edit").set_function(
+            lambda: self.rate_limiter.merged_edits
+        )
+
+    async def _post_init(self, application: Application) -> None:
+        """Start background services and resume work that was interrupted by a restart"""
+        with STARTUP.phase("post_init"):
+            if isinstance(user_manager.store, RemoteStateStore):
+                # Connect here rather than at import, and off the event loop
+                await asyncio.to_thread(user_manager.store.connect)
+            self.watchdog.start()
+            if self.metrics_server:
+                await self.metrics_server.start()
+            # Workers share the checkpoint; the broadcast lease lets a single one pick it up again
+            if await self.broadcaster.resume(application.bot):
+                logger.info("Interrupted broadcast resumed")
+            if not isinstance(user_manager.store, MemoryStateStore):
+                application.create_task(self._sync_content())
+                # Only a shared store outlives this process, so only then are the counters worth saving
+                self._popularity_task = asyncio.create_task(self._checkpoint_popularity())
+            # A plain task: application.create_task() warns before the application has started
+            self._preload_task = asyncio.create_task(self._preload_content())
+
+    async def _preload_content(self) -> None:
+        """Load the sections no update has needed yet and index them for similar items, off the event loop"""
+        try:
+            await asyncio.to_thread(content_manager.load_content)
+            await asyncio.to_thread(content_manager.build_all_similarity)
+            logger.info("Content preloaded")
+        except Exception as e:
+            logger.error("Error preloading content: %s", e)
+
+    def _first_update_handled(self) -> None:
+        if STARTUP.first_update_handled():
+            for phase, seconds in STARTUP.phases.items():
+                STARTUP_SECONDS.labels(phase).set(seconds)
+            STARTUP_SECONDS.labels("total").set(STARTUP.first_update)
+
+    async def _checkpoint_popularity(self) -> None:
+        """Add the counters this worker saved before a restart, then save them periodically"""
+        try:
+            snapshot = await asyncio.to_thread(user_manager.store.get, POPULARITY, self.worker_name)
+            if snapshot:
+                await asyncio.to_thread(self.popularity.restore, snapshot)
+                logger.info("Popularity counters restored")
+        except Exception as e:
+            logger.error("Error restoring popularity counters: %s", e)
+        while True:
+            await asyncio.sleep(POPULARITY_CHECKPOINT_INTERVAL)
+            await self._save_popularity()
+
+    async def _save_popularity(self) -> None:
+        try:
+            await asyncio.to_thread(user_manager.store.set, POPULARITY, self.worker_name, self.popularity.snapshot())
+        except Exception as e:
+            logger.error("Error saving popularity counters: %s", e)
+
+    async def _post_shutdown(self, application: Application) -> None:
+        await self.broadcaster.stop()
+        if self._popularity_task:
+            self._popularity_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._popularity_task
+            await self._save_popularity()
+        await self.watchdog.stop()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        if self.traffic_recorder:
+            self.traffic_recorder.close()
+
+    async def add_content(self, section: str, content: Dict) -> Optional[str]:
+        """Add content and tell the other workers to reload the section"""
+        # Off the event loop: the section's listeners re-align their per-item state
+        content_id = await asyncio.to_thread(content_manager.add_content, section, content)
+        if content_id:
+            self.content_revisions[section] = await asyncio.to_thread(user_manager.store.incr, CONTENT_REVISIONS, section)
+        return content_id
+
+    async def _sync_content(self) -> None:
+        """Reload sections that were changed by another worker"""
+        self.content_revisions.update(await asyncio.to_thread(user_manager.store.items, CONTENT_REVISIONS))
+        while True:
+            await asyncio.sleep(CONTENT_SYNC_INTERVAL)
+            try:
+                for section, revision in await asyncio.to_thread(user_manager.store.items, CONTENT_REVISIONS):
+                    if self.content_revisions.get(section, 0) < revision:
+                        logger.info("Reloading section %s changed by another worker", section)
+                        await asyncio.to_thread(content_manager.load_section, section)
+                        self.content_revisions[section] = revision
+            except Exception as e:
+                logger.error("Error syncing content: %s", e)
+
     def _setup_handlers(self):
         """Setup all necessary command and callback handlers"""
         logger.info("Setting up message handlers")
         
+        # Traffic capture for benchmarks/replay.py, ahead of every other handler
+        if self.traffic_recorder:
+            self.application.add_handler(TypeHandler(Update, self.traffic_recorder.handle_update), group=-1)
+        
         # Command handlers
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("help", self.help_command))
         self.application.add_handler(CommandHandler("save", self.save_command))
+        self.application.add_handler(CommandHandler("activate", self.handle_activation_code))
+        
+        # License key replies
+        self.application.add_handler(MessageHandler(
+            filters.TEXT & ~filters.COMMAND & LicenseReplyFilter(),
+            self.handle_activation_input
+        ))
         
         # Text handler for admin command
         self.application.add_handler(MessageHandler(
@@ -73,6 +447,18 @@ class MillionishoBot:
             self.handle_admin_command
         ))
         
+        # Text handler for the duplicate content audit
+        self.application.add_handler(MessageHandler(
+            filters.TEXT & filters.Regex("^!duplicates$"),
+            self.handle_duplicates_command
+        ))
+        
+        # Text handler for profiling command
+        self.application.add_handler(MessageHandler(
+            filters.TEXT & filters.Regex(r"^!profile(\s+\S+)?$"),
+            self.handle_profile_command
+        ))
+        
         # General text handler
         self.application.add_handler(MessageHandler(
             filters.TEXT & ~filters.COMMAND,
@@ -96,47 +482,196 @@ class MillionishoBot:
         """Central callback handler"""
         user_id = str(update.effective_user.id)
         callback_data = update.callback_query.data
-        logger.info(f"Callback received - user_id: {user_id}, data: {callback_data}")
+        logger.info("Callback received - user_id: %s, data: %s", user_id, callback_data)
+        # Metrics are labelled by handler, not by the raw data, to keep the label set small
+        handler_name = "unknown"
+        started = time.perf_counter()
 
         try:
+            prefix, payload = split_callback_data(callback_data)
+            if prefix != GO_TO:
+                # Any other button cancels a pending "go to number" prompt
+                user_manager.set_go_to_section(user_id, None)
+
             # Admin callbacks
             if callback_data.startswith("admin_"):
+                handler_name = "handle_admin_callback"
                 await self.handle_admin_callback(update, context)
                 return
 
             # Direct matches
-            direct_handlers = {
-                "template": self.handle_template,
-                "text_template": self.handle_text_template,
-                "image_template": self.handle_image_template,
-                "tutorial": self.handle_tutorial,
-                "next": self.handle_next,
-                "back": self.handle_back,
-                "main_menu": self.handle_main_menu,
-                "reels_idea": self.handle_reels_idea,
-                "call_to_action": self.handle_call_to_action,
-                "caption": self.handle_caption,
-                "complete_idea": self.handle_complete_idea,
-                "interactive_story": self.handle_interactive_story,
-                "bio": self.handle_bio,
-                "roadmap": self.handle_roadmap,
-                "all_files": self.handle_all_files,
-                "vip": self.handle_vip,
-                "favorites": self.handle_favorites,
-            }
-
-            if callback_data in direct_handlers:
-                logger.info(f"Handling callback '{callback_data}' for user {user_id}")
-                await direct_handlers[callback_data](update, context)
-                await update.callback_query.answer()
+            if callback_data in self.direct_handlers:
+                handler = self.direct_handlers[callback_data]
+                handler_name = handler.__name__
+                logger.info("Handling callback '%s' for user %s", callback_data, user_id)
+                await handler(update, context)
+                await self.answer_callback(update)
+                return
+
+            # Encoded callbacks
+            route = self.callback_routes.get(prefix)
+            if route:
+                handler_name = route.__name__
+                logger.info("Handling encoded callback '%s' for user %s", callback_data, user_id)
+                await route(update, context, payload)
+                await self.answer_callback(update)
                 return
 
-            logger.warning(f"Unhandled callback data: {callback_data}")
+            logger.warning("Unhandled callback data: %s", callback_data)
             await update.callback_query.answer("این گزینه در حال حاضر در دسترس نیست.", show_alert=True)
 
         except Exception as e:
-            logger.error(f"Error in callback handler - user: {user_id}, callback: {callback_data}, error: {str(e)}")
-            await update.callback_query.answer("خطایی رخ داد. لطفاً دوباره تلاش کنید.", show_alert=True)
+            CALLBACK_ERRORS.labels(handler_name).inc()
+            logger.error("Error in callback handler - user: %s, callback: %s, error: %s", user_id, callback_data, e)
+            await self.alert(update, "خطایی رخ داد. لطفاً دوباره تلاش کنید.")
+        finally:
+            self.answered_callbacks.discard(update.callback_query.id)
+            CALLBACK_LATENCY.labels(handler_name).observe(time.perf_counter() - started)
+
+    async def answer_callback(self, update: Update) -> None:
+        """Answer the button click unless it was already answered early"""
+        if update.callback_query.id not in self.answered_callbacks:
+            await update.callback_query.answer()
+
+    def answer_early(self, update: Update) -> Optional[asyncio.Task]:
+        """Stop the button's loading spinner while the new message is still being sent"""
+        query = update.callback_query
+        if query is None or query.id in self.answered_callbacks:
+            return None
+        self.answered_callbacks.add(query.id)
+        return asyncio.create_task(self._answer_quietly(query))
+
+    async def _answer_quietly(self, query) -> None:
+        try:
+            await query.answer()
+        except TelegramError as e:
+            # Only the spinner is affected; the message itself is still shown
+            logger.debug("Could not answer callback query %s: %s", query.id, e)
+
+    async def alert(self, update: Update, text: str) -> None:
+        """Show an alert for button clicks, or reply when the update is a message"""
+        if update.callback_query and update.callback_query.id not in self.answered_callbacks:
+            self.answered_callbacks.add(update.callback_query.id)
+            await update.callback_query.answer(text, show_alert=True)
+        else:
+            # A query can be answered once; after an early answer the alert becomes a message
+            await update.effective_message.reply_text(text)
+
+    async def apply_transition(
+        self,
+        transition: Transition,
+        target: Message,
+        text: str,
+        keyboard: InlineKeyboardMarkup,
+        media_path: Optional[str] = None,
+    ):
+        """Carry out a planned transition; returns the message now on screen"""
+        operation, kind = transition.operation, transition.kind
+        if operation == EDIT_TEXT:
+            return await target.edit_text(text=text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+        if operation == EDIT_CAPTION:
+            return await target.edit_caption(caption=text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+        if operation == EDIT_MEDIA:
+            media = INPUT_MEDIA[kind](self.file_ids.resolve(media_path), caption=text, parse_mode=ParseMode.HTML)
+            return await target.edit_media(media=media, reply_markup=keyboard)
+
+        if kind == TEXT:
+            sending = target.reply_text(text=text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+        else:
+            reply = getattr(target, f"reply_{kind}")
+            sending = reply(self.file_ids.resolve(media_path), caption=text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+        if operation == SEND:
+            return await sending
+        # Both calls in one round trip; a failed send is retried as text by show()
+        sent, _ = await asyncio.gather(sending, self._delete_quietly(target))
+        return sent
+
+    async def _delete_quietly(self, message: Message) -> None:
+        try:
+            await message.delete()
+        except TelegramError as e:
+            # Too old to delete; the new message is below it anyway
+            logger.debug("Could not delete replaced message %s: %s", message.message_id, e)
+
+    async def show(
+        self,
+        update: Update,
+        text: str,
+        keyboard: Optional[InlineKeyboardMarkup],
+        kind: str = TEXT,
+        media_path: Optional[str] = None,
+        edit_message: bool = True,
+    ) -> Message:
+        """Show a message in place of the clicked one, or as a reply to a typed message"""
+        current = update.callback_query.message if update.callback_query and edit_message else None
+        target = current or update.effective_message
+        transition = self.transitions.plan(current, kind, media_path)
+        answering = self.answer_early(update)
+        try:
+            try:
+                sent = await self.apply_transition(transition, target, text, keyboard, media_path)
+            except BadRequest as e:
+                if "not modified" in e.message:
+                    # Same text and keyboard (a double click); nothing to do
+                    return target
+                if transition.kind == TEXT and not transition.is_edit:
+                    raise
+                # Unsendable media or an uneditable message: a new text message always works
+                logger.warning("%s of %s message failed: %s; sending text instead", transition.operation, kind, e)
+                transition = Transition(REPLACE if current is not None else SEND, TEXT)
+                sent = await self.apply_transition(transition, target, text, keyboard)
+            self.transitions.learn(media_path, sent)
+            self.file_ids.learn(media_path, sent)
+            CONTENT_TRANSITIONS.labels(transition.operation).inc()
+            return sent
+        finally:
+            if answering:
+                await answering
+
+    async def deliver(
+        self,
+        update: Update,
+        parts: Tuple[str, ...],
+        keyboard: Optional[InlineKeyboardMarkup],
+        kind: str = TEXT,
+        media_path: Optional[str] = None,
+        edit_message: bool = True,
+        albums: Tuple[Album, ...] = (),
+    ) -> None:
+        """Send an item as planned: the first part like show(), the others as text below it.
+
+        The keyboard goes on the last message, so the buttons stay under the end of the text.
+        Attachment albums follow; an album cannot carry a keyboard.
+        """
+        first_keyboard = keyboard if len(parts) == 1 else None
+        message = await self.show(update, parts[0], first_keyboard, kind, media_path, edit_message)
+        for number, part in enumerate(parts[1:], 2):
+            message = await message.reply_text(
+                part,
+                reply_markup=keyboard if number == len(parts) else None,
+                parse_mode=ParseMode.HTML
+            )
+        for album in albums:
+            await self.send_album(message, album)
+
+    async def send_album(self, message: Message, album: Album) -> None:
+        """Send attachments in one request, by file_id once each file has been uploaded"""
+        try:
+            if len(album) == 1:
+                attachment = album[0]
+                reply = getattr(message, f"reply_{attachment.kind}")
+                sent = [await reply(self.file_ids.resolve(attachment.path), caption=attachment.caption)]
+            else:
+                sent = await message.reply_media_group([
+                    INPUT_MEDIA[attachment.kind](self.file_ids.resolve(attachment.path), caption=attachment.caption)
+                    for attachment in album
+                ])
+        except TelegramError as e:
+            # Attachments are extras; the item itself was already shown
+            logger.error("Error sending %s attachments: %s", len(album), e)
+            return
+        for attachment, album_message in zip(album, sent):
+            self.file_ids.learn(attachment.path, album_message)
 
     async def check_access(self, update: Update, section: str) -> bool:
         """Check if user has access to the section"""
@@ -147,104 +682,81 @@ class MillionishoBot:
             return True
             
         # If section is locked for free users, deny access
-        if section in LOCKED_SECTIONS:
-            await update.callback_query.answer(MESSAGES["vip_only"], show_alert=True)
+        if not await self.check_unlocked(update, section):
             return False
             
         # Check usage limits for free sections
         if section in FREE_LIMITS:
             usage_count = user_manager.get_usage_count(user_id, section)
             if usage_count >= FREE_LIMITS[section]:
-                await update.callback_query.answer(MESSAGES["free_limit_reached"], show_alert=True)
+                await self.alert(update, MESSAGES["free_limit_reached"])
                 return False
                 
         return True
 
-    async def send_content(self, update: Update, section: str, index: int, edit_message: bool = True) -> None:
-        """Send content to user with appropriate format and keyboard"""
+    async def check_unlocked(self, update: Update, section: str) -> bool:
+        """Check that a section named by callback data is not locked for the user.
+
+        Buttons inside a section do not count towards its free limit, but their data is
+        sent by the client, so locked sections are checked again on every click.
+        """
+        if section not in LOCKED_SECTIONS or user_manager.is_vip(str(update.effective_user.id)):
+            return True
+        logger.warning("Locked section %s requested by user %s", section, update.effective_user.id)
+        await self.alert(update, MESSAGES["vip_only"])
+        return False
+
+    async def send_content(
+        self,
+        update: Update,
+        section: str,
+        index: int,
+        edit_message: bool = True,
+        keyboard: Optional[InlineKeyboardMarkup] = None,
+    ) -> None:
+        """Send content to user with appropriate format and keyboard (the cached one unless given)"""
         user_id = str(update.effective_user.id)
-        logger.info(f"Sending content - user: {user_id}, section: {section}, index: {index}")
+        logger.info("Sending content - user: %s, section: %s, index: %s", user_id, section, index)
+        media_type = "missing"
+        started = time.perf_counter()
         
         try:
-            # Get content
-            content = content_manager.get_content(section, index)
-            if not content:
-                logger.error(f"Content not found - section: {section}, index: {index}")
-                await update.callback_query.answer("محتوای مورد نظر یافت نشد", show_alert=True)
+            # Get pre-rendered message and keyboard
+            rendered = self.render_cache.get(section, index)
+            if not rendered:
+                logger.error("Content not found - section: %s, index: %s", section, index)
+                await self.alert(update, "محتوای مورد نظر یافت نشد")
                 return
 
-            # Get section size and prepare message
-            section_size = content_manager.get_section_size(section)
-            message = f"{content.text}\n\n{index + 1} از {section_size}"
-            keyboard = self.get_navigation_keyboard()
-
-            # Handle media content
-            if content.media_path and content.media_type:
-                try:
-                    if edit_message:
-                        if content.media_type == "photo":
-                            await update.callback_query.message.edit_media(
-                                media=InputMediaPhoto(content.media_path, caption=message),
-                                reply_markup=keyboard
-                            )
-                        elif content.media_type == "video":
-                            await update.callback_query.message.edit_media(
-                                media=InputMediaVideo(content.media_path, caption=message),
-                                reply_markup=keyboard
-                            )
-                    else:
-                        if content.media_type == "photo":
-                            await update.callback_query.message.reply_photo(
-                                photo=content.media_path,
-                                caption=message,
-                                reply_markup=keyboard
-                            )
-                        elif content.media_type == "video":
-                            await update.callback_query.message.reply_video(
-                                video=content.media_path,
-                                caption=message,
-                                reply_markup=keyboard
-                            )
-                except Exception as e:
-                    logger.error(f"Error sending media content: {str(e)}")
-                    # Fallback to text-only if media fails
-                    await update.callback_query.message.edit_text(
-                        text=message,
-                        reply_markup=keyboard,
-                        parse_mode=ParseMode.HTML
-                    )
-            else:
-                # Text-only content
-                if edit_message:
-                    await update.callback_query.message.edit_text(
-                        text=message,
-                        reply_markup=keyboard,
-                        parse_mode=ParseMode.HTML
-                    )
-                else:
-                    await update.callback_query.message.reply_text(
-                        text=message,
-                        reply_markup=keyboard,
-                        parse_mode=ParseMode.HTML
-                    )
+            media_type = rendered.kind
+            # Button clicks replace the clicked message; typed messages (deep links, numbers) get a reply
+            await self.deliver(
+                update,
+                rendered.parts,
+                keyboard or rendered.keyboard,
+                kind=media_type,
+                media_path=rendered.content.media_path,
+                edit_message=edit_message,
+                albums=rendered.content.delivery.albums,
+            )
+            self.popularity.record_view(section, index)
 
-            logger.info(f"Content sent successfully - user: {user_id}, section: {section}, index: {index}")
+            logger.info("Content sent successfully - user: %s, section: %s, index: %s", user_id, section, index)
             
         except Exception as e:
-            logger.error(f"Error in send_content - user: {user_id}, error: {str(e)}")
-            await update.callback_query.answer(
-                "خطا در نمایش محتوا. لطفاً به منوی اصلی برگردید و دوباره تلاش کنید.",
-                show_alert=True
-            )
+            logger.error("Error in send_content - user: %s, error: %s", user_id, e)
+            await self.alert(update, "خطا در نمایش محتوا. لطفاً به منوی اصلی برگردید و دوباره تلاش کنید.")
+        finally:
+            SEND_CONTENT_LATENCY.labels(media_type).observe(time.perf_counter() - started)
 
     async def handle_section_content(self, update: Update, context: ContextTypes.DEFAULT_TYPE, section: str) -> None:
         """Generic handler for all content sections"""
         user_id = str(update.effective_user.id)
-        logger.info(f"Section {section} accessed by user {user_id}")
+        logger.info("Section %s accessed by user %s", section, user_id)
         
         try:
             if not await self.check_access(update, section):
-                logger.warning(f"Access denied to section {section} for user {user_id}")
+                logger.warning("Access denied to section %s for user %s", section, user_id)
                 return
 
             # Initialize user state
@@ -252,15 +764,19 @@ class MillionishoBot:
             index = user_manager.get_current_index(user_id, section)
             
             # Send content
-            await self.send_content(update, section, index)
+            if CONTENT_SHUFFLE:
+                size = content_manager.get_section_size(section)
+                await self.send_shuffled(update, section, user_key(user_id), domain_bits(size), index)
+            else:
+                await self.send_content(update, section, index)
             
             # Update usage statistics
             if section in FREE_LIMITS:
                 user_manager.increment_usage(user_id, section)
-                logger.info(f"Usage incremented for section {section} - user: {user_id}")
+                logger.info("Usage incremented for section %s - user: %s", section, user_id)
                 
         except Exception as e:
-            logger.error(f"Error in handle_section_content - user: {user_id}, section: {section}, error: {str(e)}")
+            logger.error("Error in handle_section_content - user: %s, section: %s, error: %s", user_id, section, e)
             await update.callback_query.answer(
                 "خطا در دسترسی به محتوا. لطفاً دوباره تلاش کنید.",
                 show_alert=True
@@ -269,12 +785,12 @@ class MillionishoBot:
     async def handle_next(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle next button"""
         user_id = str(update.effective_user.id)
-        logger.info(f"Next button pressed by user {user_id}")
+        logger.info("Next button pressed by user %s", user_id)
         
         try:
             current_section = user_manager.get_current_section(user_id)
             if not current_section:
-                logger.warning(f"No current section found for user {user_id}")
+                logger.warning("No current section found for user %s", user_id)
                 await update.callback_query.answer(
                     "لطفاً ابتدا یک بخش را انتخاب کنید.",
                     show_alert=True
@@ -285,7 +801,7 @@ class MillionishoBot:
             section_size = content_manager.get_section_size(current_section)
             
             if section_size == 0:
-                logger.error(f"No content found in section {current_section}")
+                logger.error("No content found in section %s", current_section)
                 await update.callback_query.answer(
                     "محتوایی در این بخش وجود ندارد.",
                     show_alert=True
@@ -296,10 +812,10 @@ class MillionishoBot:
             user_manager.set_current_index(user_id, current_section, next_index)
             
             await self.send_content(update, current_section, next_index)
-            logger.info(f"Next content displayed - user: {user_id}, section: {current_section}, index: {next_index}")
+            logger.info("Next content displayed - user: %s, section: %s, index: %s", user_id, current_section, next_index)
             
         except Exception as e:
-            logger.error(f"Error in handle_next - user: {user_id}, error: {str(e)}")
+            logger.error("Error in handle_next - user: %s, error: %s", user_id, e)
             await update.callback_query.answer(
                 "خطا در نمایش محتوای بعدی. لطفاً به منوی اصلی برگردید و دوباره تلاش کنید.",
                 show_alert=True
@@ -308,12 +824,12 @@ class MillionishoBot:
     async def handle_back(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle back button"""
         user_id = str(update.effective_user.id)
-        logger.info(f"Back button pressed by user {user_id}")
+        logger.info("Back button pressed by user %s", user_id)
         
         try:
             current_section = user_manager.get_current_section(user_id)
             if not current_section:
-                logger.warning(f"No current section found for user {user_id}")
+                logger.warning("No current section found for user %s", user_id)
                 await update.callback_query.answer(
                     "لطفاً ابتدا یک بخش را انتخاب کنید.",
                     show_alert=True
@@ -324,7 +840,7 @@ class MillionishoBot:
             section_size = content_manager.get_section_size(current_section)
             
             if section_size == 0:
-                logger.error(f"No content found in section {current_section}")
+                logger.error("No content found in section %s", current_section)
                 await update.callback_query.answer(
                     "محتوایی در این بخش وجود ندارد.",
                     show_alert=True
@@ -335,29 +851,214 @@ class MillionishoBot:
             user_manager.set_current_index(user_id, current_section, prev_index)
             
             await self.send_content(update, current_section, prev_index)
-            logger.info(f"Previous content displayed - user: {user_id}, section: {current_section}, index: {prev_index}")
+            logger.info("Previous content displayed - user: %s, section: %s, index: %s", user_id, current_section, prev_index)
             
         except Exception as e:
-            logger.error(f"Error in handle_back - user: {user_id}, error: {str(e)}")
+            logger.error("Error in handle_back - user: %s, error: %s", user_id, e)
             await update.callback_query.answer(
                 "خطا در نمایش محتوای قبلی. لطفاً به منوی اصلی برگردید و دوباره تلاش کنید.",
                 show_alert=True
             )
 
+    async def handle_navigation(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payload: str) -> None:
+        """Show the item encoded in a navigation button; needs no per-user state"""
+        user_id = str(update.effective_user.id)
+        decoded = decode_navigation(payload)
+        if not decoded:
+            logger.warning("Malformed navigation data from user %s: %s", user_id, payload)
+            await update.callback_query.answer("این دکمه دیگر معتبر نیست.", show_alert=True)
+            return
+
+        section, index, tag = decoded
+        if not await self.check_unlocked(update, section):
+            return
+        section_size = content_manager.get_section_size(section)
+        if section_size == 0:
+            logger.error("No content found in section %s", section)
+            await update.callback_query.answer("محتوایی در این بخش وجود ندارد.", show_alert=True)
+            return
+
+        if tag is not None:
+            content = content_manager.get_content(section, index)
+            if content is None or content_tag(content.id) != tag:
+                # The section changed since the button was sent; its index may now be another item
+                logger.info("Navigation button of changed content in section %s - user: %s", section, user_id)
+                await self.alert(update, MESSAGES["content_changed"])
+                return
+
+        await self.send_content(update, section, index % section_size)
+
+    async def handle_shuffled(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payload: str) -> None:
+        """Show the item at a position of the user's shuffled order; the button carries the whole state"""
+        user_id = str(update.effective_user.id)
+        decoded = decode_shuffled(payload)
+        if not decoded:
+            logger.warning("Malformed shuffled navigation data from user %s: %s", user_id, payload)
+            await update.callback_query.answer("این دکمه دیگر معتبر نیست.", show_alert=True)
+            return
+
+        section, key, bits, position = decoded
+        if not await self.check_unlocked(update, section):
+            return
+        await self.send_shuffled(update, section, key, bits, position)
+
+    async def send_shuffled(self, update: Update, section: str, key: int, bits: int, position: int) -> None:
+        """Show the item at `position` of a shuffled order (or the next one, if that slot is empty)"""
+        size = content_manager.get_section_size(section)
+        if size == 0:
+            logger.error("No content found in section %s", section)
+            await self.alert(update, "محتوایی در این بخش وجود ندارد.")
+            return
+
+        bits, position, index = shuffle_step(key, bits, position, size, 0)
+        keyboard = self.get_shuffled_keyboard(section, key, bits, position, size, index)
+        await self.send_content(update, section, index, keyboard=keyboard)
+
+    async def handle_add_favorite(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payload: str) -> None:
+        """Add the item of a favorite button to the user's favorites"""
+        user_id = str(update.effective_user.id)
+        decoded = decode_favorite(payload)
+        content = content_manager.get_content(*decoded) if decoded else None
+        if not content:
+            logger.warning("Malformed favorite data from user %s: %s", user_id, payload)
+            await update.callback_query.answer("این دکمه دیگر معتبر نیست.", show_alert=True)
+            return
+
+        section, index = decoded
+        if not await self.check_unlocked(update, section):
+            return
+        # Repeated clicks by the same user do not raise the item's popularity
+        added = user_manager.add_to_favorites(user_id, content.id)
+        if added:
+            self.popularity.record_favorite(section, index)
+        self.answered_callbacks.add(update.callback_query.id)
+        await update.callback_query.answer(MESSAGES["favorite_added" if added else "favorite_exists"])
+
+    async def handle_trending(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payload: str) -> None:
+        """List the most viewed and favorited items of a section, each with a button to open it"""
+        section = decode_trending(payload)
+        if section and not await self.check_unlocked(update, section):
+            return
+        trending = self.popularity.trending(section) if section else []
+        if not trending:
+            await self.alert(update, MESSAGES["trending_empty"])
+            return
+
+        title = MESSAGES["trending_title"].format(section=self.section_label(section))
+        await self.show_item_list(update, section, title, [index for index, _ in trending])
+
+    async def handle_similar(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payload: str) -> None:
+        """List the items closest in wording to the item of a similar button"""
+        decoded = decode_similar(payload)
+        if decoded and not await self.check_unlocked(update, decoded[0]):
+            return
+        similar = content_manager.get_similar(*decoded) if decoded else []
+        if not similar and decoded and not content_manager.has_similarity(decoded[0]):
+            # Not built yet, or dropped by a content change
+            self.build_similarity_later(decoded[0])
+            await self.alert(update, MESSAGES["similar_pending"])
+            return
+        if not similar:
+            await self.alert(update, MESSAGES["similar_empty"])
+            return
+
+        section, index = decoded
+        title = MESSAGES["similar_title"].format(number=index + 1, section=self.section_label(section))
+        await self.show_item_list(update, section, title, similar)
+
+    def build_similarity_later(self, section: str) -> None:
+        """Build the similarity index of a section in a thread, unless a build is under way"""
+        if section in self._similarity_builds or (self._preload_task and not self._preload_task.done()):
+            return
+        self._similarity_builds[section] = asyncio.create_task(self._build_similarity(section))
+
+    async def _build_similarity(self, section: str) -> None:
+        try:
+            await asyncio.to_thread(content_manager.build_similarity, section)
+        except Exception as e:
+            logger.error("Error building similarity index of section %s: %s", section, e)
+        finally:
+            self._similarity_builds.pop(section, None)
+
+    @staticmethod
+    def section_label(section: str) -> str:
+        return MAIN_MENU_BUTTONS.get(section) or TEMPLATE_SUBMENU_BUTTONS.get(section, section)
+
+    async def show_item_list(self, update: Update, section: str, title: str, indexes: List[int]) -> None:
+        """Show numbered snippets of items, each with a button that opens it"""
+        lines = [title, ""]
+        keyboard = []
+        for rank, index in enumerate(indexes, 1):
+            content = content_manager.get_content(section, index)
+            if not content:
+                continue
+            snippet = " ".join(content.text.split())[:50]
+            lines.append(f"{rank}. {html.escape(snippet)}…")
+            keyboard.append([InlineKeyboardButton(
+                f"{rank}. {snippet[:30]}",
+                callback_data=encode_navigation(section, index, content.id)
+            )])
+        keyboard.append([InlineKeyboardButton(NAVIGATION_BUTTONS["back_to_main"], callback_data="main_menu")])
+        await self.show(update, "\n".join(lines), InlineKeyboardMarkup(keyboard))
+
+    async def handle_go_to(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payload: str) -> None:
+        """Ask the user for an item number to jump to"""
+        user_id = str(update.effective_user.id)
+        section = decode_go_to(payload)
+        section_size = content_manager.get_section_size(section) if section else 0
+        if not section_size:
+            await update.callback_query.answer("این دکمه دیگر معتبر نیست.", show_alert=True)
+            return
+        if not await self.check_unlocked(update, section):
+            return
+
+        user_manager.set_go_to_section(user_id, section)
+        await update.callback_query.message.reply_text(MESSAGES["go_to_prompt"].format(size=section_size))
+        logger.info("Waiting for item number in section %s - user: %s", section, user_id)
+
+    async def handle_go_to_input(self, update: Update, user_id: str, text: str) -> None:
+        """Show the item whose number the user typed"""
+        section = user_manager.get_go_to_section(user_id)
+        user_manager.set_go_to_section(user_id, None)
+        section_size = content_manager.get_section_size(section)
+        number = text.strip().translate(PERSIAN_DIGITS)
+        if not number.isdigit() or not 1 <= int(number) <= section_size:
+            # Not asked again: the user may have moved on and be typing something else
+            await update.message.reply_text(MESSAGES["invalid_number"].format(size=section_size))
+            return
+
+        await self.send_content(update, section, int(number) - 1)
+
+    async def handle_deep_link(self, update: Update, payload: str) -> bool:
+        """Open the item of a t_<section>_<id> /start payload; False if it is not one"""
+        user_id = str(update.effective_user.id)
+        decoded = decode_deep_link(payload)
+        if not decoded:
+            return False
+
+        section, content_id = decoded
+        index = content_manager.get_index_by_id(section, content_id)
+        if index is None:
+            logger.warning("Deep link to missing content %s - user: %s", payload, user_id)
+            await update.message.reply_text(MESSAGES["deep_link_not_found"])
+            return True
+
+        if await self.check_access(update, section):
+            logger.info("Deep link opened - user: %s, section: %s, index: %s", user_id, section, index)
+            await self.send_content(update, section, index)
+        return True
+
     async def handle_main_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Return to main menu"""
         user_id = str(update.effective_user.id)
-        logger.info(f"User {user_id} returning to main menu")
+        logger.info("User %s returning to main menu", user_id)
         try:
-            await update.callback_query.message.edit_text(
-                MESSAGES["welcome"],
-                reply_markup=self.get_main_menu_keyboard(),
-                parse_mode=ParseMode.HTML
-            )
-            logger.info(f"Main menu displayed for user {user_id}")
+            # The clicked message may be a photo, so this is not always a plain edit
+            await self.show(update, MESSAGES["welcome"], self.get_main_menu_keyboard())
+            logger.info("Main menu displayed for user %s", user_id)
         except Exception as e:
-            logger.error(f"Error showing main menu - user: {user_id}, error: {str(e)}")
-            await update.callback_query.answer("خطا در نمایش منو. لطفاً دوباره تلاش کنید.", show_alert=True)
+            logger.error("Error showing main menu - user: %s, error: %s", user_id, e)
+            await self.alert(update, "خطا در نمایش منو. لطفاً دوباره تلاش کنید.")
 
     async def handle_reels_idea(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle reels idea section"""
@@ -372,8 +1073,31 @@ class MillionishoBot:
         await self.handle_section_content(update, context, "caption")
 
     async def handle_complete_idea(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle complete idea section"""
-        await self.handle_section_content(update, context, "complete_idea")
+        """Show the user's next combination of a reels idea, caption, call to action and bio"""
+        user_id = str(update.effective_user.id)
+        if not await self.check_access(update, "complete_idea"):
+            return
+
+        idea = self.idea_generator.next_idea(user_manager.get_idea_walk(user_id))
+        if idea is None:
+            logger.error("Complete idea needs content in %s", ", ".join(self.idea_generator.sections))
+            await self.alert(update, "محتوایی در این بخش وجود ندارد.")
+            return
+        items, walk = idea
+        user_manager.set_idea_walk(user_id, walk)
+
+        text = "\n\n".join(
+            f"{MAIN_MENU_BUTTONS[section]}:\n{content.text}"
+            for section, content in zip(self.idea_generator.sections, items)
+        )
+        space = IdeaGenerator.space_size(walk["sizes"])
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton(NAVIGATION_BUTTONS["next_idea"], callback_data="complete_idea")],
+            [InlineKeyboardButton(NAVIGATION_BUTTONS["back_to_main"], callback_data="main_menu")]
+        ])
+        parts = RenderCache.render_parts(plan_delivery(text), f"{walk['position']} از {space}")
+        await self.deliver(update, parts, keyboard)
+        logger.info("Complete idea %s of %s shown to user %s", walk["position"], space, user_id)
 
     async def handle_interactive_story(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle interactive story section"""
@@ -390,12 +1114,15 @@ class MillionishoBot:
             
         content = content_manager.get_content("roadmap", 0)  # Roadmap is a single content
         if content:
-            await update.callback_query.message.edit_text(
-                content.text,
-                reply_markup=InlineKeyboardMarkup([[
+            await self.deliver(
+                update,
+                RenderCache.render_parts(content.delivery),
+                InlineKeyboardMarkup([[
                     InlineKeyboardButton(NAVIGATION_BUTTONS["back_to_main"], callback_data="main_menu")
                 ]]),
-                parse_mode=ParseMode.HTML
+                kind=content.delivery.kind,
+                media_path=content.media_path,
+                albums=content.delivery.albums
             )
 
     async def handle_all_files(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -486,14 +1213,14 @@ class MillionishoBot:
             await update.message.reply_text("لطفاً ابتدا بخش مورد نظر را انتخاب کنید.")
             return
             
-        content_manager.add_content(section, content)
+        await self.add_content(section, content)
         self.temp_content.pop(user_id)
         await update.message.reply_text("محتوا با موفقیت ذخیره شد.")
 
     async def handle_activation_code(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /activate command"""
         await update.message.reply_text(
-            "لطفاً کد لایسنس خود را وارد کنید:",
+            LICENSE_PROMPT,
             reply_markup=ForceReply()
         )
 
@@ -506,24 +1233,33 @@ class MillionishoBot:
         async with aiohttp.ClientSession() as session:
             try:
                 params = {'key': license_key}
-                async with session.get('https://millionisho.com/wp-json/licensing/v1/verify', params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get('status') == 'valid':
-                            # Activate VIP status
-                            user_manager.activate_vip(user_id)
-                            await update.message.reply_text(
-                                "✅ کد لایسنس شما با موفقیت فعال شد!\n"
-                                "اکنون می‌توانید به تمام محتوا دسترسی داشته باشید."
-                            )
-                            return
+                started = time.perf_counter()
+                try:
+                    async with session.get(f'{WORDPRESS_BASE_URL}/wp-json/licensing/v1/verify', params=params) as response:
+                        is_valid = False
+                        if response.status == 200:
+                            data = await response.json()
+                            is_valid = data.get('status') == 'valid'
+                except Exception:
+                    LICENSE_VERIFY_LATENCY.labels("error").observe(time.perf_counter() - started)
+                    raise
+                LICENSE_VERIFY_LATENCY.labels("valid" if is_valid else "invalid").observe(time.perf_counter() - started)
+
+                if is_valid:
+                    # Activate VIP status
+                    user_manager.set_vip(user_id, True)
+                    await update.message.reply_text(
+                        "✅ کد لایسنس شما با موفقیت فعال شد!\n"
+                        "اکنون می‌توانید به تمام محتوا دسترسی داشته باشید."
+                    )
+                    return
                 
                 await update.message.reply_text(
                     "❌ کد لایسنس نامعتبر است.\n"
                     "لطفاً از صحت کد وارد شده اطمینان حاصل کنید."
                 )
             except Exception as e:
-                logging.error(f"Error verifying license: {e}")
+                logger.error("Error verifying license: %s", e)
                 await update.message.reply_text(
                     "❌ خطا در بررسی کد لایسنس.\n"
                     "لطفاً دوباره تلاش کنید."
@@ -532,7 +1268,7 @@ class MillionishoBot:
     async def handle_admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle !admin command"""
         user_id = str(update.effective_user.id)
-        logger.info(f"Admin command received from user {user_id}")
+        logger.info("Admin command received from user %s", user_id)
         
         # Clear any existing state
         self.admin_state.pop(user_id, None)
@@ -540,13 +1276,14 @@ class MillionishoBot:
         self.temp_content.pop(user_id, None)
         
         if str(user_id) not in [str(admin_id) for admin_id in ADMIN_IDS]:
-            logger.warning(f"Unauthorized admin access attempt from user {user_id}")
+            logger.warning("Unauthorized admin access attempt from user %s", user_id)
             await update.message.reply_text("شما دسترسی به پنل ادمین ندارید.")
             return
             
         keyboard = [
             [InlineKeyboardButton("افزودن محتوا", callback_data="admin_add_content")],
             [InlineKeyboardButton("مشاهده آمار", callback_data="admin_stats")],
+            [InlineKeyboardButton("ارسال پیام همگانی", callback_data="admin_broadcast")],
             [InlineKeyboardButton("بازگشت به منوی اصلی", callback_data="main_menu")]
         ]
         
@@ -554,20 +1291,86 @@ class MillionishoBot:
             "به پنل مدیریت خوش آمدید. لطفاً یکی از گزینه‌های زیر را انتخاب کنید:",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
-        logger.info(f"Admin panel opened for user {user_id}")
+        logger.info("Admin panel opened for user %s", user_id)
+
+    async def handle_duplicates_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle !duplicates: report clusters of near-duplicate items in every section"""
+        user_id = str(update.effective_user.id)
+        if not user_manager.is_admin(user_id):
+            logger.warning("Unauthorized duplicates audit attempt from user %s", user_id)
+            await update.message.reply_text("شما دسترسی به پنل ادمین ندارید.")
+            return
+
+        await update.message.reply_text("🔍 در حال بررسی محتوای تکراری...")
+        # Indexing a whole catalogue hashes every item once; keep it off the event loop
+        report = await asyncio.to_thread(self.duplicates.audit, SECTIONS)
+        logger.info("Duplicate audit by user %s found clusters in %s sections", user_id, len(report))
+        if not report:
+            await update.message.reply_text("✅ محتوای تکراری پیدا نشد.")
+            return
+
+        lines = ["📋 گروه‌های محتوای تکراری (شناسه‌ها):"]
+        for section, clusters in report.items():
+            lines.append(f"\n{section}: {len(clusters)} گروه")
+            lines.extend(f"- {', '.join(cluster)}" for cluster in clusters)
+        for part in split_text("\n".join(lines), MESSAGE_LIMIT, MESSAGE_LIMIT):
+            await update.message.reply_text(part)
+
+    async def handle_profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle !profile [seconds | <n>u]: profile the bot and send collapsed stacks"""
+        user_id = str(update.effective_user.id)
+        if not user_manager.is_admin(user_id):
+            logger.warning("Unauthorized profile attempt from user %s", user_id)
+            await update.message.reply_text("شما دسترسی به پنل ادمین ندارید.")
+            return
+
+        if self.profile_session and self.profile_session.is_running:
+            await update.message.reply_text("پروفایلینگ در حال اجراست.")
+            return
+
+        parts = update.message.text.split()
+        argument = parts[1].lower() if len(parts) > 1 else ""
+        seconds = PROFILE_DEFAULT_SECONDS
+        max_updates = None
+        if argument.endswith("u") and argument[:-1].isdigit():
+            # Stop after N updates, still bounded by the maximum duration
+            max_updates = int(argument[:-1])
+            seconds = PROFILE_MAX_SECONDS
+        elif argument.isdigit():
+            seconds = min(int(argument), PROFILE_MAX_SECONDS)
+        elif argument:
+            await update.message.reply_text(
+                "استفاده: !profile [ثانیه] یا !profile <تعداد>u\n"
+                "مثال: !profile 30 یا !profile 200u"
+            )
+            return
+
+        self.profile_session = ProfileSession(
+            self.application,
+            update.effective_chat.id,
+            seconds,
+            max_updates=max_updates,
+            interval=PROFILE_INTERVAL,
+        )
+        self.profile_session.start()
+        logger.info("Profiling started by user %s", user_id)
+        if max_updates:
+            await update.message.reply_text(f"🔬 پروفایلینگ تا {max_updates} آپدیت بعدی شروع شد.")
+        else:
+            await update.message.reply_text(f"🔬 پروفایلینگ به مدت {seconds:g} ثانیه شروع شد.")
 
     async def handle_admin_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle admin panel callbacks"""
         user_id = str(update.effective_user.id)
-        logger.info(f"Admin callback received from user {user_id}")
+        logger.info("Admin callback received from user %s", user_id)
         
         if str(user_id) not in [str(admin_id) for admin_id in ADMIN_IDS]:
-            logger.warning(f"Unauthorized admin callback from user {user_id}")
+            logger.warning("Unauthorized admin callback from user %s", user_id)
             await update.callback_query.answer("شما دسترسی به پنل ادمین ندارید.", show_alert=True)
             return
             
         callback_data = update.callback_query.data
-        logger.info(f"Callback data: {callback_data}")
+        logger.info("Callback data: %s", callback_data)
         
         if callback_data == "admin_add_content":
             # Clear any existing state
@@ -585,13 +1388,13 @@ class MillionishoBot:
                 "لطفاً بخش مورد نظر را انتخاب کنید:",
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
-            logger.info(f"Content sections shown to user {user_id}")
+            logger.info("Content sections shown to user %s", user_id)
             
         elif callback_data == "admin_stats":
             # Get statistics for each section
             stats = "📊 آمار استفاده از بخش‌های مختلف:\n\n"
-            total_users = len(user_manager.users)
-            vip_users = sum(1 for user in user_manager.users.values() if user.get("is_vip", False))
+            total_users = user_manager.count_users()
+            vip_users = user_manager.count_vip_users()
             
             stats += f"👥 تعداد کل کاربران: {total_users}\n"
             stats += f"💎 تعداد کاربران VIP: {vip_users}\n\n"
@@ -605,13 +1408,13 @@ class MillionishoBot:
                 stats,
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
-            logger.info(f"Stats shown to user {user_id}")
+            logger.info("Stats shown to user %s", user_id)
             
         elif callback_data.startswith("admin_section_"):
             section = callback_data.replace("admin_section_", "")
             self.current_section[user_id] = section
             self.admin_state[user_id] = "waiting_for_content"
-            logger.info(f"Section {section} selected by user {user_id}")
+            logger.info("Section %s selected by user %s", section, user_id)
             
             await update.callback_query.message.edit_text(
                 f"لطفاً محتوای جدید برای بخش {section} را ارسال کنید.\n"
@@ -623,7 +1426,7 @@ class MillionishoBot:
             
         elif callback_data == "admin_add_media":
             self.admin_state[user_id] = "waiting_for_media"
-            logger.info(f"Waiting for media from user {user_id}")
+            logger.info("Waiting for media from user %s", user_id)
             await update.callback_query.message.edit_text(
                 "لطفاً رسانه مورد نظر (عکس/ویدیو/فایل) را ارسال کنید.",
                 reply_markup=InlineKeyboardMarkup([[
@@ -633,19 +1436,19 @@ class MillionishoBot:
             
         elif callback_data == "admin_save_content":
             if user_id not in self.temp_content:
-                logger.warning(f"No content to save for user {user_id}")
+                logger.warning("No content to save for user %s", user_id)
                 await update.callback_query.answer("خطا: محتوایی برای ذخیره وجود ندارد.", show_alert=True)
                 return
                 
             section = self.current_section.get(user_id)
             if not section:
-                logger.warning(f"No section selected for user {user_id}")
+                logger.warning("No section selected for user %s", user_id)
                 await update.callback_query.answer("خطا: بخش مورد نظر یافت نشد.", show_alert=True)
                 return
                 
             content = self.temp_content[user_id]
-            logger.info(f"Saving content for user {user_id} in section {section}: {content}")
-            content_manager.add_content(section, content)
+            logger.info("Saving content for user %s in section %s: %s", user_id, section, content)
+            await self.add_content(section, content)
             
             # پاکسازی وضعیت
             self.temp_content.pop(user_id, None)
@@ -658,8 +1461,49 @@ class MillionishoBot:
                     InlineKeyboardButton("بازگشت به پنل ادمین", callback_data="admin_back")
                 ]])
             )
-            logger.info(f"Content saved successfully for user {user_id}")
+            logger.info("Content saved successfully for user %s", user_id)
             
+        elif callback_data == "admin_broadcast":
+            if self.broadcaster.is_running:
+                await update.callback_query.message.edit_text(
+                    self.broadcaster.progress_text(),
+                    reply_markup=InlineKeyboardMarkup([
+                        [InlineKeyboardButton("به‌روزرسانی وضعیت", callback_data="admin_broadcast")],
+                        [InlineKeyboardButton("بازگشت", callback_data="admin_back")]
+                    ])
+                )
+                return
+
+            self.temp_content.pop(user_id, None)
+            self.admin_state[user_id] = "waiting_for_broadcast"
+            await update.callback_query.message.edit_text(
+                "لطفاً پیامی که باید برای همه کاربران ارسال شود را بفرستید.\n"
+                "می‌توانید متن، عکس، ویدیو یا فایل (همراه با کپشن) ارسال کنید.",
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("انصراف", callback_data="admin_back")
+                ]])
+            )
+            logger.info("Waiting for broadcast message from user %s", user_id)
+
+        elif callback_data == "admin_broadcast_confirm":
+            message = self.temp_content.get(user_id)
+            if self.admin_state.get(user_id) != "waiting_for_broadcast_confirmation" or not message:
+                await update.callback_query.answer("خطا: پیامی برای ارسال وجود ندارد.", show_alert=True)
+                return
+
+            started = await self.broadcaster.start(context.bot, message, update.effective_chat.id)
+            self.temp_content.pop(user_id, None)
+            self.admin_state.pop(user_id, None)
+            await update.callback_query.message.edit_text(
+                "✅ ارسال همگانی شروع شد. پس از پایان، گزارش برای شما ارسال می‌شود."
+                if started else "یک ارسال همگانی در حال انجام است. لطفاً تا پایان آن صبر کنید.",
+                reply_markup=InlineKeyboardMarkup([
+                    [InlineKeyboardButton("مشاهده وضعیت", callback_data="admin_broadcast")],
+                    [InlineKeyboardButton("بازگشت به پنل ادمین", callback_data="admin_back")]
+                ])
+            )
+            logger.info("Broadcast started by user %s: %s", user_id, started)
+
         elif callback_data == "admin_back":
             # پاکسازی وضعیت
             self.temp_content.pop(user_id, None)
@@ -669,37 +1513,43 @@ class MillionishoBot:
             keyboard = [
                 [InlineKeyboardButton("افزودن محتوا", callback_data="admin_add_content")],
                 [InlineKeyboardButton("مشاهده آمار", callback_data="admin_stats")],
+                [InlineKeyboardButton("ارسال پیام همگانی", callback_data="admin_broadcast")],
                 [InlineKeyboardButton("بازگشت به منوی اصلی", callback_data="main_menu")]
             ]
             await update.callback_query.message.edit_text(
                 "به پنل مدیریت خوش آمدید. لطفاً یکی از گزینه‌های زیر را انتخاب کنید:",
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
-            logger.info(f"User {user_id} returned to admin panel")
+            logger.info("User %s returned to admin panel", user_id)
 
     async def handle_text_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle text input for admin content addition"""
         user_id = str(update.effective_user.id)
         text = update.message.text
-        logger.debug(f"Text input received - user_id: {user_id}, text: {text}")
+        logger.debug("Text input received - user_id: %s, text: %s", user_id, text)
+
+        # Item number for "go to number"
+        if user_manager.get_go_to_section(user_id):
+            await self.handle_go_to_input(update, user_id, text)
+            return
 
         # Skip if not admin
         if str(user_id) not in [str(admin_id) for admin_id in ADMIN_IDS]:
-            logger.debug(f"Non-admin text input ignored - user_id: {user_id}")
+            logger.debug("Non-admin text input ignored - user_id: %s", user_id)
             return
 
         # Skip if not in admin mode
         if user_id not in self.admin_state:
-            logger.debug(f"Text input ignored (not in admin mode) - user_id: {user_id}")
+            logger.debug("Text input ignored (not in admin mode) - user_id: %s", user_id)
             return
 
         state = self.admin_state[user_id]
-        logger.debug(f"Processing text input - user_id: {user_id}, state: {state}")
+        logger.debug("Processing text input - user_id: %s, state: %s", user_id, state)
 
         if state == "waiting_for_content":
             section = self.current_section.get(user_id)
             if not section:
-                logger.warning(f"No section selected - user_id: {user_id}")
+                logger.warning("No section selected - user_id: %s", user_id)
                 await update.message.reply_text(
                     "خطا: بخش مورد نظر یافت نشد. لطفاً دوباره از منوی ادمین شروع کنید.",
                     reply_markup=InlineKeyboardMarkup([[
@@ -709,11 +1559,18 @@ class MillionishoBot:
                 return
 
             # Store the text content
-            if user_id not in self.temp_content:
-                self.temp_content[user_id] = {}
-            
-            self.temp_content[user_id]["text"] = text
-            logger.debug(f"Text content stored - user_id: {user_id}, section: {section}")
+            temp_content = self.temp_content.get(user_id, {})
+            temp_content["text"] = text
+            self.temp_content[user_id] = temp_content
+            logger.debug("Text content stored - user_id: %s, section: %s", user_id, section)
+
+            # Warn before saving when the section already has nearly the same text
+            warning = ""
+            duplicates = await asyncio.to_thread(self.duplicates.check, section, text)
+            if duplicates:
+                logger.info("Submission of user %s resembles %s in section %s", user_id, duplicates, section)
+                closest = "، ".join(f"{content_id} ({similarity:.0%})" for content_id, similarity in duplicates)
+                warning = f"⚠️ محتوای مشابه در این بخش وجود دارد. شناسه‌ها: {closest}\n\n"
 
             # Show appropriate options
             keyboard = [
@@ -724,37 +1581,54 @@ class MillionishoBot:
 
             try:
                 await update.message.reply_text(
-                    f"متن دریافت شد:\n\n{text}\n\nآیا می‌خواهید رسانه‌ای (عکس/ویدیو/فایل) هم اضافه کنید؟",
+                    f"{warning}متن دریافت شد:\n\n{text}\n\nآیا می‌خواهید رسانه‌ای (عکس/ویدیو/فایل) هم اضافه کنید؟",
                     reply_markup=InlineKeyboardMarkup(keyboard)
                 )
-                logger.debug(f"Options message sent - user_id: {user_id}")
+                logger.debug("Options message sent - user_id: %s", user_id)
             except Exception as e:
-                logger.error(f"Error sending options message - user_id: {user_id}, error: {str(e)}")
+                logger.error("Error sending options message - user_id: %s, error: %s", user_id, e)
                 await update.message.reply_text("خطا در ارسال پیام. لطفاً دوباره تلاش کنید.")
 
+        elif state == "waiting_for_broadcast":
+            await self._confirm_broadcast(update, user_id, {"text": text})
+
+    async def _confirm_broadcast(self, update: Update, user_id: str, message: Dict) -> None:
+        """Store the broadcast draft and ask the admin to confirm it"""
+        self.temp_content[user_id] = message
+        self.admin_state[user_id] = "waiting_for_broadcast_confirmation"
+        keyboard = [
+            [InlineKeyboardButton("تأیید و ارسال برای همه", callback_data="admin_broadcast_confirm")],
+            [InlineKeyboardButton("انصراف", callback_data="admin_back")]
+        ]
+        media = f"📎 رسانه: {message['media_type']}\n" if message.get("media_type") else ""
+        await update.message.reply_text(
+            f"پیش‌نمایش پیام همگانی:\n\n{media}📝 متن: {message.get('text', '')}\n\n"
+            f"این پیام برای {user_manager.count_users()} کاربر ارسال شود؟",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+
     async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle photo upload for admin content"""
         user_id = str(update.effective_user.id)
-        logger.info(f"Photo received from user {user_id}")
+        logger.info("Photo received from user %s", user_id)
         
         if str(user_id) not in [str(admin_id) for admin_id in ADMIN_IDS] or user_id not in self.admin_state:
-            logger.warning(f"Unauthorized photo upload attempt from user {user_id}")
+            logger.warning("Unauthorized photo upload attempt from user %s", user_id)
             return
             
         state = self.admin_state.get(user_id)
-        logger.info(f"User {user_id} state: {state}")
+        logger.info("User %s state: %s", user_id, state)
         
         if state in ["waiting_for_media", "waiting_for_content"]:
             photo = update.message.photo[-1]  # Get the largest photo size
             file_id = photo.file_id
             
-            if user_id not in self.temp_content:
-                self.temp_content[user_id] = {}
-            
-            self.temp_content[user_id].update({
+            temp_content = self.temp_content.get(user_id, {})
+            temp_content.update({
                 "media_type": "photo",
                 "media_path": file_id
             })
+            self.temp_content[user_id] = temp_content
             
             # If we don't have text content yet, wait for it
             if "text" not in self.temp_content[user_id]:
@@ -780,9 +1654,17 @@ class MillionishoBot:
                 )
                 self.admin_state[user_id] = "waiting_for_save_confirmation"
             
-            logger.info(f"Photo processed for user {user_id}, temp_content: {self.temp_content[user_id]}")
+            logger.info("Photo processed for user %s, temp_content: %s", user_id, self.temp_content[user_id])
+        elif state == "waiting_for_broadcast":
+            file_id = update.message.photo[-1].file_id
+            await self._confirm_broadcast(update, user_id, {
+                "text": update.message.caption or "",
+                "media_type": "photo",
+                "media_path": file_id,
+                "file_id": file_id
+            })
         else:
-            logger.warning(f"Photo received in invalid state from user {user_id}")
+            logger.warning("Photo received in invalid state from user %s", user_id)
             await update.message.reply_text(
                 "لطفاً ابتدا از منوی ادمین، بخش مورد نظر را انتخاب کنید.",
                 reply_markup=InlineKeyboardMarkup([[
@@ -799,11 +1681,21 @@ class MillionishoBot:
         if self.admin_state[user_id] == "waiting_for_media":
             video = update.message.video
             file_id = video.file_id
-            self.temp_content[user_id]["media_type"] = "video"
-            self.temp_content[user_id]["media_path"] = file_id
+            temp_content = self.temp_content.get(user_id, {})
+            temp_content["media_type"] = "video"
+            temp_content["media_path"] = file_id
+            self.temp_content[user_id] = temp_content
             await update.message.reply_text(
                 "ویدیو دریافت شد. برای ذخیره محتوا از دستور /save استفاده کنید."
             )
+        elif self.admin_state[user_id] == "waiting_for_broadcast":
+            file_id = update.message.video.file_id
+            await self._confirm_broadcast(update, user_id, {
+                "text": update.message.caption or "",
+                "media_type": "video",
+                "media_path": file_id,
+                "file_id": file_id
+            })
 
     async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle document upload for admin content"""
@@ -814,67 +1706,84 @@ class MillionishoBot:
         if self.admin_state[user_id] == "waiting_for_media":
             document = update.message.document
             file_id = document.file_id
-            self.temp_content[user_id]["media_type"] = "document"
-            self.temp_content[user_id]["media_path"] = file_id
+            temp_content = self.temp_content.get(user_id, {})
+            temp_content["media_type"] = "document"
+            temp_content["media_path"] = file_id
+            self.temp_content[user_id] = temp_content
             await update.message.reply_text(
                 "فایل دریافت شد. برای ذخیره محتوا از دستور /save استفاده کنید."
             )
+        elif self.admin_state[user_id] == "waiting_for_broadcast":
+            file_id = update.message.document.file_id
+            await self._confirm_broadcast(update, user_id, {
+                "text": update.message.caption or "",
+                "media_type": "document",
+                "media_path": file_id,
+                "file_id": file_id
+            })
 
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle errors"""
-        logger.error(f"Error occurred: {context.error}")
+        logger.error("Error occurred: %s", context.error)
         try:
             if update and update.effective_message:
                 await update.effective_message.reply_text(
                     "متأسفانه خطایی رخ داد. لطفاً مجدداً تلاش کنید."
                 )
         except Exception as e:
-            logger.error(f"Error in error handler: {e}")
+            logger.error("Error in error handler: %s", e)
 
     def run(self) -> None:
-        """Run the bot"""
-        app = Application.builder().token(TELEGRAM_TOKEN).build()
+        """Run the bot with webhooks when WEBHOOK_URL is set, otherwise with long polling"""
+        if WEBHOOK_URL:
+            logger.info("Starting bot in webhook mode")
+            asyncio.run(self.run_webhook())
+        else:
+            logger.info("Starting bot in polling mode")
+            self.application.run_polling(allowed_updates=Update.ALL_TYPES)
 
-        # Add handlers
-        app.add_handler(CommandHandler("start", self.start_command))
-        app.add_handler(CommandHandler("help", self.help_command))
-        app.add_handler(CommandHandler("activate", self.handle_activation_code))
-        
-        # Add message handlers
-        app.add_handler(MessageHandler(
-            filters.TEXT & filters.REPLY & ~filters.COMMAND,
-            self.handle_activation_input
-        ))
-        
-        # Command handlers
-        app.add_handler(CommandHandler("start", self.start_command))
-        app.add_handler(CommandHandler("help", self.help_command))
-        app.add_handler(CommandHandler("save", self.save_command))
-        
-        # Text handler for admin command
-        app.add_handler(MessageHandler(
-            filters.TEXT & filters.Regex("^!admin$"),
-            self.handle_admin_command
-        ))
-        
-        # General text handler
-        app.add_handler(MessageHandler(
-            filters.TEXT & ~filters.COMMAND,
-            self.handle_text_input
-        ))
-        
-        # Media handlers
-        app.add_handler(MessageHandler(filters.PHOTO, self.handle_photo))
-        app.add_handler(MessageHandler(filters.VIDEO, self.handle_video))
-        app.add_handler(MessageHandler(filters.Document.ALL, self.handle_document))
-        
-        # Callback handlers
-        app.add_handler(CallbackQueryHandler(self.handle_callback))
-        
-        # Error handler
-        app.add_error_handler(self.error_handler)
-    
-        logger.info("All handlers have been set up")
+    async def run_webhook(
+        self,
+        listen: str = WEBHOOK_LISTEN,
+        port: int = WEBHOOK_PORT,
+        secret_token: Optional[str] = WEBHOOK_SECRET,
+        register: bool = True
+    ) -> None:
+        """Serve updates through the aiohttp webhook server until cancelled.
+
+        Workers behind the sharding front process (sharding.py) pass register=False.
+        """
+        server = WebhookServer(
+            self.application,
+            path=WEBHOOK_PATH,
+            listen=listen,
+            port=port,
+            secret_token=secret_token,
+            cert_file=WEBHOOK_CERT,
+            key_file=WEBHOOK_KEY,
+            health=self.health,
+        )
+        # run_polling() calls the post_init/post_shutdown hooks itself; here we have to
+        async with self.application:
+            await self._post_init(self.application)
+            await self.application.start()
+            await server.start()
+            if register:
+                await register_webhook(
+                    self.application.bot,
+                    WEBHOOK_URL,
+                    server.path,
+                    server.secret_token,
+                    cert_file=WEBHOOK_CERT if WEBHOOK_KEY else None,
+                )
+            try:
+                await asyncio.Event().wait()
+            except (asyncio.CancelledError, KeyboardInterrupt):
+                pass
+            finally:
+                await server.stop()
+                await self.application.stop()
+        await self._post_shutdown(self.application)
 
     def get_main_menu_keyboard(self) -> InlineKeyboardMarkup:
         """Create main menu keyboard"""
@@ -897,47 +1806,93 @@ class MillionishoBot:
             keyboard.append([InlineKeyboardButton(text, callback_data=key)])
         return InlineKeyboardMarkup(keyboard)
 
-    def get_navigation_keyboard(self, show_tutorial: bool = True) -> InlineKeyboardMarkup:
-        """Create navigation keyboard"""
-        keyboard = []
-        nav_row = []
+    @staticmethod
+    def navigation_data(section: str, index: int) -> str:
+        """Navigation button data for an item, tagged with the item it opens now"""
+        content = content_manager.get_content(section, index)
+        return encode_navigation(section, index, content.id if content else "")
+
+    def get_navigation_keyboard(self, section: str, index: int, size: int, show_tutorial: bool = True) -> InlineKeyboardMarkup:
+        """Create navigation keyboard for an item; every button carries its target"""
+        keyboard = [[
+            InlineKeyboardButton(
+                NAVIGATION_BUTTONS["back"],
+                callback_data=self.navigation_data(section, (index - 1) % size)
+            ),
+            InlineKeyboardButton(
+                NAVIGATION_BUTTONS["next"],
+                callback_data=self.navigation_data(section, (index + 1) % size)
+            )
+        ]]
         
-        if "back" in NAVIGATION_BUTTONS:
-            nav_row.append(InlineKeyboardButton(NAVIGATION_BUTTONS["back"], callback_data="back"))
-        if "next" in NAVIGATION_BUTTONS:
-            nav_row.append(InlineKeyboardButton(NAVIGATION_BUTTONS["next"], callback_data="next"))
+        def jump(label: str, target: int) -> InlineKeyboardButton:
+            target = min(max(target, 0), size - 1)
+            return InlineKeyboardButton(NAVIGATION_BUTTONS[label], callback_data=self.navigation_data(section, target))
         
-        if nav_row:
-            keyboard.append(nav_row)
+        if size > 100:
+            keyboard.append([jump("back_100", index - 100), jump("next_100", index + 100)])
+        if size > 10:
+            keyboard.append([jump("back_10", index - 10), jump("next_10", index + 10)])
+        if size > 3:
+            keyboard.append([jump("first", 0), jump("last", size - 1)])
+            keyboard.append([InlineKeyboardButton(NAVIGATION_BUTTONS["go_to"], callback_data=encode_go_to(section))])
             
+        keyboard.extend(self.get_discovery_rows(section, index))
         if show_tutorial:
-            keyboard.append([InlineKeyboardButton("توضیحات و آموزش", callback_data="tutorial")])
+            keyboard.append([InlineKeyboardButton("توضیحات و آموزش", callback_data=encode_tutorial(section, index))])
             
         keyboard.append([InlineKeyboardButton(NAVIGATION_BUTTONS["back_to_main"], callback_data="main_menu")])
         
         return InlineKeyboardMarkup(keyboard)
 
+    def get_shuffled_keyboard(self, section: str, key: int, bits: int, position: int, size: int, index: int) -> InlineKeyboardMarkup:
+        """Navigation keyboard of an item in a shuffled order; back and next follow the order"""
+        def button(label: str, direction: int) -> InlineKeyboardButton:
+            target_bits, target, _ = shuffle_step(key, bits, position, size, direction)
+            return InlineKeyboardButton(label, callback_data=encode_shuffled(section, key, target_bits, target))
+
+        keyboard = [[button(NAVIGATION_BUTTONS["back"], -1), button(NAVIGATION_BUTTONS["next"], 1)]]
+        if size > 3:
+            keyboard.append([InlineKeyboardButton(NAVIGATION_BUTTONS["go_to"], callback_data=encode_go_to(section))])
+        keyboard.extend(self.get_discovery_rows(section, index))
+        keyboard.append([InlineKeyboardButton("توضیحات و آموزش", callback_data=encode_tutorial(section, index))])
+        keyboard.append([InlineKeyboardButton(NAVIGATION_BUTTONS["back_to_main"], callback_data="main_menu")])
+        return InlineKeyboardMarkup(keyboard)
+
+    def get_discovery_rows(self, section: str, index: int) -> List[List[InlineKeyboardButton]]:
+        """Favorite button of an item, and buttons that list similar and trending items"""
+        return [
+            [InlineKeyboardButton(NAVIGATION_BUTTONS["favorite"], callback_data=encode_favorite(section, index))],
+            [
+                InlineKeyboardButton(NAVIGATION_BUTTONS["similar"], callback_data=encode_similar(section, index)),
+                InlineKeyboardButton(NAVIGATION_BUTTONS["trending"], callback_data=encode_trending(section))
+            ]
+        ]
+
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /start command"""
         user_id = str(update.effective_user.id)
-        logger.info(f"Start command received from user {user_id}")
+        logger.info("Start command received from user %s", user_id)
         
         try:
             user_manager.init_user(user_id)
+            user_manager.set_go_to_section(user_id, None)
+            if context.args and await self.handle_deep_link(update, context.args[0]):
+                return
             await update.message.reply_text(
                 MESSAGES["welcome"],
                 reply_markup=self.get_main_menu_keyboard(),
                 parse_mode=ParseMode.HTML
             )
-            logger.info(f"Welcome message sent to user {user_id}")
+            logger.info("Welcome message sent to user %s", user_id)
         except Exception as e:
-            logger.error(f"Error in start_command - user: {user_id}, error: {str(e)}")
+            logger.error("Error in start_command - user: %s, error: %s", user_id, e)
             await update.message.reply_text("خطا در شروع ربات. لطفاً دوباره تلاش کنید.")
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /help command"""
         user_id = str(update.effective_user.id)
-        logger.info(f"Help command received from user {user_id}")
+        logger.info("Help command received from user %s", user_id)
         
         try:
             await update.message.reply_text(
@@ -948,19 +1903,19 @@ class MillionishoBot:
                 "برای دسترسی به پنل ادمین، دستور !admin را ارسال کنید.",
                 parse_mode=ParseMode.HTML
             )
-            logger.info(f"Help message sent to user {user_id}")
+            logger.info("Help message sent to user %s", user_id)
         except Exception as e:
-            logger.error(f"Error in help_command - user: {user_id}, error: {str(e)}")
+            logger.error("Error in help_command - user: %s, error: %s", user_id, e)
             await update.message.reply_text("خطا در نمایش راهنما. لطفاً دوباره تلاش کنید.")
 
     async def handle_template(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle template section"""
         user_id = str(update.effective_user.id)
-        logger.info(f"Template section accessed by user {user_id}")
+        logger.info("Template section accessed by user %s", user_id)
         
         try:
             if not await self.check_access(update, "template"):
-                logger.warning(f"Access denied to template section for user {user_id}")
+                logger.warning("Access denied to template section for user %s", user_id)
                 return
                 
             await update.callback_query.message.edit_text(
@@ -968,10 +1923,10 @@ class MillionishoBot:
                 reply_markup=self.get_template_submenu_keyboard(),
                 parse_mode=ParseMode.HTML
             )
-            logger.info(f"Template submenu displayed for user {user_id}")
+            logger.info("Template submenu displayed for user %s", user_id)
             
         except Exception as e:
-            logger.error(f"Error in handle_template - user: {user_id}, error: {str(e)}")
+            logger.error("Error in handle_template - user: %s, error: %s", user_id, e)
             await update.callback_query.answer("خطا در نمایش منو. لطفاً دوباره تلاش کنید.", show_alert=True)
 
     async def handle_text_template(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -989,46 +1944,59 @@ class MillionishoBot:
     async def handle_tutorial(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle tutorial section"""
         user_id = str(update.effective_user.id)
-        logger.info(f"Tutorial section accessed by user {user_id}")
+        logger.info("Tutorial section accessed by user %s", user_id)
+        
+        current_section = user_manager.get_current_section(user_id)
+        if not current_section:
+            logger.warning("No current section found for tutorial - user: %s", user_id)
+            await update.callback_query.answer("لطفاً ابتدا یک بخش را انتخاب کنید.", show_alert=True)
+            return
+        
+        await self.show_tutorial(update, current_section, "back")
+
+    async def handle_section_tutorial(self, update: Update, context: ContextTypes.DEFAULT_TYPE, payload: str) -> None:
+        """Handle tutorial button that carries its section and return index"""
+        decoded = decode_tutorial(payload)
+        if not decoded:
+            await update.callback_query.answer("این دکمه دیگر معتبر نیست.", show_alert=True)
+            return
+        
+        section, index = decoded
+        if not await self.check_unlocked(update, section):
+            return
+        back_data = self.navigation_data(section, index)
+        await self.show_tutorial(update, section, back_data)
+
+    async def show_tutorial(self, update: Update, section: str, back_data: str) -> None:
+        """Show the tutorial of a section with a button back to the content"""
+        user_id = str(update.effective_user.id)
         
         try:
-            current_section = user_manager.get_current_section(user_id)
-            if not current_section:
-                logger.warning(f"No current section found for tutorial - user: {user_id}")
-                await update.callback_query.answer("لطفاً ابتدا یک بخش را انتخاب کنید.", show_alert=True)
-                return
-            
             if not await self.check_access(update, "tutorial"):
-                logger.warning(f"Access denied to tutorial section for user {user_id}")
+                logger.warning("Access denied to tutorial section for user %s", user_id)
                 return
                 
-            tutorial = content_manager.get_tutorial(current_section)
+            tutorial = content_manager.get_tutorial(section)
             if tutorial:
                 keyboard = [[
-                    InlineKeyboardButton(NAVIGATION_BUTTONS["back"], callback_data="back"),
+                    InlineKeyboardButton(NAVIGATION_BUTTONS["back"], callback_data=back_data),
                     InlineKeyboardButton(NAVIGATION_BUTTONS["back_to_main"], callback_data="main_menu")
                 ]]
                 
-                if tutorial.media_path and tutorial.media_type == "document":
-                    await update.callback_query.message.reply_document(
-                        document=tutorial.media_path,
-                        caption=tutorial.text,
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                    )
+                parts = RenderCache.render_parts(tutorial.delivery)
+                if tutorial.delivery.kind == "document":
+                    # Kept below the content instead of replacing it, like a download
+                    await self.deliver(update, parts, InlineKeyboardMarkup(keyboard), "document", tutorial.media_path, False)
                 else:
-                    await update.callback_query.message.edit_text(
-                        tutorial.text,
-                        reply_markup=InlineKeyboardMarkup(keyboard),
-                        parse_mode=ParseMode.HTML
-                    )
-                logger.info(f"Tutorial content sent for section {current_section} - user: {user_id}")
+                    await self.deliver(update, parts, InlineKeyboardMarkup(keyboard), tutorial.delivery.kind, tutorial.media_path)
+                logger.info("Tutorial content sent for section %s - user: %s", section, user_id)
             else:
-                logger.warning(f"No tutorial content found for section {current_section}")
+                logger.warning("No tutorial content found for section %s", section)
                 await update.callback_query.answer("محتوای آموزشی در دسترس نیست", show_alert=True)
                 
         except Exception as e:
-            logger.error(f"Error in handle_tutorial - user: {user_id}, error: {str(e)}")
-            await update.callback_query.answer("خطا در نمایش آموزش. لطفاً دوباره تلاش کنید.", show_alert=True)
+            logger.error("Error in handle_tutorial - user: %s, error: %s", user_id, e)
+            await self.alert(update, "خطا در نمایش آموزش. لطفاً دوباره تلاش کنید.")
 
 if __name__ == "__main__":
     # Create and run bot
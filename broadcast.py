@@ -0,0 +1,291 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional, Set
+
+from telegram import Bot, Message
+from telegram.error import BadRequest, Forbidden
+
+from rate_limiter import PRIORITY_BULK
+from user_manager import UserManager
+
+logger = logging.getLogger(__name__)
+
+BULK = {"priority": PRIORITY_BULK}
+
+# Store namespace and key of the lease held by the worker running the broadcast
+LEASES = "leases"
+BROADCAST_LEASE = "broadcast"
+
+
+class Broadcaster:
+    """Sends one message to every user through a sliding window of sends and checkpoints progress to disk.
+
+    Up to `concurrency` sends are in flight at any time; a new one starts as soon as any
+    finishes. The checkpoint stores the message, the offset before which every user is
+    handled, the users past it that are handled too and the counters, so a restarted bot
+    only repeats the sends that were in flight. Sends run at most `batch_size` users past
+    the offset, which bounds the checkpoint.
+
+    Workers sharing a store take a lease on the broadcast before starting or resuming it,
+    so only one of them sends; the lease is renewed while it runs and lapses after
+    `lease_ttl` seconds if its worker dies.
+    """
+
+    def __init__(
+        self,
+        users: UserManager,
+        state_file: str,
+        batch_size: int = 500,
+        concurrency: int = 50,
+        checkpoint_interval: float = 1.0,
+        owner: str = "worker-0",
+        lease_ttl: float = 30.0,
+    ):
+        self.users = users
+        self.state_file = state_file
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.checkpoint_interval = checkpoint_interval
+        self.owner = owner
+        self.lease_ttl = lease_ttl
+        self.state: Optional[Dict] = self._load_state()
+        self._task: Optional[asyncio.Task] = None
+
+    def _load_state(self) -> Optional[Dict]:
+        if not os.path.exists(self.state_file):
+            return None
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error("Error loading broadcast checkpoint: %s", e)
+            return None
+
+    def _save_state(self) -> None:
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_file, self.state_file)
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def has_unfinished(self) -> bool:
+        """True when a checkpoint of an interrupted broadcast exists"""
+        return bool(self.state) and self.state.get("status") == "running"
+
+    def progress_text(self) -> str:
+        """Human readable progress for the admin panel"""
+        if not self.state:
+            return "هیچ ارسال همگانی ثبت نشده است."
+        state = self.state
+        status = {"running": "در حال ارسال", "done": "پایان یافته", "failed": "متوقف شده با خطا"}.get(
+            state["status"], state["status"]
+        )
+        return (
+            f"📢 وضعیت ارسال همگانی: {status}\n"
+            f"👥 بررسی‌شده: {state['offset']}\n"
+            f"✅ ارسال موفق: {state['delivered']}\n"
+            f"🚫 مسدودکرده: {state['blocked']}\n"
+            f"❌ ناموفق: {state['failed']}"
+        )
+
+    async def _claim(self) -> bool:
+        return await asyncio.to_thread(self.users.store.claim, LEASES, BROADCAST_LEASE, self.owner, self.lease_ttl)
+
+    async def _keep_lease(self, broadcast: asyncio.Task) -> None:
+        """Renew the lease while the broadcast runs; stop the broadcast if another worker took it"""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                held = await self._claim()
+            except Exception as e:
+                logger.error("Error renewing the broadcast lease: %s", e)
+                continue
+            if not held:
+                logger.error("Broadcast lease was taken by another worker, stopping")
+                broadcast.cancel()
+                return
+
+    async def start(self, bot: Bot, message: Dict, admin_chat_id: int) -> bool:
+        """Start a new broadcast; returns False when one is already running here or on another worker"""
+        if self.is_running or not await self._claim():
+            return False
+        self.state = {
+            "message": message,
+            "admin_chat_id": admin_chat_id,
+            "offset": 0,
+            "sent_ahead": [],
+            "delivered": 0,
+            "failed": 0,
+            "blocked": 0,
+            "status": "running",
+            "started_at": time.time(),
+        }
+        self._save_state()
+        self._task = asyncio.create_task(self.run(bot))
+        return True
+
+    async def resume(self, bot: Bot) -> bool:
+        """Continue an interrupted broadcast from its checkpoint, unless another worker holds it"""
+        if self.is_running or not self.has_unfinished:
+            return False
+        if not await self._claim():
+            logger.info("Interrupted broadcast is held by another worker")
+            return False
+        logger.info("Resuming broadcast at offset %s", self.state['offset'])
+        self._task = asyncio.create_task(self.run(bot))
+        return True
+
+    async def _send(self, bot: Bot, chat_id: str, message: Dict) -> Message:
+        media_type = message.get("media_type")
+        media = message.get("file_id") or message.get("media_path")
+        text = message.get("text", "")
+        if media_type == "photo":
+            return await bot.send_photo(chat_id, photo=media, caption=text, rate_limit_args=BULK)
+        if media_type == "video":
+            return await bot.send_video(chat_id, video=media, caption=text, rate_limit_args=BULK)
+        if media_type == "document":
+            return await bot.send_document(chat_id, document=media, caption=text, rate_limit_args=BULK)
+        return await bot.send_message(chat_id, text=text, rate_limit_args=BULK)
+
+    def _remember_file_id(self, message: Dict, sent: Message) -> None:
+        """Reuse the uploaded file for every other recipient instead of uploading it again"""
+        if message.get("file_id") or not message.get("media_type"):
+            return
+        attachment = sent.effective_attachment
+        if isinstance(attachment, tuple):
+            attachment = attachment[-1] if attachment else None
+        if attachment is not None and getattr(attachment, "file_id", None):
+            message["file_id"] = attachment.file_id
+
+    async def _deliver(self, bot: Bot, chat_id: str) -> None:
+        message = self.state["message"]
+        try:
+            sent = await self._send(bot, chat_id, message)
+            self._remember_file_id(message, sent)
+            self.state["delivered"] += 1
+        except Forbidden:
+            self.state["blocked"] += 1
+        except BadRequest as e:
+            logger.warning("Broadcast to %s rejected: %s", chat_id, e)
+            self.state["failed"] += 1
+        except Exception as e:
+            # One bad send must not stall the window behind it
+            logger.error("Broadcast to %s failed: %s", chat_id, e)
+            self.state["failed"] += 1
+
+    def _checkpoint(self, handled: Dict[int, str]) -> None:
+        """Save the offset, and the users past it in `handled` (position -> user ID)"""
+        self.state["sent_ahead"] = list(handled.values())
+        self._save_state()
+
+    async def run(self, bot: Bot) -> None:
+        """Deliver the checkpointed broadcast, starting a send whenever one of the in-flight sends finishes"""
+        state = self.state
+        message = state["message"]
+        already_sent: Set[str] = set(state.get("sent_ahead", ()))
+        handled: Dict[int, str] = {}
+        in_flight: Set[asyncio.Task] = set()
+        sending = asyncio.Semaphore(self.concurrency)
+        advanced = asyncio.Event()
+        saved_at = time.monotonic()
+
+        def finish(position: int, chat_id: str) -> None:
+            nonlocal saved_at
+            handled[position] = chat_id
+            if position == state["offset"]:
+                while state["offset"] in handled:
+                    del handled[state["offset"]]
+                    state["offset"] += 1
+                advanced.set()
+            if time.monotonic() - saved_at >= self.checkpoint_interval:
+                self._checkpoint(handled)
+                saved_at = time.monotonic()
+
+        async def deliver(position: int, chat_id: str) -> None:
+            try:
+                await self._deliver(bot, chat_id)
+            finally:
+                sending.release()
+            finish(position, chat_id)
+
+        position = state["offset"]
+        lease = asyncio.create_task(self._keep_lease(asyncio.current_task()))
+        try:
+            while True:
+                batch = await asyncio.to_thread(self.users.get_user_ids_batch, position, self.batch_size)
+                if not batch:
+                    break
+                for chat_id in batch:
+                    if chat_id in already_sent:
+                        finish(position, chat_id)
+                    elif message.get("media_type") and not message.get("file_id"):
+                        # Upload the media once before fanning out so the rest reuse its file_id
+                        await self._deliver(bot, chat_id)
+                        finish(position, chat_id)
+                    else:
+                        while position - state["offset"] >= self.batch_size:
+                            advanced.clear()
+                            await advanced.wait()
+                        await sending.acquire()
+                        task = asyncio.create_task(deliver(position, chat_id))
+                        in_flight.add(task)
+                        task.add_done_callback(in_flight.discard)
+                    position += 1
+                logger.info(
+                    "Broadcast progress - offset: %s, delivered: %s, "
+                    "blocked: %s, failed: %s",
+                    state['offset'], state['delivered'], state['blocked'], state['failed']
+                )
+            if in_flight:
+                await asyncio.gather(*in_flight)
+
+            state["status"] = "done"
+            state["finished_at"] = time.time()
+            logger.info("Broadcast finished")
+            report = self.progress_text()
+        except asyncio.CancelledError:
+            for task in in_flight:
+                task.cancel()
+            logger.info("Broadcast interrupted at offset %s", state['offset'])
+            raise
+        except Exception as e:
+            for task in in_flight:
+                task.cancel()
+            logger.error("Error in broadcast at offset %s: %s", state['offset'], e)
+            state["status"] = "failed"
+            state["error"] = str(e)
+            report = f"{self.progress_text()}\n\n⚠️ خطا: {e}"
+        finally:
+            # However the broadcast ends, a restart continues from where it stopped
+            try:
+                self._checkpoint(handled)
+            except Exception as e:
+                logger.error("Error saving the broadcast checkpoint: %s", e)
+            lease.cancel()
+            try:
+                await asyncio.to_thread(self.users.store.release, LEASES, BROADCAST_LEASE, self.owner)
+            except Exception as e:
+                logger.error("Error releasing the broadcast lease: %s", e)
+        try:
+            await bot.send_message(state["admin_chat_id"], report)
+        except Exception as e:
+            logger.error("Error reporting the broadcast: %s", e)
+
+    async def stop(self) -> None:
+        """Cancel a running broadcast and wait until its checkpoint is written"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error("Error stopping the broadcast: %s", e)
@@ -0,0 +1,155 @@
+import zlib
+from typing import Optional, Tuple
+
+from menu_config import SECTION_CODES
+
+SECTION_BY_CODE = {code: section for section, code in SECTION_CODES.items()}
+
+# Telegram limits callback_data to 64 bytes
+MAX_CALLBACK_DATA = 64
+SEPARATOR = ":"
+
+# Prefixes of encoded callbacks
+NAVIGATION = "n"
+TUTORIAL = "tu"
+GO_TO = "g"
+SHUFFLED = "s"
+FAVORITE = "fv"
+TRENDING = "tr"
+SIMILAR = "sm"
+
+# /start payload of a deep link to a single item: t_<section>_<id>
+DEEP_LINK_PREFIX = "t_"
+
+# Navigation buttons carry a short hash of the ID of the item they open, so a button whose
+# index points at another item after a content change or deploy is detected
+CONTENT_TAG_MODULUS = 36 ** 3
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def to_base36(number: int) -> str:
+    if number == 0:
+        return "0"
+    digits = []
+    while number:
+        number, remainder = divmod(number, 36)
+        digits.append(_DIGITS[remainder])
+    return "".join(reversed(digits))
+
+
+def split(callback_data: str) -> Tuple[str, str]:
+    """Split callback data into its prefix and payload"""
+    prefix, _, payload = callback_data.partition(SEPARATOR)
+    return prefix, payload
+
+
+def _join(*parts: str) -> str:
+    data = SEPARATOR.join(parts)
+    if len(data.encode()) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data too long: {data}")
+    return data
+
+
+def content_tag(content_id: str) -> int:
+    return zlib.crc32(content_id.encode()) % CONTENT_TAG_MODULUS
+
+
+def encode_navigation(section: str, index: int, content_id: str) -> str:
+    """Button data that shows item `index` of `section` without any server-side state"""
+    return _join(NAVIGATION, SECTION_CODES[section], to_base36(index), to_base36(content_tag(content_id)))
+
+
+def decode_navigation(payload: str) -> Optional[Tuple[str, int, Optional[int]]]:
+    """Return (section, index, content tag) or None for malformed data; the tag is None on buttons sent without one"""
+    fields = payload.split(SEPARATOR)
+    tag = None
+    try:
+        if len(fields) == 3:
+            tag = int(fields.pop(), 36)
+    except ValueError:
+        return None
+    decoded = decode_tutorial(SEPARATOR.join(fields))
+    return decoded + (tag,) if decoded else None
+
+
+def encode_tutorial(section: str, index: int) -> str:
+    """Button data that opens the tutorial of `section` and returns to item `index`"""
+    return _join(TUTORIAL, SECTION_CODES[section], to_base36(index))
+
+
+def decode_tutorial(payload: str) -> Optional[Tuple[str, int]]:
+    """Return (section, index) or None for malformed data"""
+    try:
+        code, index = payload.split(SEPARATOR)
+        return SECTION_BY_CODE[code], int(index, 36)
+    except (KeyError, ValueError):
+        return None
+
+
+def encode_shuffled(section: str, key: int, bits: int, position: int) -> str:
+    """Button data that shows the item at `position` of a user's shuffled order of `section`"""
+    return _join(SHUFFLED, SECTION_CODES[section], to_base36(key), to_base36(bits), to_base36(position))
+
+
+def decode_shuffled(payload: str) -> Optional[Tuple[str, int, int, int]]:
+    """Return (section, key, bits, position) or None for malformed data"""
+    try:
+        code, key, bits, position = payload.split(SEPARATOR)
+        return SECTION_BY_CODE[code], int(key, 36), int(bits, 36), int(position, 36)
+    except (KeyError, ValueError):
+        return None
+
+
+def encode_favorite(section: str, index: int) -> str:
+    """Button data that adds item `index` of `section` to the user's favorites"""
+    return _join(FAVORITE, SECTION_CODES[section], to_base36(index))
+
+
+def decode_favorite(payload: str) -> Optional[Tuple[str, int]]:
+    """Return (section, index) or None for malformed data"""
+    return decode_tutorial(payload)
+
+
+def encode_trending(section: str) -> str:
+    """Button data that lists the most popular items of `section`"""
+    return _join(TRENDING, SECTION_CODES[section])
+
+
+def decode_trending(payload: str) -> Optional[str]:
+    return SECTION_BY_CODE.get(payload)
+
+
+def encode_similar(section: str, index: int) -> str:
+    """Button data that lists the items most similar to item `index` of `section`"""
+    return _join(SIMILAR, SECTION_CODES[section], to_base36(index))
+
+
+def decode_similar(payload: str) -> Optional[Tuple[str, int]]:
+    """Return (section, index) or None for malformed data"""
+    return decode_tutorial(payload)
+
+
+def encode_go_to(section: str) -> str:
+    """Button data that asks the user for an item number in `section`"""
+    return _join(GO_TO, SECTION_CODES[section])
+
+
+def decode_go_to(payload: str) -> Optional[str]:
+    return SECTION_BY_CODE.get(payload)
+
+
+def encode_deep_link(section: str, content_id: str) -> str:
+    """/start payload that opens a single item"""
+    return f"{DEEP_LINK_PREFIX}{section}_{content_id}"
+
+
+def decode_deep_link(payload: str) -> Optional[Tuple[str, str]]:
+    """Return (section, content id) or None; ids may contain underscores themselves"""
+    if not payload.startswith(DEEP_LINK_PREFIX):
+        return None
+    rest = payload[len(DEEP_LINK_PREFIX):]
+    for section in SECTION_CODES:
+        if rest.startswith(f"{section}_") and len(rest) > len(section) + 1:
+            return section, rest[len(section) + 1:]
+    return None
@@ -7,6 +7,9 @@ load_dotenv()
 # Telegram Bot Token
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 
+# Bot API server (leave empty for api.telegram.org, set for a local Bot API server)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
 # Admin IDs
 ADMIN_IDS = [1807336889, 101913815]  # شناسه تلگرام ادمین‌ها: Arshia Aghayi و Sepehr
 
@@ -15,10 +18,89 @@ WORDPRESS_BASE_URL = os.getenv('WORDPRESS_BASE_URL', 'https://millionisho.com')
 
 # Content Directory
 CONTENT_DIR = os.getenv('CONTENT_DIR', 'content')
+# Lazy: sections load on first use and the rest in the background after startup; otherwise all load before startup
+CONTENT_LAZY_LOAD = os.getenv('CONTENT_LAZY_LOAD', 'true').lower() in ('1', 'true', 'yes')
+CONTENT_LOAD_WORKERS = int(os.getenv('CONTENT_LOAD_WORKERS', 4))  # section files read in parallel
+# Each user browses sections in their own shuffled order instead of from item 1 onwards
+CONTENT_SHUFFLE = os.getenv('CONTENT_SHUFFLE', 'false').lower() in ('1', 'true', 'yes')
+
+# Popularity: views and favorites lose half their weight every half-life; a favorite counts as FAVORITE_WEIGHT views
+POPULARITY_HALF_LIFE_HOURS = float(os.getenv('POPULARITY_HALF_LIFE_HOURS', 72))
+POPULARITY_FAVORITE_WEIGHT = float(os.getenv('POPULARITY_FAVORITE_WEIGHT', 5))
+POPULARITY_CHECKPOINT_INTERVAL = float(os.getenv('POPULARITY_CHECKPOINT_INTERVAL', 300))  # seconds between saves of the counters to a shared store
+TRENDING_SIZE = int(os.getenv('TRENDING_SIZE', 10))  # items listed by the trending button
+SIMILAR_ITEMS = int(os.getenv('SIMILAR_ITEMS', 5))  # nearest neighbors kept per item for the similar button
+# Admin submissions sharing at least this share of word triples with an existing item get a warning
+DUPLICATE_THRESHOLD = float(os.getenv('DUPLICATE_THRESHOLD', 0.7))
 
 # Cache Configuration
 CACHE_TTL = int(os.getenv('CACHE_TTL', 3600))  # 1 hour
-CACHE_MAX_SIZE = int(os.getenv('CACHE_MAX_SIZE', 1000))
+CACHE_MAX_SIZE = int(os.getenv('CACHE_MAX_SIZE', 1000))  # rendered items kept for send_content
+
+# Update Processing (1 = sequential, >1 = concurrent with per-user ordering)
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', 32))
+MAX_QUEUED_UPDATES_PER_USER = int(os.getenv('MAX_QUEUED_UPDATES_PER_USER', 20))  # later updates of a user who is this far behind are dropped
+
+# Outbound Flood Control (Telegram allows ~30 msg/s overall, ~1 msg/s per chat, 20 msg/min per group)
+RATE_LIMIT_GLOBAL = float(os.getenv('RATE_LIMIT_GLOBAL', 30))
+RATE_LIMIT_PER_CHAT = float(os.getenv('RATE_LIMIT_PER_CHAT', 1))
+RATE_LIMIT_CHAT_BURST = float(os.getenv('RATE_LIMIT_CHAT_BURST', 3))
+RATE_LIMIT_GROUP_PER_MINUTE = float(os.getenv('RATE_LIMIT_GROUP_PER_MINUTE', 20))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', 3))
+
+# Broadcast Configuration
+BROADCAST_STATE_FILE = os.getenv('BROADCAST_STATE_FILE', 'broadcast_state.json')
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', 500))  # users read at a time; also the most sends ahead of the oldest unfinished one
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', 50))
+BROADCAST_CHECKPOINT_INTERVAL = float(os.getenv('BROADCAST_CHECKPOINT_INTERVAL', 1))  # seconds between checkpoint writes
+BROADCAST_LEASE_SECONDS = float(os.getenv('BROADCAST_LEASE_SECONDS', 30))  # how long a dead worker keeps other workers from resuming its broadcast
+
+# Shared State Store ("host:port" of a store served by sharding.py; empty = in-process)
+STATE_STORE_URL = os.getenv('STATE_STORE_URL')
+STATE_STORE_AUTHKEY = os.getenv('STATE_STORE_AUTHKEY', 'millionisho').encode()
+
+# Multi-worker Mode (see sharding.py)
+WORKER_COUNT = int(os.getenv('WORKER_COUNT', 4))
+WORKER_BASE_PORT = int(os.getenv('WORKER_BASE_PORT', 9000))
+WORKER_INDEX = int(os.getenv('WORKER_INDEX', 0))  # set by sharding.py
+CONTENT_SYNC_INTERVAL = float(os.getenv('CONTENT_SYNC_INTERVAL', 2))
+
+# Webhook Configuration (polling is used when WEBHOOK_URL is not set)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # public https base URL, e.g. https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # random secret is generated when empty
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('PORT', os.getenv('WEBHOOK_PORT', 8443)))
+WEBHOOK_CERT = os.getenv('WEBHOOK_CERT')  # only when TLS is not terminated by a proxy
+WEBHOOK_KEY = os.getenv('WEBHOOK_KEY')
+
+# Metrics (Prometheus text format on http://METRICS_LISTEN:METRICS_PORT/metrics, disabled when 0)
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+
+# Profiling (!profile admin command)
+PROFILE_DEFAULT_SECONDS = float(os.getenv('PROFILE_DEFAULT_SECONDS', 30))
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', 300))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))  # seconds between stack samples
+
+# Event Loop Watchdog (/healthz and /readyz are served by the webhook server, or the metrics server when polling)
+WATCHDOG_INTERVAL = float(os.getenv('WATCHDOG_INTERVAL', 0.1))
+WATCHDOG_THRESHOLD = float(os.getenv('WATCHDOG_THRESHOLD', 0.25))  # log the blocking stack after this many seconds
+WATCHDOG_UNHEALTHY_LAG = float(os.getenv('WATCHDOG_UNHEALTHY_LAG', 5))  # /healthz fails above this lag
+
+# Traffic Capture (anonymized JSONL of incoming updates for benchmarks/replay.py, disabled when empty)
+TRAFFIC_RECORD_FILE = os.getenv('TRAFFIC_RECORD_FILE')
+TRAFFIC_RECORD_SALT = os.getenv('TRAFFIC_RECORD_SALT', '').encode()  # fixed salt keeps pseudonyms stable across restarts
 
 # Debug Mode
-DEBUG = True  # Set to True for detailed logging 
+DEBUG = os.getenv('DEBUG', 'false').lower() in ('1', 'true', 'yes')  # Set to true for detailed logging
+
+# Logging Configuration
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO')
+LOG_LEVELS = os.getenv('LOG_LEVELS', 'httpx=WARNING')  # per-logger levels, e.g. "bot=DEBUG,telegram=WARNING"
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_CONSOLE = os.getenv('LOG_CONSOLE', 'true').lower() in ('1', 'true', 'yes')
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 20))  # DEBUG/INFO lines per second per message, 0 disables sampling
+LOG_SAMPLE_BURST = float(os.getenv('LOG_SAMPLE_BURST', 100))
@@ -1,11 +1,30 @@
 import os
 import json
 import logging
-from typing import Dict, List, Optional, Union, Tuple
-from dataclasses import dataclass
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Union, Tuple
+from dataclasses import dataclass, field
+
+from config import CONTENT_DIR, CONTENT_LOAD_WORKERS, SIMILAR_ITEMS
+from attachments import plan_albums
+from delivery import Delivery, plan_delivery
+from json_stream import iter_json_array
+from similarity import SimilarityIndex
 
 logger = logging.getLogger(__name__)
 
+SECTIONS = [
+    "text_template",
+    "image_template",
+    "reels_idea",
+    "call_to_action",
+    "caption",
+    "interactive_story",
+    "bio",
+    "roadmap"
+]
+
 @dataclass
 class Content:
     id: str
@@ -14,56 +33,98 @@ class Content:
     media_path: Optional[str] = None
     media_type: Optional[str] = None  # 'photo', 'video', 'voice', 'document'
     additional_info: Optional[Dict] = None
+    # Messages needed to send the item, planned by ContentManager when the item is loaded
+    delivery: Optional[Delivery] = field(default=None, repr=False, compare=False)
+
+    def plan_delivery(self) -> Delivery:
+        """Plan the delivery of this item if that was not done yet"""
+        if self.delivery is None:
+            self.delivery = plan_delivery(
+                self.text, self.media_path, self.media_type, plan_albums(self.additional_info)
+            )
+        return self.delivery
 
 class ContentManager:
-    def __init__(self, content_dir: str = "content"):
+    """Content of every section, indexed by ID and by position.
+
+    With lazy=True nothing is read when the manager is created: each section is loaded
+    on first access, so importing this module costs nothing and startup only parses the
+    sections the first updates need. load_content() reads the remaining sections, several
+    files at a time.
+    """
+
+    def __init__(self, content_dir: str = "content", lazy: bool = False):
         self.content_dir = content_dir
         self.content: Dict[str, Dict[str, Content]] = {}
-        self.load_content()
+        self.versions: Dict[str, int] = {}
+        self._ordered: Dict[str, List[Content]] = {}
+        self._positions: Dict[str, Dict[str, int]] = {}
+        self._listeners: List[Callable[[str, Optional[Content]], None]] = []
+        # Nearest neighbors per section, built off the event loop by build_similarity()
+        self._similarity: Dict[str, SimilarityIndex] = {}
+        # One lock per section: a section is read once even if a preload thread races a handler,
+        # and a handler only waits for the section it needs
+        self._load_locks = {section: threading.Lock() for section in SECTIONS}
+        if not lazy:
+            self.load_content()
     
-    def load_content(self) -> None:
-        """Load all content from JSON files"""
-        sections = [
-            "text_template",
-            "image_template",
-            "reels_idea",
-            "call_to_action",
-            "caption",
-            "interactive_story",
-            "bio",
-            "roadmap"
-        ]
-        
-        for section in sections:
-            self.content[section] = {}
-            
-            # Load default content
-            default_file = os.path.join(self.content_dir, f"{section}.json")
-            if os.path.exists(default_file):
-                try:
-                    with open(default_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        for item in data:
-                            content = Content(
-                                id=str(item['id']),
-                                type=section,
-                                text=item['text'],
-                                media_path=item.get('media_path'),
-                                media_type=item.get('media_type'),
-                                additional_info=item.get('additional_info')
-                            )
-                            self.content[section][content.id] = content
-                    logger.info(f"Loaded {len(data)} default items for section {section}")
-                except Exception as e:
-                    logger.error(f"Error loading default content for section {section}: {str(e)}")
-            
-            # Load admin-added content
-            admin_file = os.path.join(self.content_dir, f"{section}_admin.json")
-            if os.path.exists(admin_file):
-                try:
-                    with open(admin_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        for item in data:
+    def add_listener(self, listener: Callable[[str, Optional[Content]], None]) -> None:
+        """Register a callback that is called with the section name whenever a section changes,
+        and with the new item when the change only appended one (None otherwise)"""
+        self._listeners.append(listener)
+    
+    def _section_changed(self, section: str, added: Optional[Content] = None) -> None:
+        """Refresh the index order and version of a section and notify listeners"""
+        self._ordered[section] = list(self.content[section].values())
+        for content in self._ordered[section]:
+            content.plan_delivery()
+        self._positions[section] = {content.id: index for index, content in enumerate(self._ordered[section])}
+        self._similarity.pop(section, None)
+        self.versions[section] = self.versions.get(section, 0) + 1
+        for listener in self._listeners:
+            try:
+                listener(section, added)
+            except Exception as e:
+                logger.error("Error in content listener for section %s: %s", section, e)
+    
+    def load_content(self, workers: int = CONTENT_LOAD_WORKERS) -> None:
+        """Load every section that is not loaded yet, reading up to `workers` files at once"""
+        missing = [section for section in SECTIONS if section not in self.versions]
+        if not missing:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as executor:
+            list(executor.map(self._ensure_loaded, missing))
+    
+    def load_section(self, section: str) -> None:
+        """(Re)load one section from its JSON files"""
+        self.content[section] = self._read_section(section)
+        self._section_changed(section)
+    
+    def _ensure_loaded(self, section: str) -> None:
+        """Load a known section on first access"""
+        # versions is set only once the section is indexed, so it marks a usable section
+        if section in self.versions or section not in self._load_locks:
+            return
+        with self._load_locks[section]:
+            if section not in self.versions:
+                self.load_section(section)
+    
+    def _read_section(self, section: str) -> Dict[str, Content]:
+        """Parse the default and admin-added files of a section, one item at a time"""
+        items: Dict[str, Content] = {}
+        for suffix, label in (("", "default"), ("_admin", "admin-added")):
+            path = os.path.join(self.content_dir, f"{section}{suffix}.json")
+            if not os.path.exists(path):
+                continue
+
+            def report(index: int, error: Exception) -> None:
+                logger.error("Skipping %s item %s of section %s: %s", label, index, section, error)
+
+            loaded = 0
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for index, item in iter_json_array(f, report):
+                        try:
                             content = Content(
                                 id=str(item['id']),
                                 type=section,
@@ -72,14 +133,25 @@ class ContentManager:
                                 media_type=item.get('media_type'),
                                 additional_info=item.get('additional_info')
                             )
-                            self.content[section][content.id] = content
-                    logger.info(f"Loaded {len(data)} admin-added items for section {section}")
-                except Exception as e:
-                    logger.error(f"Error loading admin content for section {section}: {str(e)}")
+                        except (KeyError, TypeError, AttributeError) as e:
+                            report(index, e)
+                            continue
+                        items[content.id] = content
+                        loaded += 1
+                logger.info("Loaded %s %s items for section %s", loaded, label, section)
+            except Exception as e:
+                logger.error("Error loading %s content for section %s: %s", label, section, e)
+        return items
+    
+    def has_section(self, section: str) -> bool:
+        """Check if a section exists, loading it if needed"""
+        self._ensure_loaded(section)
+        return section in self.content
     
     def save_admin_content(self, section: str) -> None:
         """Save admin-added content to separate file"""
         try:
+            self._ensure_loaded(section)
             admin_file = os.path.join(self.content_dir, f"{section}_admin.json")
             content_list = [
                 {
@@ -95,13 +167,14 @@ class ContentManager:
             
             with open(admin_file, 'w', encoding='utf-8') as f:
                 json.dump(content_list, f, ensure_ascii=False, indent=4)
-            logger.info(f"Saved {len(content_list)} admin items for section {section}")
+            logger.info("Saved %s admin items for section %s", len(content_list), section)
         except Exception as e:
-            logger.error(f"Error saving admin content for section {section}: {str(e)}")
+            logger.error("Error saving admin content for section %s: %s", section, e)
     
     def add_content(self, section: str, content_data: Dict) -> Optional[str]:
         """Add new content to a section"""
         try:
+            self._ensure_loaded(section)
             if section not in self.content:
                 self.content[section] = {}
             
@@ -123,52 +196,102 @@ class ContentManager:
             )
             
             # Add to memory
+            similarity = self._similarity.get(section)
             self.content[section][new_id] = new_content
+            self._section_changed(section, added=new_content)
+            # The new item is last in the section, so its neighbors can be added to the existing index
+            if similarity is not None and not similarity.stale:
+                similarity.append(new_content.text)
+                self._similarity[section] = similarity
             
             # Save to file
             self.save_admin_content(section)
             
-            logger.info(f"Added new content to section {section} with ID {new_id}")
+            logger.info("Added new content to section %s with ID %s", section, new_id)
             return new_id
             
         except Exception as e:
-            logger.error(f"Error adding content to section {section}: {str(e)}")
+            logger.error("Error adding content to section %s: %s", section, e)
             return None
     
     def get_content(self, section: str, index: int) -> Optional[Content]:
         """Get content by section and index"""
         try:
+            self._ensure_loaded(section)
             if section not in self.content:
-                logger.warning(f"Section {section} not found")
+                logger.warning("Section %s not found", section)
                 return None
             
-            content_list = list(self.content[section].values())
-            if not content_list or index >= len(content_list):
-                logger.warning(f"Content not found at index {index} in section {section}")
+            content_list = self._ordered.get(section, [])
+            if not content_list or index < 0 or index >= len(content_list):
+                logger.warning("Content not found at index %s in section %s", index, section)
                 return None
                 
             return content_list[index]
             
         except Exception as e:
-            logger.error(f"Error getting content from section {section} at index {index}: {str(e)}")
+            logger.error("Error getting content from section %s at index %s: %s", section, index, e)
             return None
     
     def get_content_by_id(self, section: str, content_id: str) -> Optional[Content]:
         """Get content by section and ID"""
         try:
+            self._ensure_loaded(section)
             return self.content.get(section, {}).get(content_id)
         except Exception as e:
-            logger.error(f"Error getting content by ID from section {section}: {str(e)}")
+            logger.error("Error getting content by ID from section %s: %s", section, e)
             return None
     
+    def get_index_by_id(self, section: str, content_id: str) -> Optional[int]:
+        """Get the index of a content ID within its section"""
+        self._ensure_loaded(section)
+        return self._positions.get(section, {}).get(content_id)
+    
     def get_section_size(self, section: str) -> int:
         """Get number of items in a section"""
         try:
+            self._ensure_loaded(section)
             return len(self.content.get(section, {}))
         except Exception as e:
-            logger.error(f"Error getting section size for {section}: {str(e)}")
+            logger.error("Error getting section size for %s: %s", section, e)
             return 0
     
+    def build_similarity(self, section: str) -> Optional[SimilarityIndex]:
+        """Compute the nearest neighbors of every item of a section"""
+        self._ensure_loaded(section)
+        version = self.versions.get(section)
+        items = self._ordered.get(section)
+        if items is None:
+            return None
+        similarity = SimilarityIndex([content.text for content in items], SIMILAR_ITEMS)
+        # A section that changed meanwhile keeps its newer index (or none, to be built again)
+        if self.versions.get(section) == version:
+            self._similarity[section] = similarity
+        return similarity
+
+    def build_all_similarity(self) -> None:
+        """Build the similarity index of every loaded section that has none"""
+        for section in list(self._ordered):
+            if section not in self._similarity:
+                self.build_similarity(section)
+
+    def has_similarity(self, section: str) -> bool:
+        """Whether the similarity index of a section is built and up to date"""
+        return section in self._similarity
+
+    def get_similar(self, section: str, index: int) -> List[int]:
+        """Indexes of the items of `section` most similar to item `index`, most similar first.
+
+        Never builds the index: a build takes seconds on a big section, so it is empty until
+        build_similarity() has run.
+        """
+        try:
+            similarity = self._similarity.get(section)
+            return similarity.similar(index) if similarity else []
+        except Exception as e:
+            logger.error("Error finding items similar to %s of section %s: %s", index, section, e)
+            return []
+
     def get_tutorial(self, section: str) -> Optional[Content]:
         """Get tutorial content for a section"""
         try:
@@ -176,16 +299,18 @@ class ContentManager:
             if os.path.exists(tutorial_file):
                 with open(tutorial_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    return Content(
+                    tutorial = Content(
                         id="tutorial",
                         type="tutorial",
                         text=data['text'],
                         media_path=data.get('media_path'),
                         media_type=data.get('media_type')
                     )
+                    tutorial.plan_delivery()
+                    return tutorial
             return None
         except Exception as e:
-            logger.error(f"Error getting tutorial for section {section}: {str(e)}")
+            logger.error("Error getting tutorial for section %s: %s", section, e)
             return None
     
     def get_all_content_zip(self) -> Optional[str]:
@@ -194,8 +319,8 @@ class ContentManager:
             zip_path = os.path.join(self.content_dir, "all_content.zip")
             return zip_path if os.path.exists(zip_path) else None
         except Exception as e:
-            logger.error(f"Error getting content ZIP: {str(e)}")
+            logger.error("Error getting content ZIP: %s", e)
             return None
 
 # Global instance
-content_manager = ContentManager() 
\ No newline at end of file
+content_manager = ContentManager(CONTENT_DIR, lazy=True) 
\ No newline at end of file
@@ -0,0 +1,99 @@
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Telegram limits, in UTF-16 code units of the text after HTML parsing
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+# Room kept in every part for the "n از m" line the render cache appends
+FOOTER_RESERVE = 32
+
+TEXT = "text"
+MEDIA_KINDS = ("photo", "video", "document", "voice")
+
+# Delivery modes
+SINGLE = "single"  # one message: text, or media whose caption holds the whole text
+CAPTION_AND_TEXT = "caption_and_text"  # media with the start of the text, the rest in text messages
+PAGES = "pages"  # text too long for one message, split over several
+
+# Where to cut an over-long part, best first
+_BREAKS = ("\n\n", "\n", ". ", " ")
+
+
+@dataclass(frozen=True)
+class Delivery:
+    """How an item is sent: its first message's kind, the text of each message, attachment albums"""
+    kind: str
+    mode: str
+    parts: Tuple[str, ...]
+    albums: Tuple[Any, ...] = ()
+
+
+def telegram_length(text: str) -> int:
+    """Length as Telegram counts it (UTF-16 code units)"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _fits(text: str, limit: int) -> bool:
+    # A character is at most two code units, so short texts need no encoding
+    return len(text) * 2 <= limit or telegram_length(text) <= limit
+
+
+def _cut(text: str, limit: int) -> int:
+    """Largest prefix length of `text` that fits `limit`, preferring a paragraph or word break"""
+    end = min(len(text), limit)
+    while telegram_length(text[:end]) > limit:
+        end -= max(1, (telegram_length(text[:end]) - limit) // 2)
+    for separator in _BREAKS:
+        position = text.rfind(separator, end // 2, end)
+        if position > 0:
+            return position + len(separator)
+    return end
+
+
+def split_text(text: str, first_limit: int, limit: int = MESSAGE_LIMIT - FOOTER_RESERVE) -> List[str]:
+    """Cut `text` into parts: the first fits `first_limit`, every other part `limit`"""
+    parts = []
+    current_limit = first_limit
+    while not _fits(text, current_limit):
+        end = _cut(text, current_limit)
+        part = text[:end].rstrip()
+        if part:
+            parts.append(part)
+        text = text[end:].lstrip()
+        current_limit = limit
+    if text or not parts:
+        parts.append(text)
+    return parts
+
+
+def media_kind(media_path: Optional[str], media_type: Optional[str]) -> str:
+    """Kind of the first message for an item: its media kind, or text when the media cannot be sent"""
+    if not media_path or not media_type:
+        return TEXT
+    if media_type not in MEDIA_KINDS:
+        logger.warning("Unsupported media type %s for %s; sending text only", media_type, media_path)
+        return TEXT
+    # file_ids and URLs have no local file; a path that does not exist would fail on every send
+    if "/" in media_path and not media_path.startswith(("http://", "https://")) and not os.path.exists(media_path):
+        logger.warning("Media file %s does not exist; sending text only", media_path)
+        return TEXT
+    return media_type
+
+
+def plan_delivery(
+    text: str,
+    media_path: Optional[str] = None,
+    media_type: Optional[str] = None,
+    albums: Tuple[Any, ...] = (),
+) -> Delivery:
+    """Decide at load time which messages an item needs, so sending makes no failing calls"""
+    kind = media_kind(media_path, media_type)
+    if kind == TEXT:
+        parts = split_text(text, MESSAGE_LIMIT - FOOTER_RESERVE)
+        return Delivery(TEXT, SINGLE if len(parts) == 1 else PAGES, tuple(parts), albums)
+    parts = split_text(text, CAPTION_LIMIT - FOOTER_RESERVE)
+    return Delivery(kind, SINGLE if len(parts) == 1 else CAPTION_AND_TEXT, tuple(parts), albums)
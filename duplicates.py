@@ -0,0 +1,208 @@
+import logging
+import random
+import re
+import threading
+import zlib
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+try:
+    import numpy
+except ImportError:  # optional: only makes signatures faster
+    numpy = None
+
+from content_manager import Content, ContentManager
+from similarity import normalize_text
+
+logger = logging.getLogger(__name__)
+
+NUM_PERMUTATIONS = 64
+# 16 bands of 4 rows: texts sharing half their shingles are candidates with probability ~0.65,
+# at 0.7 with ~0.99, while unrelated texts almost never share a bucket
+BANDS = 16
+SHINGLE_WORDS = 3
+# Shingle hashes and permutation coefficients stay below 2**31, so a*x + b fits in 64 bits
+_PRIME = (1 << 31) - 1
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text: str) -> Set[int]:
+    """Hashes of the overlapping word triples of a normalized text (of its words, if shorter)"""
+    words = _WORD.findall(normalize_text(text))
+    if len(words) >= SHINGLE_WORDS:
+        words = [" ".join(words[start:start + SHINGLE_WORDS]) for start in range(len(words) - SHINGLE_WORDS + 1)]
+    return {zlib.crc32(word.encode()) % _PRIME for word in words}
+
+
+class DuplicateIndex:
+    """MinHash signatures of texts, bucketed by LSH bands for sub-linear lookups.
+
+    Each text is reduced to NUM_PERMUTATIONS minimum hashes of its shingles; the share
+    of equal minimums estimates the Jaccard similarity of two texts. Signatures are cut
+    into BANDS bands and every band is a hash table, so a query only compares the texts
+    that share at least one band with it instead of the whole catalogue.
+    """
+
+    def __init__(self, threshold: float, num_permutations: int = NUM_PERMUTATIONS, bands: int = BANDS, seed: int = 1):
+        self.threshold = threshold
+        self.rows = num_permutations // bands
+        rng = random.Random(seed)
+        self.a = [rng.randrange(1, _PRIME) for _ in range(num_permutations)]
+        self.b = [rng.randrange(0, _PRIME) for _ in range(num_permutations)]
+        if numpy is not None:
+            self._a = numpy.array(self.a, dtype=numpy.int64)[:, None]
+            self._b = numpy.array(self.b, dtype=numpy.int64)[:, None]
+        self.signatures: Dict[Hashable, Tuple[int, ...]] = {}
+        self.buckets: List[Dict[Tuple[int, ...], Set[Hashable]]] = [{} for _ in range(bands)]
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        """MinHash signature of a text; None for a text without words"""
+        hashes = shingles(text)
+        if not hashes:
+            return None
+        if numpy is not None:
+            values = numpy.fromiter(hashes, dtype=numpy.int64, count=len(hashes))
+            return tuple(((self._a * values + self._b) % _PRIME).min(axis=1).tolist())
+        return tuple(min((a * value + b) % _PRIME for value in hashes) for a, b in zip(self.a, self.b))
+
+    def _bands(self, signature: Tuple[int, ...]):
+        for band, bucket in enumerate(self.buckets):
+            yield bucket, signature[band * self.rows:(band + 1) * self.rows]
+
+    def add(self, key: Hashable, text: str) -> None:
+        """Index a text under `key`, replacing what was indexed under it before"""
+        self.remove(key)
+        signature = self.signature(text)
+        if signature is None:
+            return
+        self.signatures[key] = signature
+        for bucket, band in self._bands(signature):
+            bucket.setdefault(band, set()).add(key)
+
+    def remove(self, key: Hashable) -> None:
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for bucket, band in self._bands(signature):
+            keys = bucket[band]
+            keys.discard(key)
+            if not keys:
+                del bucket[band]
+
+    @staticmethod
+    def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+        """Estimated Jaccard similarity of the texts behind two signatures"""
+        return sum(x == y for x, y in zip(first, second)) / len(first)
+
+    def _matches(self, signature: Tuple[int, ...], exclude: Optional[Hashable] = None) -> List[Tuple[Hashable, float]]:
+        candidates = set()
+        for bucket, band in self._bands(signature):
+            candidates.update(bucket.get(band, ()))
+        candidates.discard(exclude)
+        matches = [(key, self.similarity(signature, self.signatures[key])) for key in candidates]
+        return sorted(
+            (match for match in matches if match[1] >= self.threshold),
+            key=lambda match: match[1],
+            reverse=True
+        )
+
+    def query(self, text: str, limit: int = 5) -> List[Tuple[Hashable, float]]:
+        """(key, estimated similarity) of the indexed texts closest to `text`, above the threshold"""
+        signature = self.signature(text)
+        return self._matches(signature)[:limit] if signature else []
+
+    def clusters(self) -> List[List[Hashable]]:
+        """Groups of keys linked by near-duplicate pairs, largest first"""
+        parents = {key: key for key in self.signatures}
+
+        def root(key):
+            while parents[key] != key:
+                parents[key] = parents[parents[key]]
+                key = parents[key]
+            return key
+
+        for key, signature in self.signatures.items():
+            for other, _ in self._matches(signature, exclude=key):
+                parents[root(other)] = root(key)
+        groups: Dict[Hashable, List[Hashable]] = {}
+        for key in self.signatures:
+            groups.setdefault(root(key), []).append(key)
+        return sorted((group for group in groups.values() if len(group) > 1), key=len, reverse=True)
+
+
+class ContentDuplicates:
+    """A DuplicateIndex per section of a ContentManager, keyed by content ID.
+
+    A section is indexed on its first check and then kept in step with its changes: only
+    items that are new, edited or gone are hashed again.
+    """
+
+    def __init__(self, content_manager: ContentManager, threshold: float):
+        self.content_manager = content_manager
+        self.threshold = threshold
+        self._sections: Dict[str, DuplicateIndex] = {}
+        self._texts: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+        content_manager.add_listener(self._section_changed)
+
+    def _items(self, section: str) -> Dict[str, str]:
+        """Text of every item of a section by ID; may load the section, so never called under the lock"""
+        size = self.content_manager.get_section_size(section)
+        items = (self.content_manager.get_content(section, index) for index in range(size))
+        return {content.id: content.text for content in items if content}
+
+    def _sync(self, section: str, items: Dict[str, str]) -> None:
+        index = self._sections.get(section)
+        if index is None:
+            index = self._sections[section] = DuplicateIndex(self.threshold)
+        texts = self._texts.setdefault(section, {})
+        for content_id in [content_id for content_id in texts if content_id not in items]:
+            index.remove(content_id)
+            del texts[content_id]
+        for content_id, text in items.items():
+            if texts.get(content_id) != text:
+                index.add(content_id, text)
+                texts[content_id] = text
+
+    def _section_changed(self, section: str, added: Optional[Content] = None) -> None:
+        if section not in self._sections:
+            return
+        if added is not None:
+            # Only a new item: hash it alone instead of comparing every text of the section
+            with self._lock:
+                texts = self._texts[section]
+                if added.id not in texts:
+                    self._sections[section].add(added.id, added.text)
+                    texts[added.id] = added.text
+            return
+        items = self._items(section)
+        with self._lock:
+            self._sync(section, items)
+
+    def _index(self, section: str) -> DuplicateIndex:
+        if section not in self._sections:
+            items = self._items(section)
+            with self._lock:
+                if section not in self._sections:
+                    self._sync(section, items)
+                    logger.debug("Indexed %s items of section %s for duplicates", len(items), section)
+        return self._sections[section]
+
+    def check(self, section: str, text: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """(content ID, estimated similarity) of the existing items of a section closest to `text`"""
+        index = self._index(section)
+        with self._lock:
+            return index.query(text, limit)
+
+    def audit(self, sections: List[str]) -> Dict[str, List[List[str]]]:
+        """Clusters of near-duplicate content IDs in each section that has any"""
+        report = {}
+        for section in sections:
+            index = self._index(section)
+            with self._lock:
+                clusters = index.clusters()
+            if clusters:
+                report[section] = clusters
+        return report
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+from telegram.ext import Application
+
+from content_manager import ContentManager
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = REGISTRY.histogram(
+    "millionisho_event_loop_lag_seconds",
+    "Delay between when a loop callback was due and when it ran",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_STALLS = REGISTRY.counter(
+    "millionisho_event_loop_stalls_total", "Times the event loop was blocked longer than the threshold"
+)
+
+# Seconds a store ping may take before the store counts as unreachable
+STORE_PING_TIMEOUT = 1.0
+
+
+class LoopWatchdog:
+    """Measures event loop lag and logs the stack of whatever blocks the loop.
+
+    A task on the loop wakes up every `interval` seconds and records how late it woke
+    up. A separate thread watches that heartbeat: when the loop has not come back for
+    `threshold` seconds, the loop thread's current stack is the blocking code, and it
+    is logged while the loop is still stuck.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25):
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def current_lag(self) -> float:
+        """Lag of the last tick, or how long the loop has been stuck if that is longer"""
+        stuck = time.monotonic() - self._heartbeat - self.interval
+        return max(self.lag, stuck, 0.0)
+
+    async def _measure(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(0.0, now - expected)
+            self.max_lag = max(self.max_lag, self.lag)
+            self._heartbeat = now
+            LOOP_LAG.observe(self.lag)
+
+    def _dump_loop_stack(self, stuck: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "(no frame)"
+        logger.warning("Event loop blocked for %.2fs, current stack:\n%s", stuck, stack)
+
+    def _watch(self) -> None:
+        reported = False
+        while not self._stop.wait(self.interval):
+            stuck = time.monotonic() - self._heartbeat - self.interval
+            if stuck < self.threshold:
+                reported = False
+            elif not reported:
+                # Once per stall; the stack of a long stall does not change
+                reported = True
+                self.stalls += 1
+                LOOP_STALLS.inc()
+                self._dump_loop_stack(stuck)
+
+    def start(self) -> None:
+        """Start watching the running loop"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class HealthCheck:
+    """/healthz (liveness) and /readyz (readiness) routes for the orchestrator"""
+
+    def __init__(
+        self,
+        application: Application,
+        watchdog: LoopWatchdog,
+        content_manager: ContentManager,
+        store: Any,
+        unhealthy_lag: float = 5.0,
+    ):
+        self.application = application
+        self.watchdog = watchdog
+        self.content_manager = content_manager
+        self.store = store
+        self.unhealthy_lag = unhealthy_lag
+
+    def add_routes(self, app: web.Application) -> None:
+        app.router.add_get("/healthz", self.handle_healthz)
+        app.router.add_get("/readyz", self.handle_readyz)
+
+    def _pending_updates(self) -> int:
+        pending = self.application.update_queue.qsize()
+        return pending + getattr(self.application.update_processor, "queued_updates", 0)
+
+    async def _store_connected(self) -> bool:
+        # A remote store call blocks, so it runs in a thread and must answer in time
+        try:
+            return bool(await asyncio.wait_for(asyncio.to_thread(self.store.ping), STORE_PING_TIMEOUT))
+        except Exception as e:
+            logger.warning("State store ping failed: %s", e)
+            return False
+
+    def _status(self) -> Dict[str, Any]:
+        return {
+            "loop_lag": round(self.watchdog.current_lag, 4),
+            "max_loop_lag": round(self.watchdog.max_lag, 4),
+            "loop_stalls": self.watchdog.stalls,
+            "pending_updates": self._pending_updates(),
+            "content_versions": dict(self.content_manager.versions),
+        }
+
+    async def handle_healthz(self, request: web.Request) -> web.Response:
+        """Alive unless the loop lags so much that the worker should be restarted"""
+        body = self._status()
+        healthy = self.watchdog.current_lag < self.unhealthy_lag
+        body["status"] = "ok" if healthy else "wedged"
+        return web.json_response(body, status=200 if healthy else 503)
+
+    async def handle_readyz(self, request: web.Request) -> web.Response:
+        """Ready when the application runs, content is loaded and the store answers"""
+        body = self._status()
+        body["running"] = self.application.running
+        body["content_loaded"] = bool(self.content_manager.content)
+        body["store_connected"] = await self._store_connected()
+        ready = body["running"] and body["content_loaded"] and body["store_connected"]
+        body["status"] = "ready" if ready else "not_ready"
+        return web.json_response(body, status=200 if ready else 503)
@@ -0,0 +1,61 @@
+import logging
+import random
+from typing import Dict, List, Optional, Tuple
+
+from content_manager import Content, ContentManager
+from permutation import FeistelPermutation
+
+logger = logging.getLogger(__name__)
+
+# One item of each section makes a complete idea, in this order
+IDEA_SECTIONS = ("reels_idea", "caption", "call_to_action", "bio")
+
+
+class IdeaGenerator:
+    """Complete ideas: one item of each of IDEA_SECTIONS, without repeats per user.
+
+    Every combination of items has a number in range(space size). A user walks the
+    numbers in the order of a FeistelPermutation keyed by their seed, so their state
+    is a seed and a position whatever the size of the space, and each step is a few
+    hash rounds plus a mixed-radix split of the number. After the last combination, or
+    when a section's size changes, the walk restarts with a new seed.
+    """
+
+    def __init__(self, content_manager: ContentManager, sections: Tuple[str, ...] = IDEA_SECTIONS):
+        self.content_manager = content_manager
+        self.sections = sections
+        self._rng = random.Random()
+
+    def section_sizes(self) -> List[int]:
+        return [self.content_manager.get_section_size(section) for section in self.sections]
+
+    @staticmethod
+    def space_size(sizes: List[int]) -> int:
+        """Number of combinations of items from sections of these sizes"""
+        space = 1
+        for size in sizes:
+            space *= size
+        return space
+
+    def combination(self, number: int, sizes: List[int]) -> List[Content]:
+        """Items of combination `number`: its digits in the mixed radix of the section sizes"""
+        items = []
+        for section, size in zip(self.sections, sizes):
+            number, index = divmod(number, size)
+            items.append(self.content_manager.get_content(section, index))
+        return items
+
+    def next_idea(self, walk: Optional[Dict]) -> Optional[Tuple[List[Content], Dict]]:
+        """The next idea of a user's walk and the walk to store; None when a section is empty"""
+        sizes = self.section_sizes()
+        space = self.space_size(sizes)
+        if space == 0:
+            return None
+        if not walk or walk.get("sizes") != sizes or walk.get("position", 0) >= space:
+            if walk and walk.get("sizes") != sizes:
+                logger.debug("Idea sections changed size; starting a new walk")
+            walk = {"seed": self._rng.getrandbits(64), "position": 0, "sizes": sizes}
+        number = FeistelPermutation(space, walk["seed"])[walk["position"]]
+        items = self.combination(number, sizes)
+        walk = dict(walk, position=walk["position"] + 1)
+        return items, walk
@@ -0,0 +1,162 @@
+import json
+import logging
+import re
+from typing import Any, Callable, Iterator, Optional, TextIO, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional: only makes decoding faster
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Characters read from the file at a time; only the item being scanned is kept beyond that
+CHUNK_SIZE = 64 * 1024
+
+_DECODER = json.JSONDecoder()
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_STRING_REST = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_SCALAR_END = re.compile(r'[,\]\s]')
+_WHITESPACE = " \t\r\n"
+_SEPARATORS = _WHITESPACE + ","
+_BOM = "\ufeff"
+
+
+def loads(data: str) -> Any:
+    """Decode one JSON value, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _log_error(index: int, error: Exception) -> None:
+    logger.warning("Skipping item %s: %s", index, error)
+
+
+class _Scanner:
+    """Finds where the next JSON value ends in a file read chunk by chunk"""
+
+    def __init__(self, f: TextIO, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        # Start of the value being scanned; everything before it can be dropped
+        self.start = 0
+
+    def fill(self) -> bool:
+        """Read another chunk, dropping consumed text; False at end of file"""
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buf = self.buf[self.start:] + chunk
+        self.pos -= self.start
+        self.start = 0
+        return True
+
+    def next_char(self, skip: str = "") -> Optional[str]:
+        """First character at or after pos that is not in `skip`, or None at end of file"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in skip:
+                self.pos += 1
+            self.start = self.pos
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return None
+
+    def _skip_string(self) -> bool:
+        """Move past a string whose opening quote is just before pos"""
+        while True:
+            match = _STRING_REST.match(self.buf, self.pos)
+            if match:
+                self.pos = match.end()
+                return True
+            if not self.fill():
+                return False
+
+    def scan_value(self) -> bool:
+        """Move pos to the end of the value at pos; False if the file ends first"""
+        first = self.buf[self.pos]
+        if first == '"':
+            self.pos += 1
+            return self._skip_string()
+        if first not in "{[":
+            while True:
+                match = _SCALAR_END.search(self.buf, self.pos)
+                if match:
+                    self.pos = match.start()
+                    return True
+                self.pos = len(self.buf)
+                if not self.fill():
+                    return True
+        depth = 0
+        while True:
+            match = _STRUCTURE.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                if not self.fill():
+                    return False
+                continue
+            char = match.group()
+            self.pos = match.end()
+            if char == '"':
+                if not self._skip_string():
+                    return False
+            elif char in "{[":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return True
+
+
+def iter_json_array(
+    f: TextIO,
+    on_error: Callable[[int, Exception], None] = _log_error,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Tuple[int, Any]]:
+    """Yield (index, item) for the items of a top-level JSON array, one at a time.
+
+    Memory use is one chunk plus the current item, never the whole list. Items are
+    decoded in place by the C scanner of the json module; an item that runs past the
+    chunk, or fails to decode there, is delimited by bracket matching and decoded on its
+    own (with orjson when available). A broken item is passed to `on_error` with its
+    index and skipped; as long as its brackets balance, the items after it still load.
+    A file that is not an array raises ValueError; a truncated file ends the iteration
+    after reporting the incomplete item.
+    """
+    scanner = _Scanner(f, chunk_size)
+    if scanner.next_char() == _BOM:
+        scanner.pos += 1
+    if scanner.next_char(_WHITESPACE) != "[":
+        raise ValueError("expected a JSON array")
+    scanner.pos += 1
+    index = 0
+    while True:
+        first = scanner.next_char(_SEPARATORS)
+        if first is None:
+            on_error(index, ValueError("unexpected end of file, array is not closed"))
+            return
+        if first == "]":
+            return
+        try:
+            item, end = _DECODER.raw_decode(scanner.buf, scanner.pos)
+            # A value that ends with the buffer may continue in the next chunk
+            complete = end < len(scanner.buf)
+        except ValueError:
+            complete = False
+        if complete:
+            scanner.pos = end
+        else:
+            if not scanner.scan_value():
+                on_error(index, ValueError("unexpected end of file inside an item"))
+                return
+            try:
+                item = loads(scanner.buf[scanner.start:scanner.pos])
+            except ValueError as e:
+                on_error(index, e)
+                index += 1
+                continue
+        yield index, item
+        index += 1
@@ -0,0 +1,141 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    LOG_LEVEL,
+    LOG_LEVELS,
+    LOG_FILE,
+    LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT,
+    LOG_CONSOLE,
+    LOG_SAMPLE_RATE,
+    LOG_SAMPLE_BURST,
+)
+from rate_limiter import TokenBucket
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Sampling state is dropped when this many distinct messages have been seen
+MAX_SAMPLED_MESSAGES = 10000
+
+_listener: Optional[QueueListener] = None
+
+
+class SamplingFilter(logging.Filter):
+    """Rate-limits DEBUG and INFO records per message; warnings and errors always pass.
+
+    Records are grouped by logger and unformatted message, so every user's "Callback
+    received" line shares one token bucket. The next record let through reports how many
+    of its group were dropped.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.dropped = 0
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._suppressed: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate <= 0:
+            return True
+
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_SAMPLED_MESSAGES:
+                    self._buckets.clear()
+                    self._suppressed.clear()
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            if bucket.delay(now) > 0:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                self.dropped += 1
+                return False
+            bucket.consume()
+            suppressed = self._suppressed.pop(key, 0)
+
+        if suppressed:
+            record.msg = "%s (%d similar messages suppressed)" % (record.getMessage(), suppressed)
+            record.args = None
+        return True
+
+
+class _LocalQueueHandler(QueueHandler):
+    """QueueHandler for a queue read in this process.
+
+    The stock handler formats the message before queueing it so the record can be
+    pickled; here the record is passed as is and the listener thread formats it.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_levels(levels: str) -> List[Tuple[str, str]]:
+    """Turn "bot=DEBUG,httpx=WARNING" into (logger name, level) pairs"""
+    pairs = []
+    for item in levels.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            pairs.append((name.strip(), level.strip().upper()))
+    return pairs
+
+
+def setup_logging(
+    level: str = LOG_LEVEL,
+    levels: str = LOG_LEVELS,
+    log_file: Optional[str] = LOG_FILE,
+    console: bool = LOG_CONSOLE,
+    sample_rate: float = LOG_SAMPLE_RATE,
+    sample_burst: float = LOG_SAMPLE_BURST,
+) -> QueueListener:
+    """Route all logging through a queue so file and console I/O happen off the event loop"""
+    global _listener
+    stop_logging()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers: List[logging.Handler] = []
+    if log_file:
+        handlers.append(RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        ))
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _LocalQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate, sample_burst))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    for name, logger_level in parse_levels(levels):
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -27,15 +27,49 @@ TEMPLATE_SUBMENU_BUTTONS = {
 NAVIGATION_BUTTONS = {
     "next": "بعدی",
     "back": "بازگشت به مرحله قبل",
+    "first": "« اولین",
+    "last": "آخرین »",
+    "back_10": "« ۱۰ قبلی",
+    "next_10": "۱۰ بعدی »",
+    "back_100": "« ۱۰۰ قبلی",
+    "next_100": "۱۰۰ بعدی »",
+    "go_to": "🔢 رفتن به شماره",
+    "next_idea": "🎲 ایده بعدی",
+    "favorite": "⭐ افزودن به علاقه‌مندی‌ها",
+    "trending": "🔥 پرطرفدارها",
+    "similar": "🔗 موارد مشابه",
     "back_to_main": "بازگشت به منوی اصلی"
 }
 
+# کد کوتاه هر بخش برای callback_data (حداکثر ۶۴ بایت)
+SECTION_CODES = {
+    "text_template": "tt",
+    "image_template": "it",
+    "reels_idea": "ri",
+    "call_to_action": "ca",
+    "caption": "cp",
+    "interactive_story": "is",
+    "bio": "bi",
+    "roadmap": "rm"
+}
+
 # پیام‌های سیستمی
 MESSAGES = {
     "welcome": "به ربات میلیونی‌شو خوش آمدید! 👋\nلطفاً یکی از گزینه‌های زیر را انتخاب کنید:",
     "vip_only": "کاربر عزیز این بخش مخصوص مشترکین vip ما هست",
     "free_limit_reached": "برای استفاده از امکانات کامل ربات و دسترسی به همه قالب ها نیاز به داشتن اشتراک دارید",
-    "already_subscribed": "کاربر عزیز شما جزو مشترکین ما هستید نیاز به تهییه اشتراک دیگری ندارید"
+    "already_subscribed": "کاربر عزیز شما جزو مشترکین ما هستید نیاز به تهییه اشتراک دیگری ندارید",
+    "go_to_prompt": "شماره محتوای مورد نظر را بین ۱ و {size} ارسال کنید:",
+    "invalid_number": "شماره وارد شده معتبر نیست؛ شماره باید بین ۱ و {size} باشد. برای تلاش دوباره، دکمه «🔢 رفتن به شماره» را بزنید.",
+    "deep_link_not_found": "محتوای این لینک پیدا نشد.",
+    "favorite_added": "به علاقه‌مندی‌ها اضافه شد ⭐",
+    "favorite_exists": "این محتوا قبلاً در علاقه‌مندی‌های شما بوده است.",
+    "trending_title": "🔥 پرطرفدارترین‌های {section}:",
+    "trending_empty": "هنوز آماری برای این بخش ثبت نشده است.",
+    "similar_title": "🔗 موارد مشابه شماره {number} در {section}:",
+    "similar_empty": "مورد مشابهی برای این محتوا پیدا نشد.",
+    "content_changed": "محتوای این بخش تغییر کرده است. لطفاً بخش را دوباره از منو باز کنید.",
+    "similar_pending": "موارد مشابه این بخش در حال آماده شدن است. لطفاً چند لحظه بعد دوباره امتحان کنید."
 }
 
 # تنظیمات محدودیت‌های رایگان
@@ -64,4 +98,10 @@ CONTENT_COUNTS = {
     "call_to_action": 50,  # مثال
     "caption": 80,  # مثال
     "bio": 40  # مثال
-} 
\ No newline at end of file
+} 
+# پیوست‌های هر محتوا: کلید additional_info -> (نوع رسانه، عنوان)
+# پیوست‌ها به ترتیب همین فهرست در آلبوم قرار می‌گیرند
+ATTACHMENTS = {
+    "video_tutorial": ("video", "🎬 ویدیوی آموزشی"),
+    "pdf_guide": ("document", "📄 راهنمای PDF")
+}
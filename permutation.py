@@ -0,0 +1,67 @@
+from typing import List
+
+MASK64 = (1 << 64) - 1
+ROUNDS = 4
+
+
+def mix64(value: int) -> int:
+    """splitmix64 finalizer: spreads every input bit over the 64-bit result"""
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
+
+class FeistelPermutation:
+    """Keyed bijection of range(size), computed one position at a time.
+
+    A balanced Feistel network permutes the smallest even-bit-width power of two that
+    holds `size`; positions that land outside range(size) are encrypted again (cycle
+    walking) until they fall inside. The domain is under 4 * size, so a lookup takes a
+    few rounds on average whatever the size, and the whole order is described by
+    (size, key) alone.
+    """
+
+    def __init__(self, size: int, key: int):
+        if size < 1:
+            raise ValueError("size must be positive")
+        self.size = size
+        self.half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+        self.half_mask = (1 << self.half_bits) - 1
+        self.round_keys: List[int] = []
+        state = key & MASK64
+        for _ in range(ROUNDS):
+            state = mix64(state + 0x9E3779B97F4A7C15)
+            self.round_keys.append(state)
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for round_key in self.round_keys:
+            left, right = right, left ^ (mix64(right ^ round_key) & self.half_mask)
+        return (left << self.half_bits) | right
+
+    def _decrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for round_key in reversed(self.round_keys):
+            left, right = right ^ (mix64(left ^ round_key) & self.half_mask), left
+        return (left << self.half_bits) | right
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, position: int) -> int:
+        """Value at `position` of the permuted order"""
+        if not 0 <= position < self.size:
+            raise IndexError(position)
+        value = self._encrypt(position)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def index(self, value: int) -> int:
+        """Position of `value` in the permuted order (the inverse of [])"""
+        if not 0 <= value < self.size:
+            raise ValueError(value)
+        position = self._decrypt(value)
+        while position >= self.size:
+            position = self._decrypt(position)
+        return position
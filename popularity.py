@@ -0,0 +1,196 @@
+import heapq
+import logging
+import math
+import threading
+import time
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+
+from content_manager import Content, ContentManager
+
+logger = logging.getLogger(__name__)
+
+# Rescale once event weights reach e**RESCALE_EXPONENT, long before floats lose precision
+RESCALE_EXPONENT = 50.0
+
+
+class _SectionStats:
+    """Counters of one section, one array slot per item index"""
+
+    def __init__(self, ids: List[str]):
+        self.ids = ids
+        self.views = array("d", bytes(8 * len(ids)))
+        self.favorites = array("d", bytes(8 * len(ids)))
+        self.scores = array("d", bytes(8 * len(ids)))
+        # Min-heap of [score, index] for the best items, and the entry of each member
+        self.top: List[List[float]] = []
+        self.members: Dict[int, List[float]] = {}
+
+
+class PopularityTracker:
+    """Decayed view and favorite counts per item, with a top-K kept up to date per section.
+
+    Counts decay exponentially with the configured half-life. Instead of shrinking every
+    counter over time, an event at time t adds exp((t - landmark) / tau) ("forward decay"),
+    so an event costs O(1) and the relative order of scores never needs a sweep; all
+    arrays are rescaled only when the weights grow large. Because stored scores only go
+    up, a K-item min-heap stays exact by checking each changed item against its minimum.
+
+    Counters are kept per worker on purpose: a worker counts the users of its shard, and
+    shards are picked by a hash of the user ID, so each one is a uniform sample of all
+    users that ranks the same items on top. Sharing them would add a store round trip to
+    every view.
+    """
+
+    def __init__(
+        self,
+        content_manager: ContentManager,
+        half_life: float,
+        top_k: int = 10,
+        favorite_weight: float = 5.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.content_manager = content_manager
+        self.tau = half_life / math.log(2)
+        self.top_k = top_k
+        self.favorite_weight = favorite_weight
+        self.clock = clock
+        self.landmark = clock()
+        self._sections: Dict[str, _SectionStats] = {}
+        self._lock = threading.Lock()
+        content_manager.add_listener(self._section_changed)
+
+    def _weight(self) -> float:
+        exponent = (self.clock() - self.landmark) / self.tau
+        if exponent > RESCALE_EXPONENT:
+            self._rescale()
+            exponent = 0.0
+        return math.exp(exponent)
+
+    def _rescale(self) -> None:
+        """Move the landmark to now, shrinking every stored value by the same factor"""
+        now = self.clock()
+        factor = math.exp(-(now - self.landmark) / self.tau)
+        for stats in self._sections.values():
+            for values in (stats.views, stats.favorites, stats.scores):
+                for index in range(len(values)):
+                    values[index] *= factor
+            for entry in stats.top:
+                entry[0] *= factor
+        self.landmark = now
+        logger.debug("Rescaled popularity counters")
+
+    def _ids(self, section: str) -> List[str]:
+        """Item IDs of a section in index order; may load the section, so never called under the lock"""
+        size = self.content_manager.get_section_size(section)
+        return [self.content_manager.get_content(section, index).id for index in range(size)]
+
+    def _section_changed(self, section: str, added: Optional[Content] = None) -> None:
+        """Re-align the counters of a changed section with its new item order, by item ID"""
+        if section not in self._sections:
+            return
+        ids = self._ids(section)
+        with self._lock:
+            old = self._sections.pop(section, None)
+            if old is None:
+                return
+            stats = self._sections[section] = _SectionStats(ids)
+            self._merge(stats, old, 1.0)
+
+    def _merge(self, stats: _SectionStats, other: _SectionStats, factor: float) -> None:
+        """Add the counters of `other`, times `factor`, to the items of `stats` with the same ID (under the lock)"""
+        positions = {content_id: index for index, content_id in enumerate(other.ids)}
+        for index, content_id in enumerate(stats.ids):
+            previous = positions.get(content_id)
+            if previous is not None:
+                stats.views[index] += other.views[previous] * factor
+                stats.favorites[index] += other.favorites[previous] * factor
+                stats.scores[index] += other.scores[previous] * factor
+        stats.top.clear()
+        stats.members.clear()
+        best = heapq.nlargest(self.top_k, range(len(stats.scores)), key=stats.scores.__getitem__)
+        for index in best:
+            if stats.scores[index] > 0:
+                self._offer(stats, index)
+
+    def snapshot(self) -> Dict:
+        """Counters of every section, picklable, for restore() after a restart"""
+        with self._lock:
+            return {
+                "landmark": self.landmark,
+                "sections": {
+                    section: (list(stats.ids), stats.views.tobytes(), stats.favorites.tobytes(), stats.scores.tobytes())
+                    for section, stats in self._sections.items()
+                },
+            }
+
+    def restore(self, snapshot: Dict) -> None:
+        """Add the counters of an earlier snapshot(); may load sections, so call it off the event loop"""
+        for section, (ids, views, favorites, scores) in snapshot["sections"].items():
+            saved = _SectionStats(ids)
+            for values, data in ((saved.views, views), (saved.favorites, favorites), (saved.scores, scores)):
+                values[:] = array("d", data)
+            current = self._ids(section)
+            with self._lock:
+                stats = self._sections.setdefault(section, _SectionStats(current))
+                # Both sides hold weights relative to their own landmark
+                self._merge(stats, saved, math.exp((snapshot["landmark"] - self.landmark) / self.tau))
+
+    def _offer(self, stats: _SectionStats, index: int) -> None:
+        """Update the top-K after the score of `index` went up"""
+        score = stats.scores[index]
+        entry = stats.members.get(index)
+        if entry is not None:
+            entry[0] = score
+            heapq.heapify(stats.top)
+        elif len(stats.top) < self.top_k:
+            entry = [score, index]
+            stats.members[index] = entry
+            heapq.heappush(stats.top, entry)
+        elif score > stats.top[0][0]:
+            entry = [score, index]
+            stats.members[index] = entry
+            removed = heapq.heapreplace(stats.top, entry)
+            del stats.members[int(removed[1])]
+
+    def _record(self, section: str, index: int, favorite: bool) -> None:
+        if section not in self._sections:
+            ids = self._ids(section)
+            with self._lock:
+                self._sections.setdefault(section, _SectionStats(ids))
+        with self._lock:
+            stats = self._sections[section]
+            if not 0 <= index < len(stats.ids):
+                return
+            weight = self._weight()
+            if favorite:
+                stats.favorites[index] += weight
+                stats.scores[index] += weight * self.favorite_weight
+            else:
+                stats.views[index] += weight
+                stats.scores[index] += weight
+            self._offer(stats, index)
+
+    def record_view(self, section: str, index: int) -> None:
+        self._record(section, index, favorite=False)
+
+    def record_favorite(self, section: str, index: int) -> None:
+        self._record(section, index, favorite=True)
+
+    def trending(self, section: str) -> List[Tuple[int, float]]:
+        """(index, decayed score) of the section's most popular items, best first"""
+        with self._lock:
+            stats = self._sections.get(section)
+            if stats is None:
+                return []
+            scale = math.exp(-(self.clock() - self.landmark) / self.tau)
+            return [(int(index), score * scale) for score, index in sorted(stats.top, reverse=True)]
+
+    def counts(self, section: str, index: int) -> Tuple[float, float]:
+        """Decayed (views, favorites) of an item"""
+        with self._lock:
+            stats = self._sections.get(section)
+            if stats is None or not 0 <= index < len(stats.ids):
+                return 0.0, 0.0
+            scale = math.exp(-(self.clock() - self.landmark) / self.tau)
+            return stats.views[index] * scale, stats.favorites[index] * scale
@@ -0,0 +1,140 @@
+import asyncio
+import io
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Deeper frames are cut off; handler stacks are far shallower than this
+MAX_STACK_DEPTH = 128
+
+# How often the processed update count is checked while profiling N updates
+UPDATE_POLL_INTERVAL = 0.05
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+class StackSampler:
+    """Samples one thread's stack from a background thread.
+
+    The event loop thread runs every handler, so its stack at any moment is the
+    coroutine currently holding the loop (or the selector when idle). Samples are
+    aggregated as collapsed stacks, the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        if stack:
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def collapsed(self) -> str:
+        """One "frame;frame;frame count" line per distinct stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileSession:
+    """Profiles the event loop for a number of seconds or updates and sends the result.
+
+    Nothing runs while no session is active: the sampling thread only exists for the
+    duration of a session. Updates are counted by the update processor, so profiling
+    adds no handler to the dispatch path.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        chat_id: int,
+        seconds: float,
+        max_updates: Optional[int] = None,
+        interval: float = 0.005,
+    ):
+        self.application = application
+        self.chat_id = chat_id
+        self.seconds = seconds
+        self.max_updates = max_updates
+        self.interval = interval
+        self.updates = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _processed_updates(self) -> int:
+        return getattr(self.application.update_processor, "processed_updates", 0)
+
+    async def _wait(self, started: float) -> None:
+        first_update = self._processed_updates()
+        deadline = started + self.seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(UPDATE_POLL_INTERVAL, deadline - time.monotonic()))
+            self.updates = self._processed_updates() - first_update
+            if self.max_updates and self.updates >= self.max_updates:
+                return
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        started = time.monotonic()
+        sampler.start()
+        logger.info("Profiling started for %ss / %s updates", self.seconds, self.max_updates)
+        try:
+            await self._wait(started)
+        finally:
+            sampler.stop()
+
+        elapsed = time.monotonic() - started
+        logger.info("Profiling finished: %s samples, %s updates in %.1fs", sampler.samples, self.updates, elapsed)
+        try:
+            if not sampler.samples:
+                await self.application.bot.send_message(self.chat_id, "هیچ نمونه‌ای ثبت نشد.")
+                return
+            document = io.BytesIO(sampler.collapsed().encode("utf-8"))
+            await self.application.bot.send_document(
+                self.chat_id,
+                document=document,
+                filename=f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded",
+                caption=f"🔬 {sampler.samples} نمونه، {self.updates} آپدیت، {elapsed:.1f} ثانیه",
+            )
+        except Exception as e:
+            logger.error("Error sending profile: %s", e)
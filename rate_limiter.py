@@ -0,0 +1,339 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Priorities for rate_limit_args={"priority": ...}; lower values are sent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+# Endpoints that count against Telegram's message limits
+LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+
+# How many waiting requests are inspected per priority when looking for a ready chat
+SCAN_LIMIT = 64
+
+BOT_API_LATENCY = REGISTRY.histogram(
+    "millionisho_bot_api_request_seconds", "Bot API call duration, excluding time queued", ("endpoint",)
+)
+BOT_API_QUEUE_LATENCY = REGISTRY.histogram(
+    "millionisho_bot_api_queue_seconds", "Time a Bot API call waited for flood control", ("priority",)
+)
+
+
+class TokenBucket:
+    """Token bucket that can additionally be blocked for a fixed time after a 429"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 when one is available now)"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        """True when the bucket is full and unblocked, i.e. it can be dropped"""
+        return self.delay(now) == 0.0 and self.tokens >= self.capacity
+
+
+class _Request:
+    __slots__ = ("chat_id", "priority", "edit_key", "enqueued", "ready", "done")
+
+    def __init__(self, chat_id: Optional[Union[int, str]], priority: int, edit_key: Optional[Tuple]):
+        loop = asyncio.get_running_loop()
+        self.chat_id = chat_id
+        self.priority = priority
+        self.edit_key = edit_key
+        self.enqueued = time.monotonic()
+        # Resolves with None when it may be sent, or with the newer request that replaced it
+        self.ready: asyncio.Future = loop.create_future()
+        # Outcome of the request, awaited by the edits it replaced
+        self.done: asyncio.Future = loop.create_future()
+
+    def finish(self, result: Any = None, exception: Optional[BaseException] = None) -> None:
+        if exception is not None:
+            self.done.set_exception(exception)
+            self.done.exception()  # nobody may be waiting; don't log it as never retrieved
+        else:
+            self.done.set_result(result)
+
+
+class FloodControlRateLimiter(BaseRateLimiter[Dict[str, Any]]):
+    """Schedules outgoing Bot API calls under a global and a per-chat token bucket.
+
+    Interactive requests are dispatched before bulk ones, a waiting edit of a message is
+    merged into a newer edit of the same message, and RetryAfter errors pause the affected
+    bucket before the request is retried.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        group_rate_per_minute: float = 20,
+        max_retries: int = 3,
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate_per_minute / 60
+        self.max_retries = max_retries
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        self._queues: Dict[int, Deque[_Request]] = {PRIORITY_INTERACTIVE: deque(), PRIORITY_BULK: deque()}
+        self._pending_edits: Dict[Tuple, _Request] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        self.retry_after_count = 0
+        self.merged_edits = 0
+        self._latency: Dict[int, List[float]] = {p: [0, 0.0, 0.0] for p in self._queues}  # count, total, max
+
+    async def initialize(self) -> None:
+        if self._dispatcher is None:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    @property
+    def queued_requests(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue latency per priority and flood control counters"""
+        latency = {}
+        for priority, (count, total, maximum) in self._latency.items():
+            latency[PRIORITY_NAMES[priority]] = {
+                "count": count,
+                "avg": total / count if count else 0.0,
+                "max": maximum,
+            }
+        return {
+            "queued_requests": self.queued_requests,
+            "retry_after_count": self.retry_after_count,
+            "merged_edits": self.merged_edits,
+            "chat_buckets": len(self._chats),
+            "queue_latency": latency,
+        }
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            if is_group:
+                bucket = TokenBucket(self.group_rate, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _prune_chat_buckets(self, now: float) -> None:
+        idle = [chat_id for chat_id, bucket in self._chats.items() if bucket.is_idle(now)]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    def _enqueue(self, request: _Request, retry: bool = False) -> None:
+        if request.edit_key is not None:
+            older = self._pending_edits.get(request.edit_key)
+            if older is not None:
+                # The older edit has not been sent yet; the newer one makes it pointless
+                self._queues[older.priority].remove(older)
+                if not older.ready.done():
+                    older.ready.set_result(request)
+                self.merged_edits += 1
+            self._pending_edits[request.edit_key] = request
+
+        if retry:
+            self._queues[request.priority].appendleft(request)
+        else:
+            self._queues[request.priority].append(request)
+        self._wakeup.set()
+
+    def _next_ready(self, now: float) -> Tuple[Optional[_Request], float]:
+        """First waiting request (by priority) whose chat bucket has a token"""
+        min_delay = 1.0
+        for priority in sorted(self._queues):
+            for position, request in enumerate(self._queues[priority]):
+                if position >= SCAN_LIMIT:
+                    break
+                if request.chat_id is None:
+                    return request, 0.0
+                delay = self._chat_bucket(request.chat_id).delay(now)
+                if delay == 0.0:
+                    return request, 0.0
+                min_delay = min(min_delay, delay)
+        return None, min_delay
+
+    async def _sleep(self, delay: float) -> None:
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _dispatch(self) -> None:
+        while True:
+            if not self.queued_requests:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            delay = self._global.delay(now)
+            if delay > 0:
+                await self._sleep(delay)
+                continue
+
+            request, delay = self._next_ready(now)
+            if request is None:
+                await self._sleep(delay)
+                continue
+
+            self._queues[request.priority].remove(request)
+            if request.edit_key is not None and self._pending_edits.get(request.edit_key) is request:
+                del self._pending_edits[request.edit_key]
+            if request.ready.done():
+                # The caller was cancelled while waiting
+                continue
+
+            self._global.consume()
+            if request.chat_id is not None:
+                self._chat_bucket(request.chat_id).consume()
+
+            waited = now - request.enqueued
+            latency = self._latency[request.priority]
+            latency[0] += 1
+            latency[1] += waited
+            latency[2] = max(latency[2], waited)
+            BOT_API_QUEUE_LATENCY.labels(PRIORITY_NAMES[request.priority]).observe(waited)
+
+            if len(self._chats) > 10000:
+                self._prune_chat_buckets(now)
+
+            request.ready.set_result(None)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        """Wait for a slot, then call the Bot API; retry after flood control errors"""
+        if not endpoint.startswith(LIMITED_PREFIXES):
+            return await self._call(callback, args, kwargs, endpoint)
+
+        await self.initialize()
+        if (rate_limit_args or {}).get("priority", PRIORITY_INTERACTIVE) >= PRIORITY_BULK:
+            priority = PRIORITY_BULK
+        else:
+            priority = PRIORITY_INTERACTIVE
+        chat_id = data.get("chat_id")
+        message_id = data.get("message_id")
+        edit_key = (endpoint, chat_id, message_id) if endpoint.startswith("edit") and message_id else None
+
+        request = _Request(chat_id, priority, edit_key)
+        self._enqueue(request)
+        try:
+            result = await self._send(request, callback, args, kwargs, endpoint)
+        except BaseException as e:
+            request.finish(exception=e)
+            raise
+        request.finish(result=result)
+        return result
+
+    @staticmethod
+    async def _call(
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        finally:
+            BOT_API_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+
+    async def _send(
+        self,
+        request: _Request,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+    ) -> Any:
+        attempt = 0
+        while True:
+            newer = await request.ready
+            if newer is not None:
+                return await asyncio.shield(newer.done)
+
+            try:
+                return await self._call(callback, args, kwargs, endpoint)
+            except RetryAfter as e:
+                self.retry_after_count += 1
+                if request.chat_id is not None:
+                    bucket = self._chat_bucket(request.chat_id)
+                else:
+                    bucket = self._global
+                bucket.block(time.monotonic(), e.retry_after)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.warning(
+                    "Flood control on %s for chat %s, retrying in %ss "
+                    "(attempt %s/%s)",
+                    endpoint, request.chat_id, e.retry_after, attempt, self.max_retries
+                )
+                self._requeue(request)
+
+    def _requeue(self, request: _Request) -> None:
+        request.ready = asyncio.get_running_loop().create_future()
+        request.enqueued = time.monotonic()
+        newer = self._pending_edits.get(request.edit_key) if request.edit_key is not None else None
+        if newer is not None:
+            # A newer edit of the same message arrived while we were backing off
+            request.ready.set_result(newer)
+            self.merged_edits += 1
+            return
+        self._enqueue(request, retry=True)
@@ -0,0 +1,89 @@
+import html
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+from telegram import InlineKeyboardMarkup
+
+from content_manager import Content, ContentManager
+from delivery import Delivery
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RenderedContent:
+    """A content item ready to be sent: the escaped HTML text of each planned message plus its keyboard"""
+    content: Content
+    parts: Tuple[str, ...]
+    keyboard: InlineKeyboardMarkup
+
+    @property
+    def kind(self) -> str:
+        return self.content.delivery.kind
+
+
+class RenderCache:
+    """Rendered messages of the most recently shown items of a ContentManager.
+
+    Items are rendered one at a time when first shown and kept in an LRU keyed by
+    (section, index, section version), so a changed section costs nothing up front:
+    entries of the old version are simply no longer asked for and age out. The cached
+    parts leave out the "n از m" footer, which depends on the section size and is
+    added when the item is served.
+    """
+
+    def __init__(
+        self,
+        content_manager: ContentManager,
+        keyboard_factory: Callable[[str, int, int], InlineKeyboardMarkup],
+        max_size: int = 1000,
+    ):
+        self.content_manager = content_manager
+        self.keyboard_factory = keyboard_factory
+        self.max_size = max_size
+        self._items: "OrderedDict[Tuple[str, int, int], Tuple[Content, Tuple[str, ...], InlineKeyboardMarkup]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def render_parts(delivery: Delivery, footer: str = "") -> Tuple[str, ...]:
+        """Escape the planned parts of an item; `footer` goes at the end of the last one"""
+        parts = [html.escape(part, quote=False) for part in delivery.parts]
+        if footer:
+            parts[-1] = f"{parts[-1]}\n\n{footer}"
+        return tuple(parts)
+
+    @staticmethod
+    def add_footer(parts: Tuple[str, ...], index: int, size: int) -> Tuple[str, ...]:
+        """Rendered parts with the item's position appended to the last one"""
+        return parts[:-1] + (f"{parts[-1]}\n\n{index + 1} از {size}",)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, section: str, index: int) -> Optional[RenderedContent]:
+        """Get the rendered item at `index` of `section`, rendering just that item on a miss"""
+        size = self.content_manager.get_section_size(section)
+        if not 0 <= index < size:
+            return None
+        key = (section, index, self.content_manager.versions.get(section, 0))
+        entry = self._items.get(key)
+        if entry is None:
+            self.misses += 1
+            content = self.content_manager.get_content(section, index)
+            if content is None:
+                return None
+            entry = self._items[key] = (
+                content,
+                self.render_parts(content.plan_delivery()),
+                self.keyboard_factory(section, index, size),
+            )
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        else:
+            self.hits += 1
+            self._items.move_to_end(key)
+        content, parts, keyboard = entry
+        return RenderedContent(content=content, parts=self.add_footer(parts, index, size), keyboard=keyboard)
@@ -0,0 +1,309 @@
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+from telegram import Bot
+
+from config import (
+    TELEGRAM_TOKEN,
+    TELEGRAM_API_URL,
+    RATE_LIMIT_GLOBAL,
+    STATE_STORE_URL,
+    STATE_STORE_AUTHKEY,
+    WORKER_COUNT,
+    WORKER_BASE_PORT,
+    LOG_FILE,
+    METRICS_LISTEN,
+    METRICS_PORT,
+    TRAFFIC_RECORD_FILE,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_CERT,
+    WEBHOOK_KEY,
+)
+from logging_setup import setup_logging
+from metrics import REGISTRY, MetricsServer
+from state_store import connect_state_store, parse_address, serve_state_store
+from webhook_server import SECRET_HEADER, WebhookServer, register_webhook
+
+logger = logging.getLogger(__name__)
+
+FORWARD_LATENCY = REGISTRY.histogram(
+    "millionisho_shard_forward_seconds", "Time to hand an update to its worker", ("worker",)
+)
+FORWARD_FAILURES = REGISTRY.counter(
+    "millionisho_shard_forward_failures_total", "Updates answered with 503 because the worker was unreachable", ("worker",)
+)
+
+
+def extract_user_id(update: Dict) -> Optional[int]:
+    """ID of the user (or else the chat) a raw update belongs to"""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        # poll_answer carries the sender as "user" instead of "from"
+        sender = value.get("from") or value.get("user")
+        if sender:
+            return sender.get("id")
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat.get("id")
+        return None
+    return None
+
+
+def shard_for(user_id: Optional[int], workers: int) -> int:
+    """Worker index for a user; stable across restarts unlike hash()"""
+    if user_id is None:
+        return 0
+    return zlib.crc32(str(user_id).encode()) % workers
+
+
+class ShardRouter(WebhookServer):
+    """Webhook front that forwards every update to the worker owning its user.
+
+    All updates of one user go to the same worker, so the per-user ordering of
+    PerUserUpdateProcessor still holds. Telegram retries an update answered with an
+    error, so an unreachable worker gets a 503 instead of losing the update.
+    """
+
+    def __init__(self, worker_urls: List[str], worker_secret: str, **kwargs):
+        super().__init__(application=None, **kwargs)
+        self.worker_urls = worker_urls
+        self.worker_secret = worker_secret
+        self.forwarded: Counter = Counter()
+        self.failed_forwards = 0
+        self._session: Optional[ClientSession] = None
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Validate the secret token and pass the raw update to its worker"""
+        received_token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(received_token.encode(), self.secret_token.encode()):
+            self.rejected_updates += 1
+            logger.warning("Rejected webhook request with invalid secret token from %s", request.remote)
+            return web.Response(status=403)
+
+        body = await request.read()
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            logger.error("Invalid update payload received: %s", e)
+            return web.Response(status=400)
+        if not isinstance(data, dict):
+            return web.Response(status=400)
+
+        shard = shard_for(extract_user_id(data), len(self.worker_urls))
+        self.received_updates += 1
+        headers = {SECRET_HEADER: self.worker_secret, "Content-Type": "application/json"}
+        started = time.perf_counter()
+        try:
+            async with self._session.post(self.worker_urls[shard], data=body, headers=headers) as response:
+                status = response.status
+        except (ClientError, asyncio.TimeoutError) as e:
+            self.failed_forwards += 1
+            FORWARD_FAILURES.labels(str(shard)).inc()
+            logger.error("Worker %s unreachable: %s", shard, e)
+            return web.Response(status=503)
+
+        FORWARD_LATENCY.labels(str(shard)).observe(time.perf_counter() - started)
+        self.forwarded[shard] += 1
+        return web.Response(status=status)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """Liveness route for load balancers"""
+        return web.json_response({
+            "status": "ok",
+            "workers": len(self.worker_urls),
+            "received_updates": self.received_updates,
+            "rejected_updates": self.rejected_updates,
+            "failed_forwards": self.failed_forwards,
+            "forwarded": {str(shard): count for shard, count in sorted(self.forwarded.items())},
+        })
+
+    async def start(self) -> None:
+        self._session = ClientSession(timeout=ClientTimeout(total=10))
+        await super().start()
+
+    async def stop(self) -> None:
+        await super().stop()
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+
+def wait_for_store(address: Tuple[str, int], authkey: bytes, timeout: float = 10.0) -> None:
+    """Block until the store server accepts connections"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            connect_state_store(address, authkey).ping()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+async def wait_for_workers(worker_urls: List[str], timeout: float = 30.0) -> None:
+    """Wait until every worker answers its health route"""
+    deadline = time.monotonic() + timeout
+    async with ClientSession(timeout=ClientTimeout(total=1)) as session:
+        for url in worker_urls:
+            health_url = url.rsplit("/", 1)[0] + "/health"
+            while True:
+                try:
+                    async with session.get(health_url) as response:
+                        if response.status == 200:
+                            break
+                except (ClientError, asyncio.TimeoutError):
+                    pass
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Worker at {url} did not start")
+                await asyncio.sleep(0.1)
+
+
+def _run_worker(port: int, secret_token: str) -> None:
+    from bot import MillionishoBot
+
+    bot = MillionishoBot()
+    try:
+        asyncio.run(bot.run_webhook(listen="127.0.0.1", port=port, secret_token=secret_token, register=False))
+    except KeyboardInterrupt:
+        pass
+
+
+def start_store(address: Tuple[str, int], authkey: bytes) -> multiprocessing.Process:
+    """Run the shared store in its own process"""
+    context = multiprocessing.get_context("spawn")
+    process = context.Process(target=serve_state_store, args=(address, authkey), name="state-store", daemon=True)
+    process.start()
+    wait_for_store(address, authkey)
+    return process
+
+
+def start_workers(
+    count: int,
+    base_port: int,
+    secret_token: str,
+    store_url: str,
+    env: Optional[Dict[str, str]] = None,
+) -> List[multiprocessing.Process]:
+    """Start `count` bot workers listening on consecutive local ports"""
+    context = multiprocessing.get_context("spawn")
+    worker_env = {
+        "STATE_STORE_URL": store_url,
+        # Each worker gets its share of Telegram's global message limit
+        "RATE_LIMIT_GLOBAL": str(RATE_LIMIT_GLOBAL / count),
+        **(env or {}),
+    }
+    # Spawned processes import config from the inherited environment before any code of
+    # theirs runs, so the settings have to be in this process's environment
+    os.environ.update(worker_env)
+    log_root, log_ext = os.path.splitext(LOG_FILE)
+    processes = []
+    for index in range(count):
+        # Rotating one file from several processes loses records, so each worker has its own
+        os.environ["LOG_FILE"] = f"{log_root}-worker{index}{log_ext}"
+        os.environ["WORKER_INDEX"] = str(index)
+        if TRAFFIC_RECORD_FILE:
+            # Appends from several processes would interleave; replay.py merges the files
+            traffic_root, traffic_ext = os.path.splitext(TRAFFIC_RECORD_FILE)
+            os.environ["TRAFFIC_RECORD_FILE"] = f"{traffic_root}-worker{index}{traffic_ext}"
+        if METRICS_PORT:
+            # Worker i serves its metrics on METRICS_PORT + 1 + i
+            os.environ["METRICS_PORT"] = str(METRICS_PORT + 1 + index)
+        process = context.Process(
+            target=_run_worker,
+            args=(base_port + index, secret_token),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+    return processes
+
+
+async def run_sharded(
+    workers: int = WORKER_COUNT,
+    listen: str = WEBHOOK_LISTEN,
+    port: int = WEBHOOK_PORT,
+    register: bool = True,
+    env: Optional[Dict[str, str]] = None,
+) -> None:
+    """Run the store, the workers and the webhook front until cancelled"""
+    processes = []
+    store_url = STATE_STORE_URL
+    if not store_url:
+        store_url = f"127.0.0.1:{WORKER_BASE_PORT - 1}"
+        processes.append(start_store(parse_address(store_url), STATE_STORE_AUTHKEY))
+    else:
+        wait_for_store(parse_address(store_url), STATE_STORE_AUTHKEY)
+
+    worker_secret = secrets.token_urlsafe(32)
+    worker_urls = [f"http://127.0.0.1:{WORKER_BASE_PORT + i}{WEBHOOK_PATH}" for i in range(workers)]
+    processes.extend(start_workers(workers, WORKER_BASE_PORT, worker_secret, store_url, env))
+
+    router = ShardRouter(
+        worker_urls,
+        worker_secret,
+        path=WEBHOOK_PATH,
+        listen=listen,
+        port=port,
+        secret_token=WEBHOOK_SECRET,
+        cert_file=WEBHOOK_CERT,
+        key_file=WEBHOOK_KEY,
+    )
+    metrics_server = MetricsServer(REGISTRY, METRICS_LISTEN, METRICS_PORT) if METRICS_PORT else None
+    try:
+        await wait_for_workers(worker_urls)
+        await router.start()
+        if metrics_server:
+            await metrics_server.start()
+        logger.info("Sharding updates across %s workers", workers)
+        if register:
+            base_url = f"{TELEGRAM_API_URL.rstrip('/')}/bot" if TELEGRAM_API_URL else "https://api.telegram.org/bot"
+            async with Bot(TELEGRAM_TOKEN, base_url=base_url) as bot:
+                await register_webhook(
+                    bot,
+                    WEBHOOK_URL,
+                    router.path,
+                    router.secret_token,
+                    cert_file=WEBHOOK_CERT if WEBHOOK_KEY else None,
+                )
+        await asyncio.Event().wait()
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        pass
+    finally:
+        if metrics_server:
+            await metrics_server.stop()
+        await router.stop()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(5)
+
+
+def main() -> None:
+    setup_logging()
+    if not WEBHOOK_URL:
+        raise SystemExit("WEBHOOK_URL must be set to run sharded workers")
+    try:
+        asyncio.run(run_sharded())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+from typing import Optional, Tuple
+
+from permutation import FeistelPermutation, mix64
+
+# The smallest shuffled domain, so tiny sections still get a real shuffle
+MIN_DOMAIN_BITS = 2
+
+
+def user_key(user_id: str) -> int:
+    """Shuffle key of a user; derived from the ID, so nothing has to be stored"""
+    return mix64(int(user_id) ^ 0x5DEECE66D) & 0xFFFFFFFF
+
+
+def domain_bits(size: int) -> int:
+    """Even bit width of the power of two a section of `size` items is shuffled in"""
+    bits = max(MIN_DOMAIN_BITS, (size - 1).bit_length())
+    return bits + (bits & 1)
+
+
+class ShuffledOrder:
+    """A user's order of a section: a keyed permutation of range(2 ** bits).
+
+    Positions whose value is past the end of the section are gaps and are skipped; the
+    domain is under four times the section size when the order is made, so a step skips
+    a few gaps at most. Items appended later fill gaps at fixed positions, so the order
+    of the items a user already walked does not change. Items beyond the domain follow
+    it in their natural order, until the walk wraps around and a wider order is made.
+    """
+
+    def __init__(self, key: int, bits: int):
+        self.key = key
+        self.bits = bits
+        self.domain = 1 << bits
+        self.permutation = FeistelPermutation(self.domain, key)
+
+    def length(self, size: int) -> int:
+        return max(self.domain, size)
+
+    def index(self, position: int, size: int) -> Optional[int]:
+        """Item index at `position`, or None for a gap"""
+        if position >= self.domain:
+            return position if position < size else None
+        value = self.permutation[position]
+        return value if value < size else None
+
+
+def step(key: int, bits: int, position: int, size: int, direction: int) -> Tuple[int, int, int]:
+    """(bits, position, index) of the next item from `position` in `direction` (+1 or -1).
+
+    Use direction 0 for the item at `position` itself, or the first one after it.
+    """
+    order = ShuffledOrder(key, bits)
+    if direction == 0:
+        direction = 1
+        position -= 1
+    while True:
+        position += direction
+        if not 0 <= position < order.length(size):
+            # A new lap covers every item, including those appended past the old domain
+            order = ShuffledOrder(key, domain_bits(size))
+            position = 0 if direction > 0 else order.length(size) - 1
+        index = order.index(position, size)
+        if index is not None:
+            return order.bits, position, index
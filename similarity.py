@@ -0,0 +1,199 @@
+import heapq
+import logging
+import math
+import re
+from array import array
+from collections import Counter
+from typing import Dict, List, Tuple
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:  # both are in requirements.txt; without them builds take minutes on big sections
+    numpy = sparse = None
+
+logger = logging.getLogger(__name__)
+
+# Similarities ranked at a time (rows x items of a block), so a block stays at 16 MB for any section size
+BLOCK_CELLS = 1 << 22
+# Appended items reuse the document frequencies of the last build; past this share a full build is due
+MAX_APPENDED_SHARE = 0.25
+
+# Arabic letters typed on Arabic keyboards, Persian/Arabic-Indic digits, and marks that do not change a word
+_NORMALIZE = str.maketrans({
+    "ي": "ی", "ى": "ی", "ك": "ک", "ة": "ه", "ۀ": "ه", "أ": "ا", "إ": "ا", "آ": "ا",
+    **{chr(code): str(digit) for digits in (0x06F0, 0x0660) for digit, code in enumerate(range(digits, digits + 10))},
+    **{chr(code): None for code in (*range(0x064B, 0x0660), 0x0670, 0x0640, 0x200C, 0x200F)},
+})
+_TOKEN = re.compile(r"[^\W\d_]{2,}")
+STOPWORDS = frozenset(
+    "و در به از که این آن را با برای است تا یا هم اما اگر هر یک می نمی ها های شود شده کنید کنیم کند "
+    "باشد بود بر چه نیز خود ما شما او آنها ای ام اید اند همه دیگر".translate(_NORMALIZE).split()
+)
+
+
+def normalize_text(text: str) -> str:
+    """One spelling per Persian word: Persian letters, ASCII digits, no diacritics or ZWNJ, lower case"""
+    return text.translate(_NORMALIZE).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Words of a text that say something about its topic"""
+    return [token for token in _TOKEN.findall(normalize_text(text)) if token not in STOPWORDS]
+
+
+class SimilarityIndex:
+    """The k most similar items of each item of a section, by cosine of TF-IDF vectors.
+
+    Vectors are kept sparse, as per-term postings of (item, weight). A build computes every
+    item's neighbors at once, as row blocks of the sparse product of the item x term
+    matrix with its transpose; the postings already are that matrix in CSC form. Every
+    term is kept, so a build ranks exactly as the postings walk of append() does.
+    Neighbors are stored in flat arrays of k slots per item, so a lookup is a slice.
+    append() adds an item with the document frequencies of the last build and updates
+    only the lists the new item enters.
+    """
+
+    def __init__(self, texts: List[str], k: int):
+        self.k = k
+        self.size = 0
+        self.built_size = 0
+        self.terms: Dict[str, int] = {}
+        self.document_frequency = array("i")
+        self.postings: List[Tuple[array, array]] = []
+        self.neighbors = array("i")
+        self.scores = array("f")
+        self._build([Counter(tokenize(text)) for text in texts])
+
+    def _term(self, term: str) -> int:
+        column = self.terms.get(term)
+        if column is None:
+            column = self.terms[term] = len(self.terms)
+            self.document_frequency.append(0)
+            self.postings.append((array("i"), array("f")))
+        return column
+
+    def _idf(self, column: int) -> float:
+        return math.log((1 + self.built_size) / (1 + self.document_frequency[column])) + 1
+
+    def _vector(self, counts: Counter) -> Dict[int, float]:
+        """Unit-length sublinear TF-IDF weights of an item, by term column"""
+        weights = {self.terms[term]: (1 + math.log(count)) * self._idf(self.terms[term]) for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        return {column: weight / norm for column, weight in weights.items()}
+
+    def _add_postings(self, item: int, vector: Dict[int, float]) -> None:
+        for column, weight in vector.items():
+            items, weights = self.postings[column]
+            items.append(item)
+            weights.append(weight)
+
+    def _build(self, documents: List[Counter]) -> None:
+        for counts in documents:
+            for term in counts:
+                self.document_frequency[self._term(term)] += 1
+        self.size = self.built_size = len(documents)
+        vectors = [self._vector(counts) for counts in documents]
+        for item, vector in enumerate(vectors):
+            self._add_postings(item, vector)
+        self.neighbors = array("i", [-1]) * (self.size * self.k)
+        self.scores = array("f", bytes(4 * self.size * self.k))
+        if self.size > 1 and self.terms:
+            if sparse is not None:
+                self._build_neighbors_sparse()
+            else:
+                logger.warning(
+                    "NumPy or SciPy is missing: comparing the %s items of a section pair by pair, "
+                    "install requirements.txt", self.size
+                )
+                self._build_neighbors_python(vectors)
+        logger.debug("Built similarity index of %s items over %s terms", self.size, len(self.terms))
+
+    def _set_neighbors(self, item: int, ranked: List[Tuple[float, int]]) -> None:
+        start = item * self.k
+        for slot, (score, other) in enumerate(ranked[:self.k]):
+            self.neighbors[start + slot] = other
+            self.scores[start + slot] = score
+
+    def _build_neighbors_sparse(self) -> None:
+        lengths = numpy.fromiter((len(items) for items, _ in self.postings), dtype=numpy.int64, count=len(self.postings))
+        by_term = sparse.csc_matrix(
+            (
+                numpy.concatenate([numpy.frombuffer(weights, dtype=numpy.float32) for _, weights in self.postings]),
+                numpy.concatenate([numpy.frombuffer(items, dtype=numpy.int32) for items, _ in self.postings]),
+                numpy.concatenate(([0], numpy.cumsum(lengths))),
+            ),
+            shape=(self.size, len(self.postings)),
+        )
+        by_item = by_term.tocsr()
+        transposed = by_term.T
+        k = min(self.k, self.size - 1)
+        rows_per_block = max(1, BLOCK_CELLS // self.size)
+        for start in range(0, self.size, rows_per_block):
+            block = (by_item[start:start + rows_per_block] @ transposed).toarray()
+            rows = numpy.arange(block.shape[0])
+            block[rows, rows + start] = -1.0
+            best = numpy.argpartition(-block, k - 1, axis=1)[:, :k]
+            best_scores = numpy.take_along_axis(block, best, axis=1)
+            order = numpy.argsort(-best_scores, axis=1)
+            best = numpy.take_along_axis(best, order, axis=1)
+            best_scores = numpy.take_along_axis(best_scores, order, axis=1)
+            for row in range(block.shape[0]):
+                ranked = [(float(score), int(other)) for score, other in zip(best_scores[row], best[row]) if score > 0]
+                self._set_neighbors(start + row, ranked)
+
+    def _similarities(self, item: int, vector: Dict[int, float]) -> Dict[int, float]:
+        """Dot products of a vector with every other indexed item it shares a term with"""
+        totals: Dict[int, float] = {}
+        for column, weight in vector.items():
+            items, weights = self.postings[column]
+            for other, other_weight in zip(items, weights):
+                if other != item:
+                    totals[other] = totals.get(other, 0.0) + weight * other_weight
+        return totals
+
+    def _build_neighbors_python(self, vectors: List[Dict[int, float]]) -> None:
+        """Reference build for checking the sparse one; its cost grows with the item pairs sharing a term"""
+        for item, vector in enumerate(vectors):
+            totals = self._similarities(item, vector)
+            self._set_neighbors(item, heapq.nlargest(self.k, ((score, other) for other, score in totals.items())))
+
+    def append(self, text: str) -> None:
+        """Index one more item, at the next index"""
+        item = self.size
+        counts = Counter(tokenize(text))
+        for term in counts:
+            self._term(term)
+        vector = self._vector(counts)
+        totals = self._similarities(item, vector)
+        self._add_postings(item, vector)
+        self.size += 1
+        self.neighbors.extend([-1] * self.k)
+        self.scores.extend([0.0] * self.k)
+        self._set_neighbors(item, heapq.nlargest(self.k, ((score, other) for other, score in totals.items())))
+        # The new item enters the lists of the items it is closer to than their last neighbor
+        for other, score in totals.items():
+            start = other * self.k
+            last = start + self.k - 1
+            if self.neighbors[last] != -1 and score <= self.scores[last]:
+                continue
+            slot = start
+            while slot < last and self.neighbors[slot] != -1 and self.scores[slot] >= score:
+                slot += 1
+            self.neighbors[slot + 1:last + 1] = self.neighbors[slot:last]
+            self.scores[slot + 1:last + 1] = self.scores[slot:last]
+            self.neighbors[slot] = item
+            self.scores[slot] = score
+
+    @property
+    def stale(self) -> bool:
+        """Whether enough items were appended that a full build would weigh terms noticeably differently"""
+        return self.size - self.built_size > MAX_APPENDED_SHARE * max(self.built_size, 1)
+
+    def similar(self, item: int) -> List[int]:
+        """Indexes of the items most similar to `item`, most similar first"""
+        if not 0 <= item < self.size:
+            return []
+        start = item * self.k
+        return [other for other in self.neighbors[start:start + self.k] if other != -1]
+
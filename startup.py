@@ -0,0 +1,52 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Breakdown of the time from startup to the first handled update.
+
+    The clock starts when this module is imported. bot.py imports it before anything
+    else (it only needs the standard library), so the "imports" phase covers loading
+    telegram, aiohttp and the bot's own modules.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self._last = self.started
+        self.first_update: Optional[float] = None
+
+    def mark(self, phase: str) -> None:
+        """End `phase` now; it lasted since the previous mark"""
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    @contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        """Time a block; time since the previous mark is booked as "other" """
+        self.mark("other")
+        try:
+            yield
+        finally:
+            self.mark(phase)
+
+    def first_update_handled(self) -> bool:
+        """Record the first handled update; False if it was already recorded"""
+        if self.first_update is not None:
+            return False
+        self.mark("until_first_update")
+        self.first_update = self._last - self.started
+        logger.info(
+            "First update handled %.3fs after start (%s)",
+            self.first_update,
+            ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in self.phases.items()),
+        )
+        return True
+
+
+STARTUP = StartupTimer()
@@ -0,0 +1,230 @@
+import threading
+import time
+from collections.abc import MutableMapping
+from multiprocessing.managers import BaseManager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class MemoryStateStore:
+    """Namespaced key-value store kept in this process.
+
+    This is the default store and also the object served to other processes by
+    serve_state_store(), so its methods are safe to call from several threads.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Dict[Any, Any]] = {}
+        # Keys of a namespace in insertion order, so paging slices a list instead of walking the dict
+        self._order: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def _namespace(self, namespace: str) -> Dict[Any, Any]:
+        data = self._data.get(namespace)
+        if data is None:
+            data = self._data.setdefault(namespace, {})
+        return data
+
+    def get(self, namespace: str, key: Any, default: Any = None) -> Any:
+        return self._namespace(namespace).get(key, default)
+
+    def _added(self, namespace: str, key: Any) -> None:
+        """Record a new key in the namespace's key list (called with the lock held)"""
+        order = self._order.get(namespace)
+        if order is not None:
+            order.append(key)
+
+    def set(self, namespace: str, key: Any, value: Any) -> None:
+        with self._lock:
+            data = self._namespace(namespace)
+            if key not in data:
+                self._added(namespace, key)
+            data[key] = value
+
+    def set_default(self, namespace: str, key: Any, value: Any) -> Any:
+        """Store `value` unless the key exists; return the stored value"""
+        with self._lock:
+            data = self._namespace(namespace)
+            if key not in data:
+                self._added(namespace, key)
+            return data.setdefault(key, value)
+
+    def delete(self, namespace: str, key: Any) -> Any:
+        """Remove a key and return its value (None when missing)"""
+        with self._lock:
+            data = self._namespace(namespace)
+            if key not in data:
+                return None
+            # Rebuilt on the next page; deletes are rare next to inserts
+            self._order.pop(namespace, None)
+            return data.pop(key)
+
+    def contains(self, namespace: str, key: Any) -> bool:
+        return key in self._namespace(namespace)
+
+    def incr(self, namespace: str, key: Any, amount: int = 1) -> int:
+        with self._lock:
+            data = self._namespace(namespace)
+            if key not in data:
+                self._added(namespace, key)
+            data[key] = data.get(key, 0) + amount
+            return data[key]
+
+    def count(self, namespace: str) -> int:
+        return len(self._namespace(namespace))
+
+    def _ordered_keys(self, namespace: str) -> List[Any]:
+        """The namespace's key list, built on first use (called with the lock held)"""
+        order = self._order.get(namespace)
+        if order is None:
+            order = self._order[namespace] = list(self._namespace(namespace))
+        return order
+
+    def keys(self, namespace: str, offset: int = 0, limit: Optional[int] = None) -> List[Any]:
+        """Keys in insertion order; a page costs its length, not its offset"""
+        with self._lock:
+            stop = None if limit is None else offset + limit
+            return self._ordered_keys(namespace)[offset:stop]
+
+    def items(self, namespace: str, offset: int = 0, limit: Optional[int] = None) -> List[Tuple[Any, Any]]:
+        with self._lock:
+            stop = None if limit is None else offset + limit
+            data = self._namespace(namespace)
+            return [(key, data[key]) for key in self._ordered_keys(namespace)[offset:stop]]
+
+    def claim(self, namespace: str, key: Any, owner: str, ttl: float) -> bool:
+        """Take or renew a lease on `key` for `ttl` seconds; False while another owner holds it"""
+        with self._lock:
+            data = self._namespace(namespace)
+            holder = data.get(key)
+            now = time.time()
+            if holder is not None and holder[0] != owner and holder[1] > now:
+                return False
+            if holder is None:
+                self._added(namespace, key)
+            data[key] = (owner, now + ttl)
+            return True
+
+    def release(self, namespace: str, key: Any, owner: str) -> None:
+        """Give up a lease taken with claim(), unless it already passed to another owner"""
+        with self._lock:
+            holder = self._namespace(namespace).get(key)
+            if holder is not None and holder[0] == owner:
+                self._order.pop(namespace, None)
+                del self._namespace(namespace)[key]
+
+    def ping(self) -> bool:
+        return True
+
+
+class StoreNamespace(MutableMapping):
+    """Dict-like view of one namespace of a store.
+
+    Values are copies when the store lives in another process, so nested values must be
+    written back after they are changed.
+    """
+
+    def __init__(self, store: Any, namespace: str):
+        self.store = store
+        self.namespace = namespace
+
+    def __getitem__(self, key: Any) -> Any:
+        value = self.store.get(self.namespace, key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        value = self.store.get(self.namespace, key, _MISSING)
+        return default if value is _MISSING else value
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self.store.set(self.namespace, key, value)
+
+    def __delitem__(self, key: Any) -> None:
+        if not self.store.contains(self.namespace, key):
+            raise KeyError(key)
+        self.store.delete(self.namespace, key)
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        if self.store.contains(self.namespace, key):
+            return self.store.delete(self.namespace, key)
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def __contains__(self, key: Any) -> bool:
+        return self.store.contains(self.namespace, key)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.store.keys(self.namespace))
+
+    def __len__(self) -> int:
+        return self.store.count(self.namespace)
+
+
+class _Missing:
+    """Marker for missing keys that survives pickling to and from the store server"""
+
+    def __reduce__(self):
+        return "_MISSING"
+
+
+_MISSING = _Missing()
+
+
+class StateStoreManager(BaseManager):
+    pass
+
+
+def serve_state_store(address: Tuple[str, int], authkey: bytes) -> None:
+    """Serve a MemoryStateStore to other processes until the process is stopped"""
+    store = MemoryStateStore()
+    StateStoreManager.register("get_store", callable=lambda: store)
+    manager = StateStoreManager(address=address, authkey=authkey)
+    server = manager.get_server()
+    server.serve_forever()
+
+
+def connect_state_store(address: Tuple[str, int], authkey: bytes) -> Any:
+    """Connect to a store served by serve_state_store(); returns a proxy with the same methods"""
+    StateStoreManager.register("get_store")
+    manager = StateStoreManager(address=address, authkey=authkey)
+    manager.connect()
+    return manager.get_store()
+
+
+class RemoteStateStore:
+    """A store served by serve_state_store(), connected on first use or by connect().
+
+    Proxy calls block on a round trip to the store process, so code on the event loop
+    should make them through a thread (see UserManager.batch()).
+    """
+
+    def __init__(self, address: Tuple[str, int], authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._proxy: Any = None
+        self._lock = threading.Lock()
+
+    def connect(self) -> None:
+        with self._lock:
+            if self._proxy is None:
+                self._proxy = connect_state_store(self.address, self.authkey)
+
+    def __getattr__(self, name: str) -> Any:
+        if self._proxy is None:
+            self.connect()
+        return getattr(self._proxy, name)
+
+
+def parse_address(url: str) -> Tuple[str, int]:
+    """Turn "host:port" into an address tuple"""
+    host, _, port = url.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def create_state_store(url: Optional[str], authkey: bytes) -> Any:
+    """Shared store when a "host:port" URL is configured, otherwise an in-process store"""
+    if url:
+        return RemoteStateStore(parse_address(url), authkey)
+    return MemoryStateStore()
@@ -0,0 +1,112 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from telegram import Message
+
+logger = logging.getLogger(__name__)
+
+TEXT = "text"
+# Kinds editMessageMedia can turn into one another; a voice note can only be sent
+EDITABLE_MEDIA = ("photo", "video", "document")
+MEDIA_KINDS = EDITABLE_MEDIA + ("voice",)
+
+# Operations, cheapest first
+EDIT_TEXT = "edit_text"
+EDIT_CAPTION = "edit_caption"
+EDIT_MEDIA = "edit_media"
+SEND = "send"
+REPLACE = "replace"  # send a new message, then delete the old one
+
+
+@dataclass(frozen=True)
+class Transition:
+    """How to get from the message on screen to the one to show"""
+    operation: str
+    kind: str
+
+    @property
+    def is_edit(self) -> bool:
+        return self.operation in (EDIT_TEXT, EDIT_CAPTION, EDIT_MEDIA)
+
+
+def message_kind(message: Message) -> str:
+    """Kind of a message as far as editing is concerned: "text" or its media kind"""
+    for kind in MEDIA_KINDS:
+        if getattr(message, kind, None):
+            return kind
+    if message.animation or message.audio:
+        # Not produced by the bot, but editMessageMedia accepts them like a document
+        return "document"
+    return TEXT
+
+
+def media_attachment(message: Message):
+    """The file attached to a message (the largest size of a photo), or None"""
+    if message.photo:
+        return message.photo[-1]
+    for kind in ("video", "document", "voice", "animation", "audio"):
+        attachment = getattr(message, kind, None)
+        if attachment:
+            return attachment
+    return None
+
+
+def media_unique_id(message: Message) -> Optional[str]:
+    """file_unique_id of the media attached to a message, if any"""
+    attachment = media_attachment(message)
+    return attachment.file_unique_id if attachment else None
+
+
+def plan(current_kind: Optional[str], target_kind: str, same_media: bool = False) -> Transition:
+    """Cheapest valid operation to show a `target_kind` message in place of `current_kind`.
+
+    `current_kind` is None when there is no message to edit (a reply to a typed message).
+    Telegram cannot turn a text message into a media message or back, nor edit anything
+    into a voice note, so those cases send the new message and delete the old one.
+    """
+    if current_kind is None:
+        return Transition(SEND, target_kind)
+    if current_kind == TEXT:
+        if target_kind == TEXT:
+            return Transition(EDIT_TEXT, TEXT)
+        return Transition(REPLACE, target_kind)
+    if target_kind in EDITABLE_MEDIA and current_kind in EDITABLE_MEDIA:
+        if same_media and target_kind == current_kind:
+            return Transition(EDIT_CAPTION, target_kind)
+        return Transition(EDIT_MEDIA, target_kind)
+    if same_media and target_kind == current_kind:
+        # A voice note keeps its audio; only the caption changes
+        return Transition(EDIT_CAPTION, target_kind)
+    return Transition(REPLACE, target_kind)
+
+
+class TransitionPlanner:
+    """Plans message transitions and remembers which Telegram file each media path became.
+
+    Telegram reports the file_unique_id of a message's media but not the path or URL it
+    was sent from, so the ID is learned from the message returned after each send. When
+    the next item shows the same file, only its caption is edited.
+    """
+
+    def __init__(self):
+        self._unique_ids: Dict[str, str] = {}
+
+    def learn(self, media_path: Optional[str], message) -> None:
+        """Record the file behind `media_path` from the message it was sent in"""
+        if not media_path or not isinstance(message, Message):
+            return
+        unique_id = media_unique_id(message)
+        if unique_id:
+            self._unique_ids[media_path] = unique_id
+
+    def plan(self, current: Optional[Message], target_kind: str, media_path: Optional[str] = None) -> Transition:
+        """Transition from the `current` message (None: send a new one) to the target"""
+        if current is None:
+            return plan(None, target_kind)
+        unique_id = media_unique_id(current)
+        same_media = unique_id is not None and bool(media_path) and self._unique_ids.get(media_path) == unique_id
+        current_kind = message_kind(current)
+        transition = plan(current_kind, target_kind, same_media)
+        logger.debug("Transition %s -> %s: %s", current_kind, target_kind, transition.operation)
+        return transition
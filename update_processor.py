@@ -0,0 +1,115 @@
+import logging
+from collections import deque
+from contextlib import nullcontext
+from typing import Any, AsyncContextManager, Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates of different users concurrently while keeping each user's updates in order.
+
+    The first update of a user runs in its own slot and then drains any updates of the same
+    user that arrived meanwhile, so a busy user occupies one slot instead of blocking many.
+    At most `max_queued_per_user` updates wait per user; later ones are dropped and counted,
+    so a user flooding the bot cannot grow its queue without bound.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_updates: int,
+        on_first_update: Optional[Callable[[], None]] = None,
+        around_update: Optional[Callable[[Optional[Hashable]], AsyncContextManager[Any]]] = None,
+        max_queued_per_user: int = 20,
+    ):
+        super().__init__(max_concurrent_updates)
+        self._queues: Dict[Hashable, Deque[Awaitable[Any]]] = {}
+        self.active_updates = 0
+        self.processed_updates = 0
+        self.max_queued_per_user = max_queued_per_user
+        self.dropped_updates = 0
+        # Called once, after the first update was handled (startup timing)
+        self.on_first_update = on_first_update
+        # Entered around each update with its ordering key (UserManager.batch)
+        self.around_update = around_update
+
+    @staticmethod
+    def _key(update: object) -> Optional[Hashable]:
+        """Ordering key of an update: the user, else the chat, else None (no ordering)"""
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+
+    @property
+    def queued_updates(self) -> int:
+        """Number of updates waiting behind an earlier update of the same user"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def queue_depth(self, key: Hashable) -> int:
+        """Number of updates waiting for a single user"""
+        queue = self._queues.get(key)
+        return len(queue) if queue is not None else 0
+
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of the processor state"""
+        return {
+            "max_concurrent_updates": self.max_concurrent_updates,
+            "active_updates": self.active_updates,
+            "queued_updates": self.queued_updates,
+            "busy_users": len(self._queues),
+            "processed_updates": self.processed_updates,
+            "dropped_updates": self.dropped_updates,
+        }
+
+    async def _run(self, coroutine: Awaitable[Any], key: Optional[Hashable] = None) -> None:
+        self.active_updates += 1
+        try:
+            async with self.around_update(key) if self.around_update else nullcontext():
+                await coroutine
+        except Exception as e:
+            logger.error("Error while processing queued update: %s", e)
+        finally:
+            self.active_updates -= 1
+            self.processed_updates += 1
+            if self.on_first_update is not None:
+                callback, self.on_first_update = self.on_first_update, None
+                callback()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Run the update now, or queue it behind the running update of the same user"""
+        key = self._key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            if len(queue) >= self.max_queued_per_user:
+                coroutine.close()
+                self.dropped_updates += 1
+                logger.debug("Dropped an update of %s: %s already queued", key, len(queue))
+                return
+            queue.append(coroutine)
+            return
+
+        queue = self._queues[key] = deque()
+        try:
+            await self._run(coroutine, key)
+            while queue:
+                await self._run(queue.popleft(), key)
+        finally:
+            del self._queues[key]
+            for pending in queue:
+                pending.close()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
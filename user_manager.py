@@ -1,85 +1,212 @@
-from typing import Dict, Optional
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
 from datetime import datetime
 
+from config import ADMIN_IDS, STATE_STORE_URL, STATE_STORE_AUTHKEY
+from state_store import MemoryStateStore, create_state_store
+
+# Store namespace holding one record per user
+USERS = "users"
+# Store namespace of totals kept up to date on every change, so reading one never scans USERS
+USER_COUNTERS = "user_counters"
+
+
+class _UpdateBatch:
+    """User records read while one update is handled, and the ones to write back after it"""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.records: Dict[str, Dict] = {}
+        self.changed: Set[str] = set()
+        # Records created during the update; written with set_default() so a concurrent creation wins
+        self.created: Set[str] = set()
+        self.open = True
+
+
+# Batch of the update handled by the current task; tasks it starts share it until it closes
+_batch: ContextVar[Optional[_UpdateBatch]] = ContextVar("user_batch", default=None)
+
+
 class UserManager:
-    def __init__(self):
-        self.users: Dict[str, Dict] = {}
-        
+    def __init__(self, store: Optional[Any] = None):
+        # The store may live in another process: records are read, changed and written back
+        self.store = store if store is not None else MemoryStateStore()
+
+    def _new_user(self) -> Dict:
+        return {
+            "is_vip": False,
+            "subscription_date": None,
+            "usage_counts": {},
+            "current_section": None,
+            "current_index": {},
+            "favorites": set(),
+            "last_activity": datetime.now()
+        }
+
+    def get_user(self, user_id: str) -> Dict:
+        """Get a user's record, creating it with default values if needed"""
+        batch = _batch.get()
+        if batch is not None and batch.open:
+            user = batch.records.get(str(user_id))
+            if user is not None:
+                return user
+            if str(user_id) == batch.user_id:
+                # Prefetched and missing: create it without another round trip
+                user = batch.records[batch.user_id] = self._new_user()
+                batch.created.add(batch.user_id)
+                return user
+        user = self.store.get(USERS, str(user_id))
+        if user is None:
+            user = self.store.set_default(USERS, str(user_id), self._new_user())
+        if batch is not None and batch.open:
+            batch.records[str(user_id)] = user
+        return user
+
+    def _save_user(self, user_id: str, user: Dict) -> None:
+        batch = _batch.get()
+        if batch is not None and batch.open and batch.records.get(str(user_id)) is user:
+            batch.changed.add(str(user_id))
+            return
+        self.store.set(USERS, str(user_id), user)
+
+    def _flush(self, batch: _UpdateBatch) -> None:
+        for user_id in batch.created:
+            # Another worker may have created the record meanwhile; its copy is kept
+            self.store.set_default(USERS, user_id, batch.records[user_id])
+        for user_id in batch.changed - batch.created:
+            self.store.set(USERS, user_id, batch.records[user_id])
+
+    @asynccontextmanager
+    async def batch(self, user_id: Any) -> AsyncIterator[None]:
+        """Around the handling of one update: read the user's record once, in a thread, and
+        write the changed records back once after it.
+
+        With a shared store every accessor call is a blocking round trip, and one click makes
+        several; a local store is a dict, so nothing is batched.
+        """
+        if isinstance(self.store, MemoryStateStore) or user_id is None:
+            yield
+            return
+        batch = _UpdateBatch(str(user_id))
+        token = _batch.set(batch)
+        try:
+            user = await asyncio.to_thread(self.store.get, USERS, str(user_id))
+            if user is not None:
+                batch.records[str(user_id)] = user
+            yield
+        finally:
+            # Writes from tasks that outlive the update go straight to the store
+            batch.open = False
+            _batch.reset(token)
+            if batch.changed or batch.created:
+                await asyncio.to_thread(self._flush, batch)
+
     def init_user(self, user_id: str) -> None:
         """Initialize a new user with default values"""
-        if user_id not in self.users:
-            self.users[user_id] = {
-                "is_vip": False,
-                "subscription_date": None,
-                "usage_counts": {},
-                "current_section": None,
-                "current_index": {},
-                "favorites": set(),
-                "last_activity": datetime.now()
-            }
-    
+        self.get_user(user_id)
+
+    def count_users(self) -> int:
+        """Get the number of registered users"""
+        return self.store.count(USERS)
+
+    def count_vip_users(self) -> int:
+        """Get the number of VIP users, as counted by set_vip()"""
+        return self.store.get(USER_COUNTERS, "vip", 0)
+
+    def is_admin(self, user_id: str) -> bool:
+        """Check if user is an admin"""
+        return str(user_id) in [str(admin_id) for admin_id in ADMIN_IDS]
+
     def is_vip(self, user_id: str) -> bool:
         """Check if user is VIP"""
-        self.init_user(user_id)
-        return self.users[user_id]["is_vip"]
-    
+        return self.get_user(user_id)["is_vip"]
+
     def set_vip(self, user_id: str, status: bool = True) -> None:
         """Set user's VIP status"""
-        self.init_user(user_id)
-        self.users[user_id]["is_vip"] = status
+        user = self.get_user(user_id)
+        was_vip = user["is_vip"]
+        user["is_vip"] = status
         if status:
-            self.users[user_id]["subscription_date"] = datetime.now()
-    
+            user["subscription_date"] = datetime.now()
+        self._save_user(user_id, user)
+        if status != was_vip:
+            self.store.incr(USER_COUNTERS, "vip", 1 if status else -1)
+
     def get_usage_count(self, user_id: str, section: str) -> int:
         """Get usage count for a specific section"""
-        self.init_user(user_id)
-        return self.users[user_id]["usage_counts"].get(section, 0)
-    
-    def increment_usage(self, user_id: str, section: str) -> None:
-        """Increment usage count for a section"""
-        self.init_user(user_id)
-        counts = self.users[user_id]["usage_counts"]
-        counts[section] = counts.get(section, 0) + 1
-    
+        return self.get_user(user_id)["usage_counts"].get(section, 0)
+
     def get_current_index(self, user_id: str, section: str) -> int:
         """Get current index for a section"""
-        self.init_user(user_id)
-        return self.users[user_id]["current_index"].get(section, 0)
-    
+        return self.get_user(user_id)["current_index"].get(section, 0)
+
     def set_current_index(self, user_id: str, section: str, index: int) -> None:
         """Set current index for a section"""
-        self.init_user(user_id)
-        self.users[user_id]["current_index"][section] = index
-    
+        user = self.get_user(user_id)
+        user["current_index"][section] = index
+        self._save_user(user_id, user)
+
     def set_current_section(self, user_id: str, section: str) -> None:
         """Set current section for user"""
-        self.init_user(user_id)
-        self.users[user_id]["current_section"] = section
-    
+        user = self.get_user(user_id)
+        user["current_section"] = section
+        self._save_user(user_id, user)
+
     def get_current_section(self, user_id: str) -> Optional[str]:
         """Get current section for user"""
-        self.init_user(user_id)
-        return self.users[user_id]["current_section"]
-    
-    def add_to_favorites(self, user_id: str, content_id: str) -> None:
-        """Add content to user's favorites"""
-        self.init_user(user_id)
-        self.users[user_id]["favorites"].add(content_id)
-    
+        return self.get_user(user_id)["current_section"]
+
+    def get_go_to_section(self, user_id: str) -> Optional[str]:
+        """Get the section whose item number the user was asked to type, if any"""
+        return self.get_user(user_id).get("go_to_section")
+
+    def set_go_to_section(self, user_id: str, section: Optional[str]) -> None:
+        """Set the section whose item number the user was asked to type; None cancels the prompt"""
+        user = self.get_user(user_id)
+        if user.get("go_to_section") != section:
+            user["go_to_section"] = section
+            self._save_user(user_id, user)
+
+    def get_idea_walk(self, user_id: str) -> Optional[Dict]:
+        """Get the user's position in the complete idea order (seed, position, section sizes)"""
+        return self.get_user(user_id).get("idea_walk")
+
+    def set_idea_walk(self, user_id: str, walk: Dict) -> None:
+        """Set the user's position in the complete idea order"""
+        user = self.get_user(user_id)
+        user["idea_walk"] = walk
+        self._save_user(user_id, user)
+
+    def add_to_favorites(self, user_id: str, content_id: str) -> bool:
+        """Add content to user's favorites; returns False if it was already there"""
+        user = self.get_user(user_id)
+        if content_id in user["favorites"]:
+            return False
+        user["favorites"].add(content_id)
+        self._save_user(user_id, user)
+        return True
+
     def remove_from_favorites(self, user_id: str, content_id: str) -> None:
         """Remove content from user's favorites"""
-        self.init_user(user_id)
-        self.users[user_id]["favorites"].discard(content_id)
-    
+        user = self.get_user(user_id)
+        user["favorites"].discard(content_id)
+        self._save_user(user_id, user)
+
     def get_favorites(self, user_id: str) -> set:
         """Get user's favorites"""
-        self.init_user(user_id)
-        return self.users[user_id]["favorites"]
-    
+        return self.get_user(user_id)["favorites"]
+
+    def get_user_ids_batch(self, offset: int, limit: int) -> List[str]:
+        """Get up to `limit` user IDs starting at `offset` in registration order"""
+        return self.store.keys(USERS, offset, limit)
+
     def update_last_activity(self, user_id: str) -> None:
         """Update user's last activity timestamp"""
-        self.init_user(user_id)
-        self.users[user_id]["last_activity"] = datetime.now()
+        user = self.get_user(user_id)
+        user["last_activity"] = datetime.now()
+        self._save_user(user_id, user)
 
     def activate_vip(self, user_id: str, activation_code: str) -> bool:
         """Activate VIP status using activation code"""
@@ -95,29 +222,29 @@ class UserManager:
         # Admins always have access
         if self.is_admin(user_id):
             return True
-            
+
         user = self.get_user(user_id)
-        
+
         # Free sections that don't require VIP
         free_sections = ["text_template", "image_template"]
         if section in free_sections:
             return True
-        
+
         # VIP users have access to all sections
-        if user["vip"]:
+        if user["is_vip"]:
             return True
-        
+
         # All users have unlimited access to all sections
         return True
-    
+
     def increment_usage(self, user_id: int, section: str) -> None:
         """Increment usage count for a section"""
         # Don't increment usage for admins
         if self.is_admin(user_id):
             return
-            
+
         # Don't increment usage for anyone - unlimited access
         return
 
 # Global instance
-user_manager = UserManager() 
\ No newline at end of file
+user_manager = UserManager(create_state_store(STATE_STORE_URL, STATE_STORE_AUTHKEY))
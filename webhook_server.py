@@ -0,0 +1,136 @@
+import hmac
+import json
+import logging
+import secrets
+import ssl
+from typing import Any, Optional
+
+from aiohttp import web
+from telegram import Bot, Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """aiohttp server that receives Telegram updates and feeds them to an Application"""
+
+    def __init__(
+        self,
+        application: Application,
+        path: str = "/telegram",
+        listen: str = "0.0.0.0",
+        port: int = 8443,
+        secret_token: Optional[str] = None,
+        cert_file: Optional[str] = None,
+        key_file: Optional[str] = None,
+        health: Optional[Any] = None,
+    ):
+        self.application = application
+        self.path = path if path.startswith("/") else f"/{path}"
+        self.listen = listen
+        self.port = port
+        # Telegram accepts A-Z, a-z, 0-9, _ and - which token_urlsafe produces
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self.cert_file = cert_file
+        self.key_file = key_file
+        # Optional health.HealthCheck adding /healthz and /readyz
+        self.health = health
+        self.received_updates = 0
+        self.rejected_updates = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def build_app(self) -> web.Application:
+        """Create the aiohttp application with the update and health routes"""
+        app = web.Application(client_max_size=1024 * 1024)
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get("/health", self.handle_health)
+        if self.health:
+            self.health.add_routes(app)
+        return app
+
+    def _ssl_context(self) -> Optional[ssl.SSLContext]:
+        """TLS context when the certificate is served directly instead of behind a proxy"""
+        if not (self.cert_file and self.key_file):
+            return None
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(self.cert_file, self.key_file)
+        return context
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Validate the secret token and enqueue the update"""
+        received_token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(received_token.encode(), self.secret_token.encode()):
+            self.rejected_updates += 1
+            logger.warning("Rejected webhook request with invalid secret token from %s", request.remote)
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except (json.JSONDecodeError, ValueError, TypeError) as e:
+            logger.error("Invalid update payload received: %s", e)
+            return web.Response(status=400)
+
+        if update is None:
+            return web.Response(status=400)
+
+        self.received_updates += 1
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """Liveness route for load balancers"""
+        body = {
+            "status": "ok" if self.application.running else "starting",
+            "pending_updates": self.application.update_queue.qsize(),
+            "received_updates": self.received_updates,
+            "rejected_updates": self.rejected_updates,
+        }
+        processor = self.application.update_processor
+        if hasattr(processor, "stats"):
+            body["processor"] = processor.stats()
+        rate_limiter = self.application.bot.rate_limiter
+        if hasattr(rate_limiter, "stats"):
+            body["rate_limiter"] = rate_limiter.stats()
+        return web.json_response(body)
+
+    async def start(self) -> None:
+        """Start listening for webhook requests"""
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port, ssl_context=self._ssl_context())
+        await site.start()
+        if self.port == 0:
+            self.port = site._server.sockets[0].getsockname()[1]
+        logger.info("Webhook server listening on %s:%s%s", self.listen, self.port, self.path)
+
+    async def stop(self) -> None:
+        """Stop the HTTP server"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def register_webhook(
+    bot: Bot,
+    public_url: str,
+    path: str,
+    secret_token: str,
+    cert_file: Optional[str] = None,
+) -> None:
+    """Point Telegram at `public_url` + `path`; upload `cert_file` for self-signed certificates"""
+    certificate = open(cert_file, "rb") if cert_file else None
+    try:
+        await bot.set_webhook(
+            url=f"{public_url.rstrip('/')}{path}",
+            certificate=certificate,
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    finally:
+        if certificate:
+            certificate.close()
+    logger.info("Webhook registered")